@@ -1,71 +1,197 @@
-from groq_client import call_groq
+from groq_client import cached_call_groq, async_cached_call_groq, async_cached_call_groq_many, route_model, clean_field
+from plan_cache import plan_key, lookup_plan, store_plan
 import json
+import re
+
+# Static instructions come first and are byte-identical across calls so provider-side
+# prefix caching can reuse them; request-specific values are appended under "## INPUT".
+_PROFILE_RUBRIC_PREFIX = """For the film character described under INPUT (their role, the film's genre and theme):
+
+Suggest 3 distinct options for each of the following, formatted clearly with Markdown lists:
+1.  **Potential Backstories:** Brief descriptions of shaping experiences.
+2.  **Core Motivations:** What drives their primary actions?
+3.  **Significant Flaws:** Key weaknesses or internal struggles."""
+
+_ARC_RUBRIC_PREFIX = """Outline a potential character arc for the character described under INPUT, within the narrative framework given there. Describe the following key stages concisely under Markdown headings:
+- **Beginning State (Setup):** Initial presentation embodying flaw/motivation.
+- **Inciting Incident Reaction:** How the plot's trigger affects them.
+- **Rising Action / Confrontation:** Key challenges related to their flaw/goal.
+- **Midpoint Shift:** A significant realization or turning point.
+- **Climax / Final Confrontation:** Facing the core conflict, demonstrating change (or lack thereof).
+- **Ending State (Resolution):** Their final emotional/psychological state."""
+
+_ARC_ADAPT_PREFIX = """Adapt the character arc template given under INPUT to the character described there.
+Keep the template's stage headings and structure exactly; rewrite every stage's content so it fits this character's role, motivation, flaw and backstory."""
+
+_PROFILE_PROMPT = _PROFILE_RUBRIC_PREFIX + """
+
+## INPUT
+Role: {role}
+Genre: {genre}
+Theme: {theme}"""
+
+_ARC_INPUT = """
+
+## INPUT
+- Narrative Framework: {narrative_framework}
+- Role: {role}
+- Core Motivation: {motivation}
+- Significant Flaw: {flaw}
+- Backstory Summary: {backstory}"""
+
+_ARC_PROMPT = _ARC_RUBRIC_PREFIX + _ARC_INPUT
+
+_ARC_ADAPT_PROMPT = _ARC_ADAPT_PREFIX + _ARC_INPUT + """
+
+Arc Template:
+---
+{template}
+---"""
+
+# A usable arc template has both end stages under the expected headings
+_ARC_TEMPLATE_RE = re.compile(r"Beginning State.*Ending State", re.DOTALL)
+
+_RELATIONSHIPS_RUBRIC_PREFIX = """Suggest potential relationship dynamics between the primary character described under INPUT and characters playing each of the other roles listed there.
+
+For each potential relationship pair (e.g., Protagonist <-> Mentor):
+1.  **Dynamic Type:** (e.g., Mentor-Mentee, Rivals, Allies, Foil, Family, Romantic) - Suggest 1-2 options.
+2.  **Potential Conflict Source:** Based on likely goals or personalities derived from their roles.
+3.  **Potential Synergy/Support Source:** How they might help each other.
+
+Format clearly using Markdown lists for each pair."""
+
+_RELATIONSHIPS_PROMPT = _RELATIONSHIPS_RUBRIC_PREFIX + """
+
+## INPUT
+- Primary Character Role: {role}
+- Motivation: {motivation}
+- Flaw: {flaw}
+- Other Character Roles: {other_roles}"""
 
 class CharacterCrafterAgent:
     def __init__(self):
         self.system_prompt = "You are an AI assistant specialized in character development for films. Focus on depth, motivation, flaws, and arcs. Respond in Markdown."
 
-    def suggest_profile_elements(self, role: str, genre: str, theme: str) -> str:
+    def suggest_profile_elements(self, role: str, genre: str, theme: str, bypass_cache: bool = False) -> str:
         """Suggests backstories, motivations, flaws for a character."""
+        role, genre, theme = clean_field(role), clean_field(genre), clean_field(theme)
         if not role: return "Error: Character role must be provided."
         if not genre: genre = "Unknown Genre"
         if not theme: theme = "General Theme"
 
-        prompt = f"""
-        For a character in a '{genre}' film exploring the theme of '{theme}', who plays the role of the '{role}':
+        return cached_call_groq(self._profile_prompt(role, genre, theme), self.system_prompt, model=route_model("creative"), bypass_cache=bypass_cache)
 
-        Suggest 3 distinct options for each of the following, formatted clearly with Markdown lists:
-        1.  **Potential Backstories:** Brief descriptions of shaping experiences.
-        2.  **Core Motivations:** What drives their primary actions?
-        3.  **Significant Flaws:** Key weaknesses or internal struggles.
-        """
-        return call_groq(prompt, self.system_prompt)
+    def _profile_prompt(self, role: str, genre: str, theme: str) -> str:
+        return _PROFILE_PROMPT.format_map({"role": role, "genre": genre, "theme": theme})
 
-    def map_character_arc(self, character_profile: dict, narrative_framework: str = "Three-Act Structure") -> str:
+    def map_character_arc(self, character_profile: dict, narrative_framework: str = "Three-Act Structure", project_name: str = "", bypass_cache: bool = False) -> str:
         """Outlines a potential character arc based on profile and story structure."""
-        role = character_profile.get('role', 'character')
         motivation = character_profile.get('motivation', '')
         flaw = character_profile.get('flaw', '')
-        backstory = character_profile.get('backstory', '')
 
         if not motivation or not flaw:
             return "Error: Character motivation and flaw are needed to map a meaningful arc."
 
-        prompt = f"""
-        Consider a character:
-        - Role: {role}
-        - Core Motivation: {motivation}
-        - Significant Flaw: {flaw}
-        - Backstory Summary: {backstory}
-
-        Outline a potential character arc for them within a standard '{narrative_framework}'. Describe the following key stages concisely under Markdown headings:
-        - **Beginning State (Setup):** Initial presentation embodying flaw/motivation.
-        - **Inciting Incident Reaction:** How the plot's trigger affects them.
-        - **Rising Action / Confrontation:** Key challenges related to their flaw/goal.
-        - **Midpoint Shift:** A significant realization or turning point.
-        - **Climax / Final Confrontation:** Facing the core conflict, demonstrating change (or lack thereof).
-        - **Ending State (Resolution):** Their final emotional/psychological state.
-        """
-        return call_groq(prompt, self.system_prompt)
-
-    def suggest_relationships(self, primary_char_profile: dict, other_char_roles: list) -> str:
+        # Adapt an arc generated earlier in this project and framework instead of planning from scratch,
+        # unless this is a regeneration, which plans fresh and replaces the stored template
+        key, adapt_prompt = self._arc_adapt_prompt(character_profile, narrative_framework, project_name)
+        if adapt_prompt and not bypass_cache:
+            result = cached_call_groq(adapt_prompt, self.system_prompt, model=route_model("edit"))
+            if not result.startswith("Error:"):
+                return result
+
+        result = cached_call_groq(self._arc_prompt(character_profile, narrative_framework), self.system_prompt, model=route_model("edit"), bypass_cache=bypass_cache)
+        if not result.startswith("Error:") and _ARC_TEMPLATE_RE.search(result):
+            store_plan(key, result)
+        return result
+
+    async def a_map_character_arc(self, character_profile: dict, narrative_framework: str = "Three-Act Structure", project_name: str = "", bypass_cache: bool = False) -> str:
+        """Async map_character_arc, so several characters' arcs can be generated together."""
+        if not character_profile.get('motivation', '') or not character_profile.get('flaw', ''):
+            return "Error: Character motivation and flaw are needed to map a meaningful arc."
+
+        key, adapt_prompt = self._arc_adapt_prompt(character_profile, narrative_framework, project_name)
+        if adapt_prompt and not bypass_cache:
+            result = await async_cached_call_groq(adapt_prompt, self.system_prompt, model=route_model("edit"))
+            if not result.startswith("Error:"):
+                return result
+
+        result = await async_cached_call_groq(self._arc_prompt(character_profile, narrative_framework), self.system_prompt, model=route_model("edit"), bypass_cache=bypass_cache)
+        if not result.startswith("Error:") and _ARC_TEMPLATE_RE.search(result):
+            store_plan(key, result)
+        return result
+
+    def _arc_adapt_prompt(self, character_profile: dict, narrative_framework: str, project_name: str) -> tuple:
+        """Returns (plan cache key, adapt prompt or None when no template is stored yet)."""
+        key = plan_key(project_name, narrative_framework)
+        template = lookup_plan(key)
+        if not template:
+            return key, None
+        return key, _ARC_ADAPT_PROMPT.format_map({**self._arc_fields(character_profile, narrative_framework), "template": template})
+
+    def _arc_fields(self, character_profile: dict, narrative_framework: str) -> dict:
+        return {
+            "narrative_framework": narrative_framework,
+            "role": clean_field(character_profile.get('role', 'character')),
+            "motivation": character_profile.get('motivation', ''),
+            "flaw": character_profile.get('flaw', ''),
+            "backstory": character_profile.get('backstory', ''),
+        }
+
+    def _arc_prompt(self, character_profile: dict, narrative_framework: str) -> str:
+        return _ARC_PROMPT.format_map(self._arc_fields(character_profile, narrative_framework))
+
+    def _relationship_prompt(self, primary_char_profile: dict, other_char_roles: list) -> str:
+        return _RELATIONSHIPS_PROMPT.format_map({
+            "role": clean_field(primary_char_profile.get('role', 'This character')),
+            "motivation": primary_char_profile.get('motivation', 'N/A'),
+            "flaw": primary_char_profile.get('flaw', 'N/A'),
+            "other_roles": ', '.join(clean_field(other_role) for other_role in other_char_roles),
+        })
+
+    def suggest_relationships(self, primary_char_profile: dict, other_char_roles: list, bypass_cache: bool = False) -> str:
         """Suggests potential relationship dynamics."""
-        role = primary_char_profile.get('role', 'This character')
-        profile_summary = f"Role: {role}, Motivation: {primary_char_profile.get('motivation', 'N/A')}, Flaw: {primary_char_profile.get('flaw', 'N/A')}"
+        if not other_char_roles:
+            return "No other characters defined to suggest relationships with."
+
+        return cached_call_groq(self._relationship_prompt(primary_char_profile, other_char_roles), self.system_prompt, model=route_model("creative"), bypass_cache=bypass_cache)
 
+    async def a_suggest_relationships(self, primary_char_profile: dict, other_char_roles: list, bypass_cache: bool = False) -> str:
+        """Suggests relationship dynamics with one concurrent Groq call per character pair."""
         if not other_char_roles:
             return "No other characters defined to suggest relationships with."
 
-        prompt = f"""
-        Consider the primary character: {profile_summary}
+        role = primary_char_profile.get('role', 'This character')
+        results = await async_cached_call_groq_many(
+            [self._relationship_prompt(primary_char_profile, [other_role]) for other_role in other_char_roles],
+            self.system_prompt, model=route_model("creative"), bypass_cache=bypass_cache)
+
+        for result in results:
+            if result.startswith("Error:"):
+                return result
+        return "\n\n".join(f"### {role} <-> {other_role}\n{result}" for other_role, result in zip(other_char_roles, results))
+
+    def build_character_bundle(self, role: str, genre: str, theme: str, profile: dict, other_roles: list, framework: str = "Three-Act Structure", bypass_cache: bool = False) -> dict:
+        """Generates profile elements, arc, and relationships for one character in a single Groq call."""
+        role, genre, theme = clean_field(role), clean_field(genre), clean_field(theme)
+        if not role: return {"error": "Error: Character role must be provided."}
+        character_profile = {**profile, "role": role}
+
+        # Only ask for the sections we have enough input for
+        sections = [("profile_suggestions", "PROFILE ELEMENTS", self._profile_prompt(role, genre or "Unknown Genre", theme or "General Theme"))]
+        if profile.get('motivation') and profile.get('flaw'):
+            sections.append(("arc_description", "ARC", self._arc_prompt(character_profile, framework)))
+        if other_roles:
+            sections.append(("relationship_suggestions", "RELATIONSHIPS", self._relationship_prompt(character_profile, other_roles)))
 
-        Suggest potential relationship dynamics between this character and characters playing these roles: {', '.join(other_char_roles)}.
+        prompt = "\n".join(f"## SECTION {i} — {title}\n{section_prompt}" for i, (_, title, section_prompt) in enumerate(sections, start=1))
+        prompt += "\nAnswer every section in order. Return each section separated by exactly `---SEP---` on its own line, with no other use of that marker."
 
-        For each potential relationship pair (e.g., {role} <-> {other_char_roles[0]}):
-        1.  **Dynamic Type:** (e.g., Mentor-Mentee, Rivals, Allies, Foil, Family, Romantic) - Suggest 1-2 options.
-        2.  **Potential Conflict Source:** Based on likely goals or personalities derived from their roles.
-        3.  **Potential Synergy/Support Source:** How they might help each other.
+        response = cached_call_groq(prompt, self.system_prompt, model=route_model("creative"), bypass_cache=bypass_cache)
+        if response.startswith("Error:"):
+            return {"error": response}
 
-        Format clearly using Markdown lists for each pair.
-        """
-        return call_groq(prompt, self.system_prompt)
\ No newline at end of file
+        parts = [part.strip() for part in response.split("---SEP---")]
+        if len(parts) != len(sections):
+            return {"error": f"Error: Expected {len(sections)} sections in the combined response, got {len(parts)}."}
+        return {key: part for (key, _, _), part in zip(sections, parts)}
\ No newline at end of file
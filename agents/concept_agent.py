@@ -1,43 +1,74 @@
-from groq_client import call_groq
+from groq_client import cached_call_groq, async_cached_call_groq, stream_groq, route_model, clean_field
+
+# Static instructions come first and are byte-identical across calls so provider-side
+# prefix caching can reuse them; request-specific values are appended under "## INPUT".
+_CONCEPTS_RUBRIC_PREFIX = """Analyze the film seed idea given under INPUT.
+
+Generate the following, clearly separated by Markdown headings (e.g., ### Loglines):
+1.  **Loglines:** Create 3 distinct loglines.
+2.  **Narrative Frameworks:** Suggest 2-3 common structures (e.g., Three-Act, Hero's Journey) and briefly explain their potential application.
+3.  **Potential Themes:** Propose 3 core themes.
+4.  **Central Conflicts:** Suggest 3 potential central conflicts.
+5.  **Clarifying Question:** Pose one question to the user to guide further development (e.g., about tone, protagonist type, or core message)."""
+
+_SYNOPSIS_RUBRIC_PREFIX = """Based on the chosen film concept elements given under INPUT:
+
+Write a compelling one-paragraph synopsis (around 100-150 words) that weaves these elements together into a coherent story concept.
+Also, suggest 2 potential plot twists relevant to these elements, listed under a "### Potential Twists" heading."""
+
+_CONCEPTS_PROMPT = _CONCEPTS_RUBRIC_PREFIX + """
+
+## INPUT
+Seed Idea: '{seed_idea}'"""
+
+_SYNOPSIS_PROMPT = _SYNOPSIS_RUBRIC_PREFIX + """
+
+## INPUT
+- Logline Idea: {logline}
+- Narrative Framework: {framework}
+- Core Theme: {theme}
+- Central Conflict: {conflict}"""
 
 class ConceptAgent:
     def __init__(self):
         self.system_prompt = "You are an AI assistant specialized in film concept development. Be creative, structured, and offer clear options in Markdown format."
 
-    def generate_initial_concepts(self, seed_idea: str) -> str:
+    def generate_initial_concepts(self, seed_idea: str, bypass_cache: bool = False) -> str:
         """Generates loglines, frameworks, themes, conflicts from a seed idea."""
+        seed_idea = clean_field(seed_idea)
         if not seed_idea:
             return "Error: Seed idea cannot be empty."
-        prompt = f"""
-        Analyze this film seed idea: '{seed_idea}'
-
-        Generate the following, clearly separated by Markdown headings (e.g., ### Loglines):
-        1.  **Loglines:** Create 3 distinct loglines.
-        2.  **Narrative Frameworks:** Suggest 2-3 common structures (e.g., Three-Act, Hero's Journey) and briefly explain their potential application.
-        3.  **Potential Themes:** Propose 3 core themes.
-        4.  **Central Conflicts:** Suggest 3 potential central conflicts.
-        5.  **Clarifying Question:** Pose one question to the user to guide further development (e.g., about tone, protagonist type, or core message).
-        """
-        return call_groq(prompt, self.system_prompt)
-
-    def generate_synopsis(self, concept_details: dict) -> str:
+        prompt = _CONCEPTS_PROMPT.format_map({"seed_idea": seed_idea})
+        return cached_call_groq(prompt, self.system_prompt, model=route_model("creative"), bypass_cache=bypass_cache)
+
+    def generate_synopsis(self, concept_details: dict, bypass_cache: bool = False) -> str:
         """Generates a synopsis based on selected concept elements."""
-        logline = concept_details.get('logline', 'Not specified')
-        framework = concept_details.get('framework', 'Not specified')
-        theme = concept_details.get('theme', 'Not specified')
-        conflict = concept_details.get('conflict', 'Not specified')
+        prompt = self._synopsis_prompt(concept_details)
+        if prompt.startswith("Error:"):
+            return prompt
+        return cached_call_groq(prompt, self.system_prompt, model=route_model("creative"), bypass_cache=bypass_cache)
+
+    async def a_generate_synopsis(self, concept_details: dict, bypass_cache: bool = False) -> str:
+        """Async generate_synopsis."""
+        prompt = self._synopsis_prompt(concept_details)
+        if prompt.startswith("Error:"):
+            return prompt
+        return await async_cached_call_groq(prompt, self.system_prompt, model=route_model("creative"), bypass_cache=bypass_cache)
+
+    def stream_synopsis(self, concept_details: dict, bypass_cache: bool = False):
+        """Same as generate_synopsis, but returns a generator of text chunks as they are generated."""
+        prompt = self._synopsis_prompt(concept_details)
+        if prompt.startswith("Error:"):
+            return iter([prompt])
+        return stream_groq(prompt, self.system_prompt, model=route_model("creative"), bypass_cache=bypass_cache)
+
+    def _synopsis_prompt(self, concept_details: dict) -> str:
+        logline = clean_field(concept_details.get('logline', 'Not specified'))
+        framework = clean_field(concept_details.get('framework', 'Not specified'))
+        theme = clean_field(concept_details.get('theme', 'Not specified'))
+        conflict = clean_field(concept_details.get('conflict', 'Not specified'))
 
         if logline == 'Not specified' and theme == 'Not specified':
              return "Error: Please provide at least a chosen logline or theme to generate a synopsis."
 
-        prompt = f"""
-        Based on these chosen film concept elements:
-        - Logline Idea: {logline}
-        - Narrative Framework: {framework}
-        - Core Theme: {theme}
-        - Central Conflict: {conflict}
-
-        Write a compelling one-paragraph synopsis (around 100-150 words) that weaves these elements together into a coherent story concept.
-        Also, suggest 2 potential plot twists relevant to these elements, listed under a "### Potential Twists" heading.
-        """
-        return call_groq(prompt, self.system_prompt)
\ No newline at end of file
+        return _SYNOPSIS_PROMPT.format_map({"logline": logline, "framework": framework, "theme": theme, "conflict": conflict})
\ No newline at end of file
@@ -1,4 +1,134 @@
-from groq_client import call_groq
+from groq_client import cached_call_groq, async_cached_call_groq, async_cached_call_groq_many, stream_groq, route_model, submit_batch
+import re
+import config
+
+# Static instructions come first and are byte-identical across calls so provider-side
+# prefix caching can reuse them; request-specific values are appended under "## INPUT".
+_OUTLINE_RUBRIC_PREFIX = """Based on the film synopsis and narrative framework given under INPUT:
+
+Generate a scene-by-scene outline. For each scene, provide:
+- SCENE HEADING (INT./EXT. LOCATION - DAY/NIGHT)
+- BRIEF DESCRIPTION (1-2 sentences: core action, character goal, plot point).
+
+Number scenes sequentially. Ensure logical progression. Use standard screenplay formatting for headings.
+Example:
+1. INT. COFFEE SHOP - DAY
+   JANE waits nervously. MARK arrives late, revealing a plot-triggering secret."""
+
+_DRAFT_SCENE_RUBRIC_PREFIX = """Write the full screenplay scene described under INPUT.
+
+Follow standard screenplay format STRICTLY (HEADINGS, ACTION, CHARACTER, DIALOGUE, (parentheticals)).
+Generate ONLY the scene content."""
+
+_DIALOGUE_TONE_RUBRIC_PREFIX = """Refine the dialogue snippet given under INPUT to have the target tone given there, while keeping the core meaning and character voice consistent.
+
+Provide ONLY the revised dialogue snippet, maintaining the original Character Cue if present."""
+
+_ACTION_CONCISENESS_RUBRIC_PREFIX = """Make the action line(s) given under INPUT more concise and impactful, suitable for a screenplay. Remove unnecessary words while preserving the essential visual information.
+
+Provide ONLY the revised, concise action line(s)."""
+
+_ANALYSIS_RUBRIC_PREFIX = """Analyze the script excerpt given under INPUT for potential issues. Focus ONLY on:
+1.  **Plot Holes/Continuity:** Contradictions or logical gaps *within the excerpt*.
+2.  **Pacing:** Sections that feel rushed, slow, or redundant *based on the text*.
+3.  **Character Consistency/Voice:** Actions or dialogue inconsistent *within the excerpt*.
+4.  **Clarity/Formatting:** Confusing descriptions or non-standard formatting.
+
+List identified potential issues clearly with brief explanations. Do NOT suggest solutions. If no major issues are found, state that."""
+
+_CHUNK_SUMMARY_RUBRIC_PREFIX = """Summarize the screenplay chunk given under INPUT for a script analyst. Tersely keep plot events in order, character actions and stated facts, scene headings, and anything that looks contradictory, rushed or out of character. No commentary."""
+
+_MOODBOARD_RUBRIC_PREFIX = """Based on the film concept given under INPUT, generate textual ideas for a mood board. Suggest:
+1.  **Color Palette:** Describe 3-5 key colors and their emotional association (e.g., "Deep blues for mystery, sickly yellow for decay").
+2.  **Key Textures:** Suggest relevant textures (e.g., "Rough concrete, smooth chrome, decaying lace").
+3.  **Lighting Style:** Describe the overall lighting approach (e.g., "High-contrast noir, soft natural light, harsh neon").
+4.  **Reference Keywords:** List 5-10 keywords for image searching (e.g., "Urban decay, isolated cabin, bioluminescence, vintage tech").
+5.  **Comparable Films/Art (Optional):** Mention 1-2 existing works with a similar visual feel.
+
+Format clearly using Markdown headings."""
+
+_STORYBOARD_RUBRIC_PREFIX = """Analyze the screenplay scene text given under INPUT.
+
+Suggest 3-5 key storyboard shot ideas to visually capture the essence of this scene. For each shot idea, describe:
+1.  **Shot Type:** (e.g., Wide Shot, Medium Close-Up, POV, Insert Shot, Over-the-Shoulder).
+2.  **Subject/Action:** What is the main focus of the frame and what is happening?
+3.  **Purpose/Emotion:** Why is this shot important? What feeling should it evoke?
+
+Example:
+1.  **Shot Type:** Extreme Close-Up
+2.  **Subject/Action:** Character's trembling hand reaching for a key.
+3.  **Purpose/Emotion:** Emphasize nervousness and the importance of the object.
+
+Format clearly using Markdown numbered lists."""
+
+_OUTLINE_PROMPT = _OUTLINE_RUBRIC_PREFIX + """
+
+## INPUT
+Narrative Framework: {framework}
+Synopsis: "{synopsis}\""""
+
+_DRAFT_SCENE_PROMPT = _DRAFT_SCENE_RUBRIC_PREFIX + """
+
+## INPUT
+- Scene Heading: {scene_heading}
+- Scene Description/Goal: {scene_description}
+- Character Context: {character_context}
+- Desired Tone: {tone}"""
+
+_DIALOGUE_TONE_PROMPT = _DIALOGUE_TONE_RUBRIC_PREFIX + """
+
+## INPUT
+Target Tone: '{target_tone}'
+
+Original Dialogue:
+---
+{dialogue}
+---"""
+
+_ACTION_CONCISENESS_PROMPT = _ACTION_CONCISENESS_RUBRIC_PREFIX + """
+
+## INPUT
+Original Action Line(s):
+---
+{action_line}
+---"""
+
+_ANALYSIS_PROMPT = _ANALYSIS_RUBRIC_PREFIX + """
+
+## INPUT
+Script Excerpt:
+---
+{script_excerpt}
+---"""
+
+_CHUNK_SUMMARY_PROMPT = _CHUNK_SUMMARY_RUBRIC_PREFIX + """
+
+## INPUT
+Chunk {index} of {total}:
+---
+{chunk}
+---"""
+
+# Excerpts estimated above this many tokens (~4 chars each) are summarized chunk by chunk first
+ANALYSIS_MAX_TOKENS = 4000
+ANALYSIS_CHUNK_CHARS = 12000
+
+# Numbered outline entries, e.g. "1. INT. COFFEE SHOP - DAY" (optionally bolded), as produced by generate_outline
+_OUTLINE_SCENE_RE = re.compile(r"^\s*\d+\.\s*\**\s*((?:INT|EXT|INT\./EXT|I/E)\.?[^\n*]*)\**\s*$", re.MULTILINE)
+
+_MOODBOARD_PROMPT = _MOODBOARD_RUBRIC_PREFIX + """
+
+## INPUT
+- Genre: {genre}
+- Theme: {theme}
+- Synopsis: {synopsis}"""
+
+_STORYBOARD_PROMPT = _STORYBOARD_RUBRIC_PREFIX + """
+
+## INPUT
+---
+{scene_text}
+---"""
 
 class ScriptSmithAgent:
     def __init__(self):
@@ -8,136 +138,131 @@ class ScriptSmithAgent:
         self.sp_editor = "You are an AI script editor. Revise the provided text precisely according to the user's instruction, maintaining the original format (e.g., dialogue, action line)."
         self.sp_creative = "You are a creative AI assistant helping with film pre-production visualization. Generate evocative ideas based on script content."
 
-    def generate_outline(self, synopsis: str, framework: str = "Three-Act Structure") -> str:
+    def generate_outline(self, synopsis: str, framework: str = "Three-Act Structure", bypass_cache: bool = False) -> str:
         """Generates a scene-by-scene outline."""
         if not synopsis: return "Error: Synopsis cannot be empty."
-        prompt = f"""
-        Based on the following film synopsis and using the '{framework}':
-        Synopsis: "{synopsis}"
-
-        Generate a scene-by-scene outline. For each scene, provide:
-        - SCENE HEADING (INT./EXT. LOCATION - DAY/NIGHT)
-        - BRIEF DESCRIPTION (1-2 sentences: core action, character goal, plot point).
-
-        Number scenes sequentially. Ensure logical progression. Use standard screenplay formatting for headings.
-        Example:
-        1. INT. COFFEE SHOP - DAY
-           JANE waits nervously. MARK arrives late, revealing a plot-triggering secret.
-        """
-        # Use a model potentially better suited for longer structured output if available via Groq
-        return call_groq(prompt, self.sp_writer, model=config.DEFAULT_MODEL) # Adjust model if needed
-
-    def draft_scene(self, scene_heading: str, scene_description: str, character_context: str = "", tone: str = "neutral") -> str:
+        prompt = _OUTLINE_PROMPT.format_map({"framework": framework, "synopsis": synopsis})
+        return cached_call_groq(prompt, self.sp_writer, model=route_model("creative"), bypass_cache=bypass_cache)
+
+    def stream_outline(self, synopsis: str, framework: str = "Three-Act Structure", bypass_cache: bool = False):
+        """Same as generate_outline, but returns a generator of text chunks as they are generated."""
+        if not synopsis: return iter(["Error: Synopsis cannot be empty."])
+        prompt = _OUTLINE_PROMPT.format_map({"framework": framework, "synopsis": synopsis})
+        return stream_groq(prompt, self.sp_writer, model=route_model("creative"), bypass_cache=bypass_cache)
+
+    def draft_scene(self, scene_heading: str, scene_description: str, character_context: str = "", tone: str = "neutral", bypass_cache: bool = False) -> str:
         """Drafts a full scene based on outline/description."""
         if not scene_heading or not scene_description:
              return "Error: Scene heading and description are required."
-        prompt = f"""
-        Write the full screenplay scene:
-        - Scene Heading: {scene_heading}
-        - Scene Description/Goal: {scene_description}
-        - Character Context: {character_context if character_context else 'None provided'}
-        - Desired Tone: {tone if tone else 'neutral'}
-
-        Follow standard screenplay format STRICTLY (HEADINGS, ACTION, CHARACTER, DIALOGUE, (parentheticals)).
-        Generate ONLY the scene content.
-        """
-        return call_groq(prompt, self.sp_writer)
+        prompt = self._draft_scene_prompt(scene_heading, scene_description, character_context, tone)
+        return cached_call_groq(prompt, self.sp_writer, model=route_model("creative"), bypass_cache=bypass_cache)
+
+    def stream_draft_scene(self, scene_heading: str, scene_description: str, character_context: str = "", tone: str = "neutral", bypass_cache: bool = False):
+        """Same as draft_scene, but returns a generator of text chunks as they are generated."""
+        if not scene_heading or not scene_description:
+             return iter(["Error: Scene heading and description are required."])
+        prompt = self._draft_scene_prompt(scene_heading, scene_description, character_context, tone)
+        return stream_groq(prompt, self.sp_writer, model=route_model("creative"), bypass_cache=bypass_cache)
+
+    def _draft_scene_prompt(self, scene_heading: str, scene_description: str, character_context: str, tone: str) -> str:
+        return _DRAFT_SCENE_PROMPT.format_map({
+            "scene_heading": scene_heading,
+            "scene_description": scene_description,
+            "character_context": character_context if character_context else 'None provided',
+            "tone": tone if tone else 'neutral',
+        })
+
+    def parse_outline_scenes(self, outline_md: str) -> list[tuple[str, str]]:
+        """Splits a generated outline into (scene heading, description) pairs."""
+        matches = list(_OUTLINE_SCENE_RE.finditer(outline_md or ""))
+        scenes = []
+        for i, match in enumerate(matches):
+            end = matches[i + 1].start() if i + 1 < len(matches) else len(outline_md)
+            description = " ".join(line.strip(" -*") for line in outline_md[match.end():end].splitlines() if line.strip())
+            scenes.append((match.group(1).strip(), description or "Continue the story."))
+        return scenes
+
+    def submit_scene_drafts_batch(self, scenes: list[tuple[str, str]], character_context: str = "") -> str:
+        """Submits a draft for every (heading, description) scene as one Groq batch job. Returns the job id."""
+        if not scenes: return "Error: No scenes found in the outline."
+        prompts = [(self._draft_scene_prompt(heading, description, character_context, ""), self.sp_writer) for heading, description in scenes]
+        return submit_batch(prompts, model=route_model("creative"))
+
+    async def a_draft_scenes(self, scenes: list[tuple[str, str]], character_context: str = "") -> list[str]:
+        """Drafts every scene concurrently on the real-time API (fallback for a slow or failed batch)."""
+        return await async_cached_call_groq_many(
+            [self._draft_scene_prompt(heading, description, character_context, "") for heading, description in scenes],
+            self.sp_writer, model=route_model("creative"))
 
     def refine_dialogue_tone(self, dialogue: str, target_tone: str) -> str:
         """Refines dialogue towards a specific tone."""
         if not dialogue or not target_tone: return "Error: Dialogue and target tone are required."
-        prompt = f"""
-        Refine the following dialogue snippet to have a '{target_tone}' tone, while keeping the core meaning and character voice consistent.
-
-        Original Dialogue:
-        ---
-        {dialogue}
-        ---
-
-        Provide ONLY the revised dialogue snippet, maintaining the original Character Cue if present.
-        """
-        return call_groq(prompt, self.sp_editor)
+        prompt = _DIALOGUE_TONE_PROMPT.format_map({"target_tone": target_tone, "dialogue": dialogue})
+        return cached_call_groq(prompt, self.sp_editor, model=route_model("edit"))
 
     def refine_action_conciseness(self, action_line: str) -> str:
         """Makes action lines more concise."""
         if not action_line: return "Error: Action line cannot be empty."
-        prompt = f"""
-        Make the following action line(s) more concise and impactful, suitable for a screenplay. Remove unnecessary words while preserving the essential visual information.
-
-        Original Action Line(s):
-        ---
-        {action_line}
-        ---
-
-        Provide ONLY the revised, concise action line(s).
-        """
-        return call_groq(prompt, self.sp_editor)
+        prompt = _ACTION_CONCISENESS_PROMPT.format_map({"action_line": action_line})
+        return cached_call_groq(prompt, self.sp_editor, model=route_model("edit"))
 
 
-    def analyze_script_issues(self, script_excerpt: str) -> str:
-        """Analyzes a script excerpt for plot holes or pacing issues."""
+    async def a_analyze_script_issues(self, script_excerpt: str, bypass_cache: bool = False) -> str:
+        """Analyzes a script excerpt for plot holes or pacing issues; long excerpts are map-reduced (chunk summaries, then one analysis)."""
         if not script_excerpt or len(script_excerpt) < 50:
              return "Error: Please provide a substantial script excerpt (at least 50 characters) for analysis."
-        prompt = f"""
-        Analyze the following script excerpt for potential issues. Focus ONLY on:
-        1.  **Plot Holes/Continuity:** Contradictions or logical gaps *within the excerpt*.
-        2.  **Pacing:** Sections that feel rushed, slow, or redundant *based on the text*.
-        3.  **Character Consistency/Voice:** Actions or dialogue inconsistent *within the excerpt*.
-        4.  **Clarity/Formatting:** Confusing descriptions or non-standard formatting.
-
-        List identified potential issues clearly with brief explanations. Do NOT suggest solutions. If no major issues are found, state that.
-
-        Script Excerpt:
-        ---
-        {script_excerpt}
-        ---
-        """
-        return call_groq(prompt, self.sp_analyzer)
+        if len(script_excerpt) // 4 > ANALYSIS_MAX_TOKENS:
+            summaries = await async_cached_call_groq_many(self._chunk_summary_prompts(script_excerpt), self.sp_analyzer, model=config.FAST_MODEL, bypass_cache=bypass_cache)
+            script_excerpt = self._join_chunk_summaries(summaries)
+            if script_excerpt.startswith("Error:"):
+                return script_excerpt
+        prompt = _ANALYSIS_PROMPT.format_map({"script_excerpt": script_excerpt})
+        return await async_cached_call_groq(prompt, self.sp_analyzer, model=route_model("analysis"), bypass_cache=bypass_cache)
+
+    def _chunk_summary_prompts(self, script_excerpt: str) -> list[str]:
+        chunks = [script_excerpt[i:i + ANALYSIS_CHUNK_CHARS] for i in range(0, len(script_excerpt), ANALYSIS_CHUNK_CHARS)]
+        return [_CHUNK_SUMMARY_PROMPT.format_map({"index": i, "total": len(chunks), "chunk": chunk}) for i, chunk in enumerate(chunks, start=1)]
+
+    def _join_chunk_summaries(self, summaries: list[str]) -> str:
+        """Joins chunk summaries into the excerpt that gets analyzed, or returns the first failed summary."""
+        for summary in summaries:
+            if summary.startswith("Error:"):
+                return summary
+        return "\n\n".join(f"[Summary of part {i}]\n{summary}" for i, summary in enumerate(summaries, start=1))
 
     # --- Pre-Production Ideas ---
 
-    def generate_moodboard_ideas(self, theme: str, genre: str, synopsis: str) -> str:
+    def generate_moodboard_ideas(self, theme: str, genre: str, synopsis: str, bypass_cache: bool = False) -> str:
          """Generates textual ideas for a mood board."""
          if not theme and not genre and not synopsis:
              return "Error: Please provide theme, genre, or synopsis for mood board ideas."
-         prompt = f"""
-         Based on the film concept:
-         - Genre: {genre if genre else 'N/A'}
-         - Theme: {theme if theme else 'N/A'}
-         - Synopsis: {synopsis if synopsis else 'N/A'}
-
-         Generate textual ideas for a mood board. Suggest:
-         1.  **Color Palette:** Describe 3-5 key colors and their emotional association (e.g., "Deep blues for mystery, sickly yellow for decay").
-         2.  **Key Textures:** Suggest relevant textures (e.g., "Rough concrete, smooth chrome, decaying lace").
-         3.  **Lighting Style:** Describe the overall lighting approach (e.g., "High-contrast noir, soft natural light, harsh neon").
-         4.  **Reference Keywords:** List 5-10 keywords for image searching (e.g., "Urban decay, isolated cabin, bioluminescence, vintage tech").
-         5.  **Comparable Films/Art (Optional):** Mention 1-2 existing works with a similar visual feel.
-
-         Format clearly using Markdown headings.
-         """
-         return call_groq(prompt, self.sp_creative)
-
-    def generate_storyboard_shot_ideas(self, scene_text: str) -> str:
+         return cached_call_groq(self._moodboard_prompt(theme, genre, synopsis), self.sp_creative, model=route_model("creative"), bypass_cache=bypass_cache)
+
+    async def a_generate_moodboard_ideas(self, theme: str, genre: str, synopsis: str, bypass_cache: bool = False) -> str:
+         """Async generate_moodboard_ideas."""
+         if not theme and not genre and not synopsis:
+             return "Error: Please provide theme, genre, or synopsis for mood board ideas."
+         return await async_cached_call_groq(self._moodboard_prompt(theme, genre, synopsis), self.sp_creative, model=route_model("creative"), bypass_cache=bypass_cache)
+
+    def _moodboard_prompt(self, theme: str, genre: str, synopsis: str) -> str:
+         return _MOODBOARD_PROMPT.format_map({
+             "genre": genre if genre else 'N/A',
+             "theme": theme if theme else 'N/A',
+             "synopsis": synopsis if synopsis else 'N/A',
+         })
+
+    def generate_storyboard_shot_ideas(self, scene_text: str, bypass_cache: bool = False) -> str:
         """Generates textual ideas for key storyboard shots for a scene."""
         if not scene_text or len(scene_text) < 50:
              return "Error: Please provide a sufficiently detailed scene text."
 
-        prompt = f"""
-        Analyze the following screenplay scene text:
-        ---
-        {scene_text}
-        ---
-
-        Suggest 3-5 key storyboard shot ideas to visually capture the essence of this scene. For each shot idea, describe:
-        1.  **Shot Type:** (e.g., Wide Shot, Medium Close-Up, POV, Insert Shot, Over-the-Shoulder).
-        2.  **Subject/Action:** What is the main focus of the frame and what is happening?
-        3.  **Purpose/Emotion:** Why is this shot important? What feeling should it evoke?
-
-        Example:
-        1.  **Shot Type:** Extreme Close-Up
-        2.  **Subject/Action:** Character's trembling hand reaching for a key.
-        3.  **Purpose/Emotion:** Emphasize nervousness and the importance of the object.
-
-        Format clearly using Markdown numbered lists.
-        """
-        return call_groq(prompt, self.sp_creative)
\ No newline at end of file
+        prompt = _STORYBOARD_PROMPT.format_map({"scene_text": scene_text})
+        return cached_call_groq(prompt, self.sp_creative, model=route_model("creative"), bypass_cache=bypass_cache)
+
+    async def a_generate_storyboard_shot_ideas(self, scene_text: str, bypass_cache: bool = False) -> str:
+        """Async generate_storyboard_shot_ideas."""
+        if not scene_text or len(scene_text) < 50:
+             return "Error: Please provide a sufficiently detailed scene text."
+
+        prompt = _STORYBOARD_PROMPT.format_map({"scene_text": scene_text})
+        return await async_cached_call_groq(prompt, self.sp_creative, model=route_model("creative"), bypass_cache=bypass_cache)
\ No newline at end of file
@@ -1,12 +1,17 @@
 # streamlit_app.py
 import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
-import base64
-import io
-from PIL import Image
+import orjson
+import copy
 from datetime import datetime # Used for displaying timestamps
 import logging
+import time
+import functools
+from concurrent.futures import ThreadPoolExecutor
 
 # Configure basic logging for the Streamlit app (optional, for debugging server-side)
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -15,9 +20,23 @@ logger = logging.getLogger(__name__)
 # --- Configuration ---
 # IMPORTANT: Replace with your FastAPI server URL if it's not running locally
 API_BASE_URL = "http://127.0.0.1:8000" # Default local development URL
+SAVE_DEBOUNCE_SECONDS = 2.0
+BATCH_POLL_SECONDS = 30
+SAVE_POLL_SECONDS = 1
+LOG_DISPLAY_CHARS = 20000 # Only the tail of the log is shown
+API_TIMEOUT = (3, 300) # (connect, read) seconds; generation endpoints can take minutes
+JSON_HEADERS = {"Content-Type": "application/json"} # For bodies pre-encoded with orjson
 
 # --- Helper Functions for API Interaction ---
 
+@st.cache_resource
+def get_http_session():
+    """One pooled keep-alive session per server process, so API calls don't reconnect on every rerun."""
+    session = requests.Session()
+    session.mount("http://", HTTPAdapter(pool_connections=10, pool_maxsize=20, max_retries=Retry(total=2, backoff_factor=0.2)))
+    session.mount("https://", HTTPAdapter(pool_connections=10, pool_maxsize=20, max_retries=Retry(total=2, backoff_factor=0.2)))
+    return session
+
 def call_api(method: str, endpoint: str, json_data: dict = None):
     """Generic helper to call the FastAPI backend."""
     # Ensure endpoint starts with a slash if not already
@@ -25,10 +44,12 @@ def call_api(method: str, endpoint: str, json_data: dict = None):
     url = f"{API_BASE_URL}{formatted_endpoint}"
     try:
         logger.info(f"Calling API: {method} {url}")
-        response = requests.request(method, url, json=json_data)
+        # orjson encodes/decodes the large project states (base64 images, full scripts) much faster than requests' stdlib json
+        body = orjson.dumps(json_data) if json_data is not None else None
+        response = get_http_session().request(method, url, data=body, headers=JSON_HEADERS if body is not None else None, timeout=API_TIMEOUT)
         response.raise_for_status() # Raise an HTTPError for bad responses (4xx or 5xx)
         logger.info(f"API call successful: {method} {url}")
-        return response.json()
+        return orjson.loads(response.content)
     except requests.exceptions.RequestException as e:
         status_code = e.response.status_code if e.response else 'Unknown'
         error_message = f"API Error ({status_code}): {e}"
@@ -59,6 +80,60 @@ def call_api(method: str, endpoint: str, json_data: dict = None):
         return {"error": unexpected_error_msg}
 
 
+def regenerate_query(previous_output) -> str:
+    """Query string for a generate call: when there is already output, ask the API for a fresh one instead of its cached response."""
+    return "?regenerate=true" if previous_output else ""
+
+
+# What a text stream appends when it breaks after some text was shown: the Groq stream itself, or the API connection
+_STREAM_ERROR_MARKERS = ("\n\nError: Stream from Groq interrupted.", "\n\nError: API Error (")
+
+def stream_failed(text: str) -> bool:
+    """Whether a streamed result failed; generated text that merely mentions "Error:" doesn't count."""
+    return text.startswith("Error:") or any(marker in text for marker in _STREAM_ERROR_MARKERS)
+
+
+def stream_api(endpoint: str, json_data: dict = None):
+    """POSTs to a streaming FastAPI endpoint and yields the response text as it arrives."""
+    formatted_endpoint = endpoint if endpoint.startswith('/') else '/' + endpoint
+    url = f"{API_BASE_URL}{formatted_endpoint}"
+    started = False
+    try:
+        logger.info(f"Calling streaming API: POST {url}")
+        body = orjson.dumps(json_data) if json_data is not None else None
+        with get_http_session().post(url, data=body, headers=JSON_HEADERS if body is not None else None, stream=True, timeout=API_TIMEOUT) as response:
+            response.raise_for_status()
+            response.encoding = response.encoding or "utf-8"
+            for chunk in response.iter_content(chunk_size=None, decode_unicode=True):
+                if chunk:
+                    started = True
+                    yield chunk
+    except requests.exceptions.RequestException as e:
+        status_code = e.response.status_code if e.response is not None else 'Unknown'
+        error_message = f"API Error ({status_code}): {e}"
+        logger.error(error_message, exc_info=True)
+        yield f"\n\nError: {error_message}" if started else f"Error: {error_message}"
+
+
+def stream_parts_api(endpoint: str, json_data: dict = None):
+    """POSTs to an NDJSON streaming endpoint and yields each decoded part as it arrives."""
+    formatted_endpoint = endpoint if endpoint.startswith('/') else '/' + endpoint
+    url = f"{API_BASE_URL}{formatted_endpoint}"
+    try:
+        logger.info(f"Calling streaming API: POST {url}")
+        body = orjson.dumps(json_data) if json_data is not None else None
+        with get_http_session().post(url, data=body, headers=JSON_HEADERS if body is not None else None, stream=True, timeout=API_TIMEOUT) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if line:
+                    yield orjson.loads(line)
+    except (requests.exceptions.RequestException, json.JSONDecodeError) as e:
+        status_code = e.response.status_code if getattr(e, "response", None) is not None else 'Unknown'
+        error_message = f"API Error ({status_code}): {e}"
+        logger.error(error_message, exc_info=True)
+        yield {"type": "error", "content": error_message}
+
+
 def get_projects():
     """Fetches the list of projects from the API."""
     response_data = call_api("GET", "/projects")
@@ -67,23 +142,42 @@ def get_projects():
     return [] # Return empty list on error or if 'projects' key is missing
 
 
-def load_project_api(project_name: str):
-    """Loads a project state from the API."""
+def get_projects_with_meta():
+    """Fetches the project list with each project's last-saved time from the API; None if the call failed."""
+    response_data = call_api("GET", "/projects/meta")
+    if "error" not in response_data:
+        return {p["project_name"]: p.get("last_saved") for p in response_data.get("projects", [])}
+    return None
+
+
+@st.cache_data(ttl=30, show_spinner=False)
+def _cached_project_list():
+    """Project list for the sidebar; every widget interaction reruns the script, so reuse it for 30s."""
+    return get_projects_with_meta()
+
+
+def load_project_api(project_name: str, rerun: bool = True):
+    """Loads a project state from the API.
+
+    The sidebar passes rerun=False: everything that shows the state renders after it in the same run.
+    Callers inside a tab need the rerun, since their section bindings still point at the old state.
+    """
     response_data = call_api("GET", f"/projects/{project_name}")
     if "error" not in response_data:
         st.session_state.project_state = response_data # Store the full state from API
+        st.session_state._last_saved_state = copy.deepcopy(response_data) # Baseline for change-only saves
+        st.session_state._dirty_chars = set()
         st.session_state.active_char_for_display = None # Reset selected char on load
         # Also clear temporary AI outputs from Pro mode
         st.session_state.temp_drafted_scene = ""
         st.session_state.temp_refined_text = ""
         st.session_state.temp_profile_suggestions = ""
-        # Ensure pre_production images are loaded (they are part of state)
-        st.session_state.project_state['pre_production'] = st.session_state.project_state.get('pre_production', {}) # Ensure dict exists
-        st.session_state.project_state['pre_production']['moodboard_images'] = st.session_state.project_state['pre_production'].get('moodboard_images', [])
-        st.session_state.project_state['pre_production']['storyboard_images'] = st.session_state.project_state['pre_production'].get('storyboard_images', [])
+        # No need to fill in pre_production defaults: the endpoint's response_model (ProjectState) always includes them
 
+        _cached_project_list.clear()
         st.success(f"Project '{project_name}' loaded from API.")
-        st.rerun() # Rerun to update UI based on loaded state
+        if rerun:
+            st.rerun() # Rerun to update UI based on loaded state
     # Error message is displayed by call_api
 
 
@@ -92,20 +186,18 @@ def create_project_api(new_project_name: str):
     response_data = call_api("POST", "/projects", json_data={"project_name": new_project_name})
     if "error" not in response_data:
         st.session_state.project_state = response_data # API returns the initial state
+        st.session_state._last_saved_state = copy.deepcopy(response_data) # Baseline for change-only saves
+        st.session_state._dirty_chars = set()
         st.session_state.active_char_for_display = None # Reset selected char on create
          # Also clear temporary AI outputs from Pro mode
         st.session_state.temp_drafted_scene = ""
         st.session_state.temp_refined_text = ""
         st.session_state.temp_profile_suggestions = ""
-        # Initialize pre_production images lists
-        st.session_state.project_state['pre_production'] = st.session_state.project_state.get('pre_production', {}) # Ensure dict exists
-        st.session_state.project_state['pre_production']['moodboard_images'] = []
-        st.session_state.project_state['pre_production']['storyboard_images'] = []
-
 
+        _cached_project_list.clear() # Show the new project in the picker right away
         st.success(f"New project '{new_project_name}' created via API.")
-        st.session_state.ti_new_project_name_ui = "" # Clear the input field by updating its key in state
-        st.rerun() # Rerun to update project list and UI
+        st.session_state.clear_new_project_name_flag = True # Widget values can only be reset before the widget renders
+        st.rerun() # Rerun to update project list and UI, and clear the name input
     # Error message is displayed by call_api
 
 
@@ -115,17 +207,126 @@ def save_project_api():
         st.warning("Cannot save an unnamed project. Load or create a project first.")
         return
 
+    # Debounce: repeated presses within a couple of seconds would re-send the same full state
+    now = time.monotonic()
+    if now - st.session_state.get("_last_save_ts", 0.0) < SAVE_DEBOUNCE_SECONDS:
+        st.info("Project was just saved.")
+        return
+    st.session_state._last_save_ts = now
+
     project_name = st.session_state.project_state["project_name"]
     # Send the *entire* current state from session_state to the API
     # The API saves the state, including updating the log and last_saved timestamp.
-    state_to_save = st.session_state.project_state
-    response_data = call_api("PUT", f"/projects/{project_name}", json_data=state_to_save)
+    # Only what changed since the last load/save is sent, so unchanged images and scripts stay on the server.
+    last_saved_state = st.session_state.get("_last_saved_state") or {}
+    if last_saved_state.get("project_name") != project_name:
+        last_saved_state = {}
+    # Serialize now so the request carries a snapshot even if the state changes while it's in flight.
+    body = orjson.dumps({"changes": _state_changes(last_saved_state, st.session_state.project_state)})
+    future = _io_pool().submit(_send_project_changes, get_http_session(), project_name, body)
+    st.session_state._save_in_flight = (project_name, body, future)
+    st.info(f"Saving project '{project_name}'...")
+
+
+def _state_changes(last: dict, current: dict) -> dict:
+    """What changed between two project states, one level into each section: {section: {key: new value}}."""
+    changes = {}
+    for section, value in current.items():
+        if section in ("last_saved", "log"): # Written by the API on save
+            continue
+        old = last.get(section)
+        if isinstance(value, dict) and isinstance(old, dict):
+            changed = {key: item for key, item in value.items() if old.get(key) != item}
+            if changed:
+                changes[section] = changed
+        elif value != old:
+            changes[section] = value
+    return changes
+
+
+def _apply_changes(state: dict, changes: dict):
+    """Merges a _state_changes() result into state in place (the same merge the API does)."""
+    for section, value in changes.items():
+        if isinstance(state.get(section), dict) and isinstance(value, dict):
+            state[section].update(value)
+        else:
+            state[section] = value
+
+
+def flush_dirty_characters():
+    """Sends the character profiles saved locally since the last flush in one PATCH.
+
+    Returns None on success (or when nothing is pending), else call_api's error dict.
+    """
+    dirty = st.session_state.get("_dirty_chars")
+    if not dirty:
+        return None
+    project_name = get_state()["project_name"]
+    characters = {name: char for name, char in get_state().get("characters", {}).items() if name in dirty}
+    response_data = call_api("PATCH", f"/projects/{project_name}", json_data={"changes": {"characters": characters}})
+    if "error" in response_data:
+        return response_data
+
+    st.session_state.project_state["last_saved"] = response_data.get("last_saved")
+    st.session_state.project_state["log"] = response_data.get("log", [])
+    last_saved_state = st.session_state.get("_last_saved_state") or {}
+    if last_saved_state.get("project_name") == project_name:
+        _apply_changes(last_saved_state, {"characters": copy.deepcopy(characters)})
+    st.session_state._dirty_chars = set()
+    return None
+
+
+@st.cache_resource
+def _io_pool():
+    """Worker threads for saves, so the UI doesn't wait on the backend's disk write."""
+    return ThreadPoolExecutor(max_workers=2)
+
+
+def _send_project_changes(session: requests.Session, project_name: str, body: bytes) -> dict:
+    # Runs on an _io_pool thread: no st.* calls here, save_status() reports the outcome
+    response = session.patch(f"{API_BASE_URL}/projects/{project_name}", data=body, headers=JSON_HEADERS, timeout=API_TIMEOUT)
+    response.raise_for_status()
+    return orjson.loads(response.content)
+
+
+@st.fragment(run_every=SAVE_POLL_SECONDS)
+def save_status():
+    """Shows a pending save and applies its result once the background request finishes."""
+    in_flight = st.session_state.get("_save_in_flight")
+    if not in_flight:
+        return
+    project_name, body, future = in_flight
+    if not future.done():
+        st.caption(f"Saving '{project_name}'...")
+        return
 
-    if "error" not in response_data:
-        # API returns the state with updated save time and log
-        st.session_state.project_state = response_data # Update local state with latest from API
-        st.success(f"Project '{project_name}' saved via API!")
-        # No explicit rerun needed, success message display implies it happens
+    st.session_state._save_in_flight = None
+    try:
+        saved_state = future.result()
+    except requests.exceptions.RequestException as e:
+        logger.error(f"Background save of '{project_name}' failed: {e}", exc_info=True)
+        st.toast(f"Saving '{project_name}' failed: {e}", icon="🚨")
+    else:
+        # Only take what the API added; edits made while the save was in flight stay in place
+        if get_state().get("project_name") == project_name:
+            st.session_state.project_state["last_saved"] = saved_state.get("last_saved")
+            st.session_state.project_state["log"] = saved_state.get("log", [])
+            # The server now has these changes; the decoded body is a private copy, safe to keep
+            last_saved_state = st.session_state.get("_last_saved_state") or {}
+            if last_saved_state.get("project_name") != project_name:
+                last_saved_state = {}
+            changes = orjson.loads(body)["changes"]
+            _apply_changes(last_saved_state, changes)
+            st.session_state._last_saved_state = last_saved_state
+            # Profiles sent with this save no longer need a flush, unless they were edited again meanwhile
+            saved_chars = changes.get("characters", {})
+            st.session_state._dirty_chars = {
+                name for name in st.session_state.get("_dirty_chars", set())
+                if get_state().get("characters", {}).get(name) != saved_chars.get(name)
+            }
+        _cached_project_list.clear() # Last-saved times in the picker changed
+        st.toast(f"Project '{project_name}' saved via API!")
+    st.rerun(scope="app")
 
 
 # --- Initialize Session State ---
@@ -158,6 +359,9 @@ if 'temp_refined_text' not in st.session_state:
     logger.info("Initializing Streamlit Session State: temp_refined_text")
     st.session_state.temp_refined_text = ""
 
+if '_dirty_chars' not in st.session_state:
+    st.session_state._dirty_chars = set() # Characters saved locally but not yet sent to the API
+
 if 'temp_profile_suggestions' not in st.session_state:
     logger.info("Initializing Streamlit Session State: temp_profile_suggestions")
     st.session_state.temp_profile_suggestions = ""
@@ -186,6 +390,108 @@ def get_state():
      # Always work with the client's view of the project state from session_state
      return st.session_state.project_state
 
+def rerun_fragment():
+    """Reruns just the calling fragment; falls back to a full rerun if this run is already a full app run.
+
+    st.rerun(scope="fragment") raises during a full run, which a fragment widget event can be merged into.
+    """
+    ctx = get_script_run_ctx()
+    st.rerun(scope="fragment" if ctx is not None and ctx.fragment_ids_this_run else "app")
+
+@functools.lru_cache(maxsize=64)
+def format_saved_time(last_saved: str) -> str:
+    """Formats an ISO last_saved timestamp for display; memoized since the sidebar shows it on every rerun."""
+    try:
+        return datetime.fromisoformat(last_saved).strftime('%Y-%m-%d %H:%M:%S')
+    except (ValueError, TypeError): # Handle potential errors if last_saved format is unexpected
+        return str(last_saved) # Display raw string if parsing fails
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def _decode_image(b64: str) -> bytes:
+    """Decodes a base64 image part once per payload; raises if it isn't a readable image."""
+    # Imported here so sessions that never show an image don't load Pillow at startup
+    import base64
+    import io
+    from PIL import Image
+
+    img_bytes = base64.b64decode(b64)
+    Image.open(io.BytesIO(img_bytes)).verify()
+    return img_bytes
+
+@st.cache_data(show_spinner=False)
+def _strip_twists(synopsis_md: str) -> str:
+    """The synopsis without its "### Potential Twists" section, as sent to the other agents."""
+    twists_at = synopsis_md.find("### Potential Twists")
+    return synopsis_md[:twists_at].strip() if twists_at >= 0 else synopsis_md
+
+@st.fragment(run_every=BATCH_POLL_SECONDS)
+def batch_job_status():
+    """Polls the project's "draft all scenes" batch job; only this fragment reruns while waiting."""
+    if not get_state().get("script", {}).get("batch_job"):
+        return
+    response_data = call_api("GET", f"/projects/{get_state()['project_name']}/script/draft-all-scenes/batch")
+    if "error" in response_data:
+        return
+
+    status = response_data.get("status", "unknown")
+    if status.startswith("completed"):
+        # Mirror what the API appended to the saved script
+        script_state = st.session_state.project_state["script"]
+        existing = script_state.get("full_script_content", "").rstrip()
+        drafted = response_data.get("text", "")
+        script_state["full_script_content"] = f"{existing}\n\n{drafted}" if existing else drafted
+        script_state["batch_job"] = None
+        st.success(f"Drafted {response_data.get('scene_count', 0)} scenes into the full script.")
+        st.rerun(scope="app")
+    else:
+        st.caption(f"Batch draft of {response_data.get('scene_count', 0)} scenes: {status} (checking every {BATCH_POLL_SECONDS}s)")
+
+def render_image_part(i: int, part: dict, caption: str = "Part"):
+    """Renders one generated image-generation part (image, text or error); shared by Kids mode and pre-production."""
+    part_type = part.get("type", "")
+    if part_type.startswith("image/"):
+        try:
+            img_bytes = _decode_image(part.get("content"))
+            st.image(img_bytes, caption=f"{caption} {i+1}", use_column_width=True)
+        except Exception as e:
+            st.warning(f"Failed to display image part {i+1}: {e}")
+    elif part_type == "text":
+        st.write(f"**Text Part {i+1}:**")
+        st.markdown(part.get("content")) # Use markdown for potential formatting
+    elif part_type == "error":
+        st.error(f"Image generation part {i+1} failed: {part.get('content')}")
+    else:
+        st.warning(f"Skipping unknown part type {i+1}: {part_type}")
+
+def render_image_parts(parts: list, caption: str = "Part"):
+    """Renders a list of generated parts in order."""
+    for i, part in enumerate(parts):
+        render_image_part(i, part, caption)
+
+def stream_preproduction_api(endpoint: str, kind: str, json_data: dict = None) -> bool:
+    """Streams generated pre-production ideas and images, rendering each part as it arrives.
+
+    On success the API has saved them; they go into the local state and the save baseline, so there
+    is no need to re-fetch the whole project. Returns whether generation succeeded.
+    """
+    parts, ideas_md = [], None
+    for part in stream_parts_api(endpoint, json_data=json_data):
+        if part.get("type") == "ideas":
+            ideas_md = part.get("content", "")
+            st.markdown(ideas_md)
+        else:
+            parts.append(part)
+            render_image_part(len(parts) - 1, part, caption="Image")
+    if ideas_md is None or not parts or any(part.get("type") == "error" for part in parts):
+        return False
+
+    changes = {"pre_production": {f"{kind}_ideas_md": ideas_md, f"{kind}_images": parts}}
+    _apply_changes(get_state(), changes)
+    last_saved_state = st.session_state.get("_last_saved_state") or {}
+    if last_saved_state.get("project_name") == get_state()["project_name"]:
+        _apply_changes(last_saved_state, copy.deepcopy(changes))
+    return True
+
 # --- UI Layout ---
 
 st.set_page_config(layout="wide", page_title="FilmForge AI")
@@ -202,13 +508,11 @@ with st.sidebar:
         index=0 if st.session_state.mode == "Pro" else 1,
         key="mode_select_ui" # Unique key
     )
-    # Update session state if the mode changes via radio button
+    # Update session state if the mode changes via radio button; everything mode-dependent renders below
     if selected_mode == "Pro Mode" and st.session_state.mode != "Pro":
         st.session_state.mode = "Pro"
-        st.rerun() # Rerun to switch mode
     elif selected_mode == "Kids Mode" and st.session_state.mode != "Kids":
         st.session_state.mode = "Kids"
-        st.rerun() # Rerun to switch mode
 
     st.divider()
 
@@ -217,14 +521,16 @@ with st.sidebar:
         st.header("Project Management")
 
         # Load Project
-        projects = get_projects() # Fetch list from API
+        project_meta = _cached_project_list() # Fetch list (with last-saved times) from API, cached briefly
+        if project_meta is None: # Don't keep serving a failed fetch for the whole TTL
+            _cached_project_list.clear()
+            project_meta = {}
+        projects = list(project_meta)
         current_project_name = get_state().get("project_name", "Untitled")
 
-        # Determine current index for selectbox default
-        try:
-            current_project_index = projects.index(current_project_name) if current_project_name != "Untitled" and current_project_name in projects else None
-        except ValueError:
-             current_project_index = None # Handle case where current project might not be in the list
+        # Determine current index for selectbox default (None if the current project isn't in the list)
+        project_positions = {name: i for i, name in enumerate(projects)}
+        current_project_index = project_positions.get(current_project_name) if current_project_name != "Untitled" else None
 
 
         selected_project = st.selectbox(
@@ -232,17 +538,20 @@ with st.sidebar:
             options=projects,
             index=current_project_index,
             placeholder="Select project...",
+            format_func=lambda name: f"{name} (saved {project_meta[name][:16].replace('T', ' ')})" if project_meta.get(name) else name,
             key="sb_load_project_ui" # Use a unique key for the widget
         )
 
         if st.button("Load Project", key="btn_load_ui", disabled=(selected_project is None)):
             if selected_project:
-                load_project_api(selected_project)
+                load_project_api(selected_project, rerun=False)
 
 
         st.divider()
 
         # Create New Project
+        if st.session_state.pop("clear_new_project_name_flag", False):
+            st.session_state.ti_new_project_name_ui = ""
         new_proj_name = st.text_input("New Project Name", key="ti_new_project_name_ui") # Use a unique key
         if st.button("Create New Project", key="btn_create_ui"): # Use a unique key
             if new_proj_name:
@@ -256,26 +565,605 @@ with st.sidebar:
         # Button is only enabled if a project is loaded (not "Untitled")
         if st.button("Save Current Project", key="btn_save_ui", disabled=(get_state().get("project_name") == "Untitled")): # Use a unique key
             save_project_api()
+        if st.session_state.get("_save_in_flight"):
+            save_status()
+        if st.session_state._dirty_chars:
+            st.caption(f"Unsaved character profiles: {', '.join(sorted(st.session_state._dirty_chars))}")
 
         st.divider()
         st.write(f"**Current Project:** {get_state().get('project_name', 'Untitled')}")
         last_saved = get_state().get('last_saved')
         if last_saved:
-            try:
-                # Parse ISO format string
-                saved_dt = datetime.fromisoformat(last_saved)
-                st.caption(f"Last Saved: {saved_dt.strftime('%Y-%m-%d %H:%M:%S')}")
-            except (ValueError, TypeError): # Handle potential errors if last_saved format is unexpected
-                st.caption(f"Last Saved: {last_saved}") # Display raw string if parsing fails
+            st.caption(f"Last Saved: {format_saved_time(last_saved)}")
         else:
              st.caption("Not saved yet.")
 
+        with st.expander("Maintenance"):
+            if st.button("Clear AI Response Cache", key="btn_clear_cache_ui"):
+                response_data = call_api("POST", "/maintenance/clear-cache")
+                if "error" not in response_data:
+                    st.success(response_data.get("message", "Cache cleared."))
+
+
+# --- Pro Mode Tabs ---
+# Each tab is a fragment: a widget change inside a tab reruns only that tab, not the whole script.
+
+# Edit-heavy inputs get their own fragments so typing in them doesn't rerun the tab and re-parse
+# the large generated markdown around them; the generate/save handlers rerun the app on success.
+@st.fragment
+def render_seed_idea_input(current_concept_state: dict):
+    """Seed idea input and the Generate Initial Concepts button."""
+    seed_idea = st.text_area(
+        "Seed Idea (Genre, Theme, Logline, Keywords)",
+        value=current_concept_state.get("seed_idea", ""),
+        key="concept_seed_idea_ta_ui" # Unique key for UI element
+    )
 
-# --- Main Content Area ---
+    if st.button("Generate Initial Concepts", key="btn_gen_concepts_ui"): # Unique key
+        seed_idea_val = st.session_state.concept_seed_idea_ta_ui
 
-# Conditional rendering based on mode
-if st.session_state.mode == "Kids":
-    # --- Kids Mode UI ---
+        if seed_idea_val:
+            st.info("Generating initial concepts via API...")
+            response_data = call_api("POST", f"/projects/{get_state()['project_name']}/concept/generate-concepts{regenerate_query(current_concept_state.get('generated_concepts_md'))}", json_data={"seed_idea": seed_idea_val})
+            if "error" not in response_data:
+                current_concept_state["generated_concepts_md"] = response_data.get("text", "")
+                st.success("Concepts generated and saved.")
+                st.rerun()
+        else:
+            st.warning("Please enter a seed idea.")
+
+
+@st.fragment
+def render_concept_tab():
+    """Concept Development tab."""
+    st.header("Concept Development")
+    st.markdown("Define the core idea of your film.")
+
+    # Bind the state sections once per rerun instead of re-walking get_state() for every widget
+    state = get_state()
+    project_name = state["project_name"]
+    current_concept_state = state.setdefault("concept", {}) # Get the concept state from loaded project
+
+    render_seed_idea_input(current_concept_state)
+
+    st.markdown("---")
+    st.markdown("**Generated Concepts:**")
+    st.markdown(current_concept_state.get("generated_concepts_md", "*No concepts generated yet.*"))
+    st.markdown("---")
+
+    st.subheader("Refine Your Concept")
+    # A form so typing in these fields doesn't rerun the tab; only submitting does
+    with st.form("refine_concept_form"):
+        col1, col2 = st.columns(2)
+        with col1:
+            logline = st.text_input(
+                "Chosen Logline",
+                value=current_concept_state.get("chosen_logline", ""),
+                key="concept_logline_ui" # Unique key
+            )
+
+            theme = st.text_input(
+                "Chosen Theme",
+                value=current_concept_state.get("chosen_theme", ""),
+                key="concept_theme_ui" # Unique key
+            )
+        with col2:
+            framework = st.text_input(
+                "Chosen Narrative Framework",
+                 value=current_concept_state.get("chosen_framework", "Three-Act Structure"),
+                 key="concept_framework_ui" # Unique key
+            )
+
+            conflict = st.text_input(
+                "Chosen Central Conflict",
+                value=current_concept_state.get("chosen_conflict", ""),
+                key="concept_conflict_ui" # Unique key
+            )
+        generate_synopsis_clicked = st.form_submit_button("Generate Synopsis & Twists", key="btn_gen_synopsis_ui")
+
+    if generate_synopsis_clicked:
+        logline_val = st.session_state.concept_logline_ui
+        theme_val = st.session_state.concept_theme_ui
+        framework_val = st.session_state.concept_framework_ui
+        conflict_val = st.session_state.concept_conflict_ui
+
+        concept_details_payload = {}
+        if logline_val: concept_details_payload['logline'] = logline_val
+        if framework_val: concept_details_payload['framework'] = framework_val
+        if theme_val: concept_details_payload['theme'] = theme_val
+        if conflict_val: concept_details_payload['conflict'] = conflict_val
+
+
+        if logline_val or theme_val or current_concept_state.get("chosen_logline") or current_concept_state.get("chosen_theme"):
+            # Render the synopsis as it is generated instead of waiting behind a spinner
+            result_md = st.write_stream(stream_api(f"/projects/{project_name}/concept/generate-synopsis/stream{regenerate_query(current_concept_state.get('synopsis_md'))}", json_data=concept_details_payload))
+
+            if stream_failed(result_md):
+                 st.error(result_md, icon="🚨")
+            else:
+                 if 'logline' in concept_details_payload: current_concept_state["chosen_logline"] = concept_details_payload['logline']
+                 if 'framework' in concept_details_payload: current_concept_state["chosen_framework"] = concept_details_payload['framework']
+                 if 'theme' in concept_details_payload: current_concept_state["chosen_theme"] = concept_details_payload['theme']
+                 if 'conflict' in concept_details_payload: current_concept_state["chosen_conflict"] = concept_details_payload['conflict']
+
+                 current_concept_state["synopsis_md"] = result_md
+                 current_concept_state["final_synopsis"] = _strip_twists(result_md)
+
+                 st.success("Synopsis generated and saved.")
+                 rerun_fragment() # Only this tab shows the synopsis
+
+        else:
+            st.warning("Please provide at least a Logline or Theme.")
+
+    st.markdown("**Generated Synopsis & Twists:**")
+    st.markdown(current_concept_state.get("synopsis_md", "*No synopsis generated yet.*"))
+
+
+def _on_char_selected():
+    selected = st.session_state.char_select_arc_ui
+    if selected != "Select a character...":
+        st.session_state.active_char_for_display = selected
+
+
+@st.fragment
+def render_character_tab():
+    """Character Development tab."""
+    st.header("Character Development")
+    st.markdown("Develop your characters.")
+
+    state = get_state()
+    project_name = state["project_name"]
+    state_chars = state.setdefault("characters", {}) # Get the characters state from loaded project
+    current_concept_state = state.setdefault("concept", {})
+    char_names = list(state_chars.keys())
+
+    # Resolve the selected character once; the pre-fill, gates and handlers below all work on it
+    active_char_name = st.session_state.active_char_for_display
+    active_char_exists = active_char_name in state_chars
+    active_char_data = state_chars.get(active_char_name) or {}
+    active_profile = active_char_data.get("profile") or {}
+
+    col1, col2 = st.columns([1, 2]) # Adjust column ratios as needed
+
+    with col1:
+        st.subheader("Add/Edit Character")
+        # Use keys to bind inputs to session state
+        # A form so typing a profile doesn't rerun the tab; only the two submit buttons do
+        with st.form("character_profile_form"):
+            char_name_input = st.text_input("Character Name", key="char_name_input_ui")
+            char_role_input = st.text_input("Character Role", placeholder="e.g., Protagonist", key="char_role_input_ui")
+
+            # Attempt to pre-fill profile fields if editing an existing character selected in col2
+            if active_char_exists:
+                 # Set the session state values bound to the input field keys
+                 st.session_state.char_name_input_ui = active_char_name
+                 st.session_state.char_role_input_ui = active_char_data.get("role", "")
+                 st.session_state.char_backstory_ui = active_profile.get("backstory", "")
+                 st.session_state.char_motivation_ui = active_profile.get("motivation", "")
+                 st.session_state.char_flaw_ui = active_profile.get("flaw", "")
+            # Note: If the user changes char_name_input_ui, the link to active_char_for_display is broken
+            # for pre-filling, which is the desired behavior (they are now defining a *new* character).
+
+            st.markdown("**Define Character Profile:**")
+            # Use keys to sync these text areas to session state
+            backstory = st.text_area("Chosen Backstory", key="char_backstory_ui")
+            motivation = st.text_area("Chosen Motivation", key="char_motivation_ui")
+            flaw = st.text_area("Chosen Flaw", key="char_flaw_ui")
+
+            form_col1, form_col2 = st.columns(2)
+            suggest_profile_clicked = form_col1.form_submit_button("Suggest Profile Elements", key="btn_suggest_profile_ui")
+            save_char_clicked = form_col2.form_submit_button("Save/Update Character Profile", key="btn_save_char_ui")
+
+        if suggest_profile_clicked:
+            # Use values from the text inputs (synced by keys)
+            name_val = st.session_state.char_name_input_ui
+            role_val = st.session_state.char_role_input_ui
+
+            if name_val and role_val:
+                st.info(f"Generating profile ideas for {name_val} via API...")
+                genre = current_concept_state.get("seed_idea", "Unknown Genre")
+                theme = current_concept_state.get("chosen_theme", "General Theme")
+
+                response_data = call_api("POST", f"/projects/{project_name}/characters/suggest-profile{regenerate_query(st.session_state.temp_profile_suggestions)}", json_data={"role": role_val, "genre": genre, "theme": theme})
+
+                if "error" not in response_data:
+                    st.session_state.temp_profile_suggestions = response_data.get("text", "")
+                    st.success("Profile suggestions generated.")
+            else:
+                st.warning("Please enter Character Name and Role.")
+
+        # Display temporary suggestions if they exist
+        if st.session_state.temp_profile_suggestions:
+             with st.expander("Show/Hide Profile Suggestions", expanded=True):
+                  st.markdown(st.session_state.temp_profile_suggestions)
+
+        if save_char_clicked:
+             # Read values from session state via keys
+             name_val = st.session_state.char_name_input_ui
+             role_val = st.session_state.char_role_input_ui
+             backstory_val = st.session_state.char_backstory_ui
+             motivation_val = st.session_state.char_motivation_ui
+             flaw_val = st.session_state.char_flaw_ui
+
+             if name_val and role_val:
+                  # Kept locally and sent with the next project save (or before the next character generation),
+                  # so editing several characters costs one round-trip instead of one per click.
+                  char_state = state_chars.setdefault(name_val, {"role": role_val, "profile": {}, "arc_description": "", "relationship_suggestions": ""})
+                  char_state["role"] = role_val
+                  char_state["profile"] = {
+                      "backstory": backstory_val,
+                      "motivation": motivation_val,
+                      "flaw": flaw_val
+                  }
+                  st.session_state._dirty_chars.add(name_val)
+                  st.session_state.temp_profile_suggestions = ""
+                  st.session_state.active_char_for_display = name_val
+                  st.rerun()
+             else:
+                  st.warning("Please enter Character Name and Role.")
+
+    with col2:
+        st.subheader("Explore Arcs & Relationships")
+        current_char_names = list(state_chars.keys())
+        char_options = ["Select a character..."] + current_char_names
+
+        # Position 0 is the placeholder; unknown or unset names fall back to it
+        current_char_index = {name: i for i, name in enumerate(current_char_names, start=1)}.get(active_char_name, 0)
+
+
+        selected_char_for_arc = st.selectbox(
+             "Select Character",
+             options=char_options,
+             index=current_char_index,
+             key="char_select_arc_ui", # Unique key
+             on_change=_on_char_selected # Runs before the rerun, so no extra st.rerun() is needed
+        )
+
+        can_generate_bundle = active_char_exists
+        if st.button("Generate Profile Ideas, Arc & Relationships (One Call)", key="btn_gen_bundle_ui", disabled=(not can_generate_bundle)): # Unique key
+            char_name_active = active_char_name
+            st.info(f"Generating character bundle for {char_name_active} via API...")
+            # The API generates from its saved profiles, so send any local edits first
+            response_data = flush_dirty_characters() or call_api("POST", f"/projects/{project_name}/characters/{char_name_active}/generate-bundle{regenerate_query(active_char_data.get('arc_description') or active_char_data.get('relationship_suggestions'))}")
+
+            if "error" not in response_data:
+                st.session_state.temp_profile_suggestions = response_data.get("profile_suggestions", "")
+                char_state = state_chars.get(char_name_active)
+                if char_state is not None:
+                    if response_data.get("arc_description"): char_state["arc_description"] = response_data["arc_description"]
+                    if response_data.get("relationship_suggestions"): char_state["relationship_suggestions"] = response_data["relationship_suggestions"]
+                st.success(f"Character bundle generated for {char_name_active}.")
+                st.rerun()
+
+        st.markdown("**Character Arc:**")
+        can_regenerate_arcs = any(
+            c.get("profile", {}).get("motivation") and c.get("profile", {}).get("flaw") for c in state_chars.values()
+        )
+        if st.button("Regenerate All Character Arcs", key="btn_regen_all_arcs_ui", disabled=(not can_regenerate_arcs)): # Unique key
+            st.info("Regenerating arcs for all characters via API...")
+            # The API generates from its saved profiles, so send any local edits first
+            response_data = flush_dirty_characters() or call_api("POST", f"/projects/{project_name}/characters/regenerate-arcs")
+
+            if "error" not in response_data:
+                st.session_state.project_state["characters"] = response_data
+                st.success("Character arcs regenerated.")
+                st.rerun()
+
+        can_generate_arc = (
+            active_char_exists
+            and active_profile.get("motivation")
+            and active_profile.get("flaw")
+        )
+        if st.button("Generate Character Arc", key="btn_gen_arc_ui", disabled=(not can_generate_arc)): # Unique key
+            char_name_active = active_char_name
+            st.info(f"Generating arc for {char_name_active} via API...")
+            # The API generates from its saved profiles, so send any local edits first
+            response_data = flush_dirty_characters() or call_api("POST", f"/projects/{project_name}/characters/{char_name_active}/generate-arc{regenerate_query(active_char_data.get('arc_description'))}")
+
+            if "error" not in response_data:
+                if char_name_active in state_chars:
+                    state_chars[char_name_active]["arc_description"] = response_data.get("text", "")
+                    st.success(f"Arc generated for {char_name_active}.")
+                else:
+                    st.error(f"API returned success but character '{char_name_active}' state not found locally after update attempt.")
+
+
+        arc_desc = active_char_data.get("arc_description", "*No arc generated yet.*")
+        st.markdown(arc_desc)
+        st.markdown("---")
+
+        st.markdown("**Relationship Suggestions:**")
+        can_suggest_rels = active_char_exists and len(state_chars) > 1
+        if st.button("Suggest Relationships", key="btn_gen_rels_ui", disabled=(not can_suggest_rels)): # Unique key
+            char_name_active = active_char_name
+            st.info(f"Generating relationship suggestions for {char_name_active} via API...")
+            # The API generates from its saved profiles, so send any local edits first
+            response_data = flush_dirty_characters() or call_api("POST", f"/projects/{project_name}/characters/{char_name_active}/suggest-relationships{regenerate_query(active_char_data.get('relationship_suggestions'))}")
+
+            if "error" not in response_data:
+                 if char_name_active in state_chars:
+                     state_chars[char_name_active]["relationship_suggestions"] = response_data.get("text", "")
+                     st.success(f"Relationship suggestions generated for {char_name_active}.")
+                 else:
+                      st.error(f"API returned success but character '{char_name_active}' state not found locally after update attempt.")
+
+
+        rel_sugg = active_char_data.get("relationship_suggestions", "*No relationship suggestions generated yet.*")
+        st.markdown(rel_sugg)
+
+
+@st.fragment
+def render_full_script_editor(current_script_state: dict):
+    """Full script text editor and its save button."""
+    st.markdown("---")
+    st.subheader("Full Script Draft")
+
+    # A form, so leaving the editor after a long edit doesn't rerun anything until Save is pressed
+    with st.form("full_script_form", border=False):
+        full_script_content = st.text_area(
+            "Script Content (.fountain format recommended)",
+            value=current_script_state.get("full_script_content", ""),
+            height=600,
+            key="script_editor_main_ui"
+        )
+        save_script_clicked = st.form_submit_button("Save Full Script Content", key="btn_save_full_script_ui")
+
+    if save_script_clicked:
+         st.info("Saving full script content via API...")
+         script_to_save = st.session_state.script_editor_main_ui
+         response_data = call_api("PUT", f"/projects/{get_state()['project_name']}/script/full-script", json_data={"full_script_content": script_to_save})
+         if "error" not in response_data:
+              current_script_state["full_script_content"] = script_to_save
+              st.success("Full script content saved.")
+              st.rerun() # The analyze button depends on the saved script length
+
+
+@st.fragment
+def render_refine_panel():
+    """Refine Text input, button and output."""
+    st.markdown("**Refine Text:**")
+    with st.form("refine_text_form", border=False):
+        text_to_refine = st.text_area("Paste Dialogue or Action Line to Refine", height=100, key="refine_input_text_ui") # Unique key
+        refine_instruction = st.text_input("Refinement Instruction", placeholder="e.g., 'Make dialogue tense' or 'Make action concise'", key="refine_instr_ui") # Unique key
+        refine_clicked = st.form_submit_button("Refine Text", key="btn_refine_ui")
+
+    if refine_clicked:
+         refine_text_val = st.session_state.refine_input_text_ui
+         instruction_val = st.session_state.refine_instr_ui
+
+         if refine_text_val and instruction_val:
+             st.info("Refining text via API...")
+             refine_request_data = {
+                 "text_to_refine": refine_text_val,
+                 "instruction": instruction_val
+             }
+             response_data = call_api("POST", f"/projects/{get_state()['project_name']}/script/refine-text", json_data=refine_request_data)
+
+             if "error" not in response_data:
+                  st.session_state.temp_refined_text = response_data.get("text", "")
+                  st.success("Text refined.")
+                  rerun_fragment() # Only this panel shows the refined text
+         else:
+             st.warning("Text and instruction required for refinement.")
+
+    st.text_area(
+        "Refined Text Output",
+        value=st.session_state.temp_refined_text,
+        height=100,
+        key="refined_text_disp_ui", # Unique key
+        help="Copy from here",
+        disabled=True
+    )
+
+
+@st.fragment
+def render_script_tab():
+    """Screenwriting tab."""
+    st.header("Screenwriting")
+    st.markdown("Write your screenplay.")
+
+    state = get_state()
+    project_name = state["project_name"]
+    current_script_state = state.setdefault("script", {})
+    current_concept_state = state.setdefault("concept", {})
+
+    col1, col2 = st.columns(2)
+    with col1:
+        can_generate_outline = (
+             current_concept_state.get("final_synopsis")
+             or current_concept_state.get("chosen_logline")
+        )
+        if st.button("Generate Outline from Synopsis", key="btn_gen_outline_ui", disabled=(not can_generate_outline)): # Unique key
+            # Render the outline as it is generated instead of waiting behind a spinner
+            result_md = st.write_stream(stream_api(f"/projects/{project_name}/script/generate-outline/stream{regenerate_query(current_script_state.get('outline_md'))}"))
+
+            if stream_failed(result_md):
+                st.error(result_md, icon="🚨")
+            else:
+                current_script_state["outline_md"] = result_md
+                st.success("Outline generated.")
+                rerun_fragment() # Only this tab shows the outline
+
+        st.markdown("**Generated Outline:**")
+        st.markdown(current_script_state.get("outline_md", "*No outline generated yet.*"))
+
+        # Bulk drafting goes through the cheaper Batch API; results land in the full script when ready
+        batch_pending = bool(current_script_state.get("batch_job"))
+        if st.button("Draft All Scenes (Batch)", key="btn_draft_all_batch_ui", disabled=(not current_script_state.get("outline_md") or batch_pending)):
+            response_data = call_api("POST", f"/projects/{project_name}/script/draft-all-scenes/batch")
+            if "error" not in response_data:
+                current_script_state["batch_job"] = {"job_id": response_data.get("job_id")}
+                st.success(f"Submitted {response_data.get('scene_count', 0)} scenes as a batch job.")
+                rerun_fragment() # Only this tab shows the batch status
+        if batch_pending:
+            batch_job_status()
+
+    with col2:
+        st.subheader("Draft Scene")
+        with st.form("draft_scene_form"):
+            scene_heading = st.text_input("Scene Heading", placeholder="INT. LOCATION - DAY/NIGHT", key="scene_head_ui") # Unique key
+            scene_desc = st.text_area("Scene Description/Goal", key="scene_desc_ui") # Unique key
+            scene_context = st.text_input("Character Context (Optional)", key="scene_context_ui") # Unique key
+            scene_tone = st.text_input("Scene Tone (Optional)", key="scene_tone_ui") # Unique key
+            draft_scene_clicked = st.form_submit_button("Draft Scene", key="btn_draft_scene_ui")
+
+        if draft_scene_clicked:
+             heading_val = st.session_state.scene_head_ui
+             desc_val = st.session_state.scene_desc_ui
+             context_val = st.session_state.scene_context_ui
+             tone_val = st.session_state.scene_tone_ui
+
+             if heading_val and desc_val:
+                  st.info(f"Drafting scene '{heading_val}' via API...")
+                  draft_request_data = {
+                      "scene_heading": heading_val,
+                      "scene_description": desc_val,
+                      "character_context": context_val,
+                      "tone": tone_val
+                  }
+                  # Render tokens as they arrive instead of waiting for the whole scene
+                  drafted_text = st.write_stream(stream_api(f"/projects/{project_name}/script/draft-scene/stream{regenerate_query(st.session_state.temp_drafted_scene)}", json_data=draft_request_data))
+
+                  if stream_failed(drafted_text):
+                       st.error(drafted_text, icon="🚨")
+                  else:
+                       st.session_state.temp_drafted_scene = drafted_text
+                       st.success("Scene drafted.")
+                       rerun_fragment() # Only this tab shows the drafted scene
+             else:
+                  st.warning("Scene Heading and Description are required.")
+
+        st.text_area(
+            "Drafted Scene Output",
+            value=st.session_state.temp_drafted_scene,
+            height=200,
+            key="drafted_scene_disp_ui", # Unique key
+            help="Copy from here",
+            disabled=True
+        )
+
+
+    render_full_script_editor(current_script_state)
+
+    col_refine, col_analyze = st.columns(2)
+    with col_refine:
+        render_refine_panel()
+
+    with col_analyze:
+        st.markdown("**Analyze Script Issues:**")
+        can_analyze = len(current_script_state.get("full_script_content", "")) >= 50
+        if st.button("Analyze Script Issues", key="btn_analyze_ui", disabled=(not can_analyze)): # Unique key
+            st.info("Analyzing script via API...")
+            response_data = call_api("POST", f"/projects/{project_name}/script/analyze-issues")
+
+            if "error" not in response_data:
+                current_script_state["analysis_md"] = response_data.get("text", "")
+                st.success("Script analysis complete.")
+
+        st.markdown(current_script_state.get("analysis_md", "*No analysis performed yet.*"))
+
+
+@st.fragment
+def render_preprod_tab():
+    """Pre-Production Ideas tab."""
+    st.header("Pre-Production Ideas")
+    st.markdown("Generate visual ideas based on your script and concept.")
+
+    state = get_state()
+    project_name = state["project_name"]
+    current_preprod_state = state.setdefault("pre_production", {})
+    current_concept_state = state.setdefault("concept", {})
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.subheader("Moodboard Ideas")
+        can_generate_moodboard = (
+             current_concept_state.get("chosen_theme")
+             or current_concept_state.get("seed_idea")
+             or current_concept_state.get("final_synopsis")
+        )
+        if st.button("Generate Moodboard Ideas", key="btn_gen_mood_ui", disabled=(not can_generate_moodboard)): # Unique key
+            st.info("Generating moodboard ideas and images via API...")
+            # Each image shows as soon as it is generated; the text ideas follow
+            if stream_preproduction_api(f"/projects/{project_name}/preproduction/generate-moodboard-ideas/stream{regenerate_query(current_preprod_state.get('moodboard_ideas_md'))}", "moodboard"):
+                 st.success("Moodboard ideas generated.")
+                 rerun_fragment() # Redraw the tab with the saved ideas and images below
+
+
+        st.markdown("**Generated Moodboard Text Ideas:**")
+        st.markdown(current_preprod_state.get("moodboard_ideas_md", "*No moodboard text ideas generated yet.*"))
+
+        # Display generated images
+        moodboard_image_parts = current_preprod_state.get("moodboard_images", [])
+        if moodboard_image_parts:
+            st.markdown("**Generated Moodboard Images:**")
+            render_image_parts(moodboard_image_parts, caption="Image")
+
+
+    with col2:
+        st.subheader("Storyboard Shot Ideas")
+
+        # FIX: Clear input text area using flag
+        if st.session_state.clear_sb_input_flag:
+            st.session_state.sb_scene_input_ui = "" # Clear the value tied to the key
+            st.session_state.clear_sb_input_flag = False # Reset the flag
+
+        # A form, so pasting or editing the scene doesn't rerun the tab (and redraw its images) until submit
+        with st.form("storyboard_form", border=False):
+            scene_text_for_sb = st.text_area(
+                "Paste Scene Text Here",
+                value=st.session_state.get("sb_scene_input_ui", ""), # Use .get for safe initial read
+                height=200,
+                key="sb_scene_input_ui" # Unique key
+            )
+            generate_sb_clicked = st.form_submit_button("Generate Storyboard Ideas", key="btn_gen_sb_ui")
+        # END FIX
+
+        if generate_sb_clicked:
+            scene_text_val = st.session_state.sb_scene_input_ui # Read value via key
+
+            # The length check runs on submit; inside a form the button can't follow the text as it's typed
+            if len(scene_text_val.strip()) >= 50: # Needs sufficient length
+                st.info("Generating storyboard ideas and images via API...")
+                # The shot ideas show first, then each image as soon as it is generated
+                if stream_preproduction_api(f"/projects/{project_name}/preproduction/generate-storyboard-ideas/stream{regenerate_query(current_preprod_state.get('storyboard_ideas_md'))}", "storyboard", json_data={"scene_text": scene_text_val}):
+                     st.success("Storyboard ideas generated.")
+                     # Set the clearing flag instead of writing directly
+                     st.session_state.clear_sb_input_flag = True
+                     rerun_fragment() # Redraw the tab with the saved ideas and images below
+
+            else:
+                st.warning("Please paste at least 50 characters of scene text.")
+
+        st.markdown("**Generated Storyboard Text Ideas:**")
+        st.markdown(current_preprod_state.get("storyboard_ideas_md", "*No storyboard text ideas generated yet.*"))
+
+        # Display generated images
+        storyboard_image_parts = current_preprod_state.get("storyboard_images", [])
+        if storyboard_image_parts:
+            st.markdown("**Generated Storyboard Images:**")
+            render_image_parts(storyboard_image_parts, caption="Image")
+
+
+@st.fragment
+def render_log_tab():
+    """Log tab."""
+    st.header("Action Log")
+    log_list = get_state().get("log", ["Log is empty."])
+    # The log only grows at the end (save entries carry timestamps), so reuse the joined text until its tail changes
+    log_key = (len(log_list), log_list[-1] if log_list else None)
+    cached = st.session_state.get("log_joined")
+    if cached is None or cached[0] != log_key:
+        cached = (log_key, "\n".join(log_list)[-LOG_DISPLAY_CHARS:])
+        st.session_state.log_joined = cached
+    st.text_area("Log", value=cached[1], height=600, disabled=True, key="log_display_area_ui") # Unique key
+
+
+# --- Kids Mode ---
+# A fragment, so typing a prompt or generating a comic doesn't rerun the sidebar or the project-state setup.
+@st.fragment
+def render_kids_mode():
+    """The Kids' Comic Creator: prompt input, generation, and the generated parts."""
     st.header("🎨 FilmForge Kids' Comic Creator!")
     st.markdown("Type what you want to see in a comic picture!")
 
@@ -288,15 +1176,15 @@ if st.session_state.mode == "Kids":
 
         if prompt_val.strip():
             st.info(f"Generating comic image for: '{prompt_val}'...")
-            # Call the NEW API endpoint for comic image generation
-            response_data = call_api("POST", "/generate/comic-image", json_data={"prompt": prompt_val})
+            # Show each panel as soon as it is generated instead of waiting for the whole comic
+            st.session_state.kids_image_parts = []
+            for part in stream_parts_api("/generate/comic-image/stream", json_data={"prompt": prompt_val}):
+                st.session_state.kids_image_parts.append(part)
+                render_image_part(len(st.session_state.kids_image_parts) - 1, part)
 
-            if "error" not in response_data:
-                # API returns a list of parts (image/text)
-                st.session_state.kids_image_parts = response_data.get("parts", [])
+            if any(part.get("type") != "error" for part in st.session_state.kids_image_parts):
                 st.success("Comic image generated!")
-                st.rerun() # Rerun to display the images
-            # Error is handled and displayed by call_api
+                rerun_fragment() # Show the finished comic below; nothing outside this fragment changed
         else:
             st.warning("Please enter a prompt to generate a comic image.")
 
@@ -305,25 +1193,15 @@ if st.session_state.mode == "Kids":
     # Display generated images and text parts
     if st.session_state.kids_image_parts:
         st.subheader("Generated Comic:")
-        for i, part in enumerate(st.session_state.kids_image_parts):
-             if part.get("type", "").startswith("image/"):
-                 try:
-                     img_bytes = base64.b64decode(part.get("content"))
-                     img = Image.open(io.BytesIO(img_bytes))
-                     # Optional: Resize images for consistency if needed
-                     # img.thumbnail((800, 800))
-                     st.image(img, caption=f"Part {i+1}", use_column_width=True)
-                 except Exception as e:
-                     st.warning(f"Failed to display image part {i+1}: {e}")
-             elif part.get("type") == "text":
-                 st.write(f"**Text Part {i+1}:**")
-                 st.markdown(part.get("content")) # Use markdown for potential formatting
-             elif part.get("type") == "error":
-                 st.error(f"Image generation part {i+1} failed: {part.get('content')}")
-             else:
-                 st.warning(f"Skipping unknown part type: {part.get('type')}")
+        render_image_parts(st.session_state.kids_image_parts)
 
 
+# --- Main Content Area ---
+
+# Conditional rendering based on mode
+if st.session_state.mode == "Kids":
+    render_kids_mode()
+
 else: # st.session_state.mode == "Pro"
     # --- Pro Mode UI (Existing Tabs) ---
     tab_titles = [
@@ -333,539 +1211,38 @@ else: # st.session_state.mode == "Pro"
         "4. Pre-Production Ideas",
         "Log"
     ]
-    tab1, tab2, tab3, tab4, tab5 = st.tabs(tab_titles) # Unique keys implicitly generated by order/labels
+    # on_change="rerun" makes the tabs track which one is selected, so only the open tab's body runs;
+    # switching tabs reruns the app to render the newly opened one.
+    tab1, tab2, tab3, tab4, tab5 = st.tabs(tab_titles, key="pro_tabs_ui", on_change="rerun")
 
     # Ensure we have a loaded project before displaying most tabs' content in Pro mode
     if get_state().get("project_name") == "Untitled":
         st.info("Please load or create a project using the sidebar to begin.")
     else:
         # --- Tab 1: Concept Development ---
-        with tab1:
-            st.header("Concept Development")
-            st.markdown("Define the core idea of your film.")
-
-            current_concept_state = get_state().get("concept", {}) # Get the concept state from loaded project
-
-            seed_idea = st.text_area(
-                "Seed Idea (Genre, Theme, Logline, Keywords)",
-                value=current_concept_state.get("seed_idea", ""),
-                key="concept_seed_idea_ta_ui" # Unique key for UI element
-            )
-
-            if st.button("Generate Initial Concepts", key="btn_gen_concepts_ui"): # Unique key
-                seed_idea_val = st.session_state.concept_seed_idea_ta_ui
-
-                if seed_idea_val:
-                    st.info("Generating initial concepts via API...")
-                    response_data = call_api("POST", f"/projects/{get_state()['project_name']}/concept/generate-concepts", json_data={"seed_idea": seed_idea_val})
-                    if "error" not in response_data:
-                        if "concept" in st.session_state.project_state:
-                            st.session_state.project_state["concept"]["generated_concepts_md"] = response_data.get("text", "")
-                            st.success("Concepts generated and saved.")
-                            st.rerun()
-                        else:
-                            st.error("API returned success but concept state not found locally.")
-                else:
-                    st.warning("Please enter a seed idea.")
-
-            st.markdown("---")
-            st.markdown("**Generated Concepts:**")
-            st.markdown(get_state().get("concept", {}).get("generated_concepts_md", "*No concepts generated yet.*"))
-            st.markdown("---")
-
-            st.subheader("Refine Your Concept")
-            col1, col2 = st.columns(2)
-            with col1:
-                logline = st.text_input(
-                    "Chosen Logline",
-                    value=current_concept_state.get("chosen_logline", ""),
-                    key="concept_logline_ui" # Unique key
-                )
-
-                theme = st.text_input(
-                    "Chosen Theme",
-                    value=current_concept_state.get("chosen_theme", ""),
-                    key="concept_theme_ui" # Unique key
-                )
-            with col2:
-                framework = st.text_input(
-                    "Chosen Narrative Framework",
-                     value=current_concept_state.get("chosen_framework", "Three-Act Structure"),
-                     key="concept_framework_ui" # Unique key
-                )
-
-                conflict = st.text_input(
-                    "Chosen Central Conflict",
-                    value=current_concept_state.get("chosen_conflict", ""),
-                    key="concept_conflict_ui" # Unique key
-                )
-
-            if st.button("Generate Synopsis & Twists", key="btn_gen_synopsis_ui"): # Unique key
-                logline_val = st.session_state.concept_logline_ui
-                theme_val = st.session_state.concept_theme_ui
-                framework_val = st.session_state.concept_framework_ui
-                conflict_val = st.session_state.concept_conflict_ui
-
-                concept_details_payload = {}
-                if logline_val: concept_details_payload['logline'] = logline_val
-                if framework_val: concept_details_payload['framework'] = framework_val
-                if theme_val: concept_details_payload['theme'] = theme_val
-                if conflict_val: concept_details_payload['conflict'] = conflict_val
-
-
-                if logline_val or theme_val or get_state().get("concept", {}).get("chosen_logline") or get_state().get("concept", {}).get("chosen_theme"):
-                    st.info("Generating synopsis via API...")
-                    response_data = call_api("POST", f"/projects/{get_state()['project_name']}/concept/generate-synopsis", json_data=concept_details_payload)
-
-                    if "error" not in response_data:
-                         if "concept" in st.session_state.project_state:
-                             if 'logline' in concept_details_payload: st.session_state.project_state["concept"]["chosen_logline"] = concept_details_payload['logline']
-                             if 'framework' in concept_details_payload: st.session_state.project_state["concept"]["chosen_framework"] = concept_details_payload['framework']
-                             if 'theme' in concept_details_payload: st.session_state.project_state["concept"]["chosen_theme"] = concept_details_payload['theme']
-                             if 'conflict' in concept_details_payload: st.session_state.project_state["concept"]["chosen_conflict"] = concept_details_payload['conflict']
-
-                             st.session_state.project_state["concept"]["synopsis_md"] = response_data.get("text", "")
-                             final_synopsis = response_data.get("text", "").split("### Potential Twists")[0].strip() if "### Potential Twists" in response_data.get("text", "") else response_data.get("text", "")
-                             st.session_state.project_state["concept"]["final_synopsis"] = final_synopsis
-
-                             st.success("Synopsis generated and saved.")
-                             st.rerun()
-                         else:
-                              st.error("API returned success but concept state not found locally.")
-
-                else:
-                    st.warning("Please provide at least a Logline or Theme.")
-
-            st.markdown("**Generated Synopsis & Twists:**")
-            st.markdown(get_state().get("concept", {}).get("synopsis_md", "*No synopsis generated yet.*"))
-
+        if tab1.open:
+            with tab1:
+                render_concept_tab()
 
         # --- Tab 2: Character Development ---
-        with tab2:
-            st.header("Character Development")
-            st.markdown("Develop your characters.")
-
-            state_chars = get_state().get("characters", {}) # Get the characters state from loaded project
-            char_names = list(state_chars.keys())
-
-            col1, col2 = st.columns([1, 2]) # Adjust column ratios as needed
-
-            with col1:
-                st.subheader("Add/Edit Character")
-                # Use keys to bind inputs to session state
-                char_name_input = st.text_input("Character Name", key="char_name_input_ui")
-                char_role_input = st.text_input("Character Role", placeholder="e.g., Protagonist", key="char_role_input_ui")
-
-                # Attempt to pre-fill profile fields if editing an existing character selected in col2
-                active_char_name = st.session_state.active_char_for_display
-                if active_char_name and active_char_name in state_chars:
-                     active_char_data = state_chars[active_char_name]
-                     # Set the session state values bound to the input field keys
-                     st.session_state.char_name_input_ui = active_char_name
-                     st.session_state.char_role_input_ui = active_char_data.get("role", "")
-                     active_profile = active_char_data.get("profile", {})
-                     st.session_state.char_backstory_ui = active_profile.get("backstory", "")
-                     st.session_state.char_motivation_ui = active_profile.get("motivation", "")
-                     st.session_state.char_flaw_ui = active_profile.get("flaw", "")
-                # Note: If the user changes char_name_input_ui, the link to active_char_for_display is broken
-                # for pre-filling, which is the desired behavior (they are now defining a *new* character).
-
-                if st.button("Suggest Profile Elements", key="btn_suggest_profile_ui"): # Unique key
-                    # Use values from the text inputs (synced by keys)
-                    name_val = st.session_state.char_name_input_ui
-                    role_val = st.session_state.char_role_input_ui
-
-                    if name_val and role_val:
-                        st.info(f"Generating profile ideas for {name_val} via API...")
-                        genre = get_state().get("concept", {}).get("seed_idea", "Unknown Genre")
-                        theme = get_state().get("concept", {}).get("chosen_theme", "General Theme")
-
-                        response_data = call_api("POST", f"/projects/{get_state()['project_name']}/characters/suggest-profile", json_data={"role": role_val, "genre": genre, "theme": theme})
-
-                        if "error" not in response_data:
-                            st.session_state.temp_profile_suggestions = response_data.get("text", "")
-                            st.success("Profile suggestions generated.")
-                    else:
-                        st.warning("Please enter Character Name and Role.")
-
-                # Display temporary suggestions if they exist
-                if st.session_state.temp_profile_suggestions:
-                     with st.expander("Show/Hide Profile Suggestions", expanded=True):
-                          st.markdown(st.session_state.temp_profile_suggestions)
-
-
-                st.markdown("**Define Character Profile:**")
-                # Use keys to sync these text areas to session state
-                backstory = st.text_area("Chosen Backstory", key="char_backstory_ui")
-                motivation = st.text_area("Chosen Motivation", key="char_motivation_ui")
-                flaw = st.text_area("Chosen Flaw", key="char_flaw_ui")
-
-
-                if st.button("Save/Update Character Profile", key="btn_save_char_ui"): # Unique key
-                     # Read values from session state via keys
-                     name_val = st.session_state.char_name_input_ui
-                     role_val = st.session_state.char_role_input_ui
-                     backstory_val = st.session_state.char_backstory_ui
-                     motivation_val = st.session_state.char_motivation_ui
-                     flaw_val = st.session_state.char_flaw_ui
-
-                     if name_val and role_val:
-                          st.info(f"Saving/Updating character '{name_val}' profile via API...")
-                          profile_data = {
-                              "role": role_val,
-                              "profile": {
-                                  "backstory": backstory_val,
-                                  "motivation": motivation_val,
-                                  "flaw": flaw_val
-                              }
-                          }
-                          response_data = call_api("PUT", f"/projects/{get_state()['project_name']}/characters/{name_val}", json_data=profile_data)
-
-                          if "error" not in response_data:
-                               if "characters" not in st.session_state.project_state: st.session_state.project_state["characters"] = {}
-                               st.session_state.project_state["characters"][name_val] = response_data
-                               st.success(f"Character '{name_val}' profile saved via API.")
-                               st.session_state.temp_profile_suggestions = ""
-                               st.session_state.active_char_for_display = name_val
-                               st.rerun()
-                     else:
-                          st.warning("Please enter Character Name and Role.")
-
-            with col2:
-                st.subheader("Explore Arcs & Relationships")
-                current_char_names = list(get_state().get("characters", {}).keys())
-                char_options = ["Select a character..."] + current_char_names
-
-                try:
-                     current_char_index = char_options.index(st.session_state.active_char_for_display) if st.session_state.active_char_for_display in char_options else 0
-                except ValueError:
-                     current_char_index = 0
-
-
-                selected_char_for_arc = st.selectbox(
-                     "Select Character",
-                     options=char_options,
-                     index=current_char_index,
-                     key="char_select_arc_ui" # Unique key
-                )
-
-                if selected_char_for_arc != "Select a character..." and selected_char_for_arc != st.session_state.active_char_for_display:
-                     st.session_state.active_char_for_display = selected_char_for_arc
-                     st.rerun()
-
-                active_char_data_for_display = get_state().get("characters", {}).get(st.session_state.active_char_for_display, {})
-
-                st.markdown("**Character Arc:**")
-                can_generate_arc = (
-                    st.session_state.active_char_for_display
-                    and st.session_state.active_char_for_display in get_state().get("characters", {})
-                    and get_state()["characters"].get(st.session_state.active_char_for_display, {}).get("profile", {}).get("motivation")
-                    and get_state()["characters"].get(st.session_state.active_char_for_display, {}).get("profile", {}).get("flaw")
-                )
-                if st.button("Generate Character Arc", key="btn_gen_arc_ui", disabled=(not can_generate_arc)): # Unique key
-                    char_name_active = st.session_state.active_char_for_display
-                    st.info(f"Generating arc for {char_name_active} via API...")
-                    response_data = call_api("POST", f"/projects/{get_state()['project_name']}/characters/{char_name_active}/generate-arc")
-
-                    if "error" not in response_data:
-                        if "characters" in st.session_state.project_state and char_name_active in st.session_state.project_state["characters"]:
-                            st.session_state.project_state["characters"][char_name_active]["arc_description"] = response_data.get("text", "")
-                            st.success(f"Arc generated for {char_name_active}.")
-                            st.rerun()
-                        else:
-                            st.error(f"API returned success but character '{char_name_active}' state not found locally after update attempt.")
-
-
-                arc_desc = active_char_data_for_display.get("arc_description", "*No arc generated yet.*")
-                st.markdown(arc_desc)
-                st.markdown("---")
-
-                st.markdown("**Relationship Suggestions:**")
-                can_suggest_rels = (
-                     st.session_state.active_char_for_display
-                     and st.session_state.active_char_for_display in get_state().get("characters", {})
-                     and len(get_state().get("characters", {})) > 1
-                )
-                if st.button("Suggest Relationships", key="btn_gen_rels_ui", disabled=(not can_suggest_rels)): # Unique key
-                    char_name_active = st.session_state.active_char_for_display
-                    st.info(f"Generating relationship suggestions for {char_name_active} via API...")
-                    response_data = call_api("POST", f"/projects/{get_state()['project_name']}/characters/{char_name_active}/suggest-relationships")
-
-                    if "error" not in response_data:
-                         if "characters" in st.session_state.project_state and char_name_active in st.session_state.project_state["characters"]:
-                             st.session_state.project_state["characters"][char_name_active]["relationship_suggestions"] = response_data.get("text", "")
-                             st.success(f"Relationship suggestions generated for {char_name_active}.")
-                             st.rerun()
-                         else:
-                              st.error(f"API returned success but character '{char_name_active}' state not found locally after update attempt.")
-
-
-                rel_sugg = active_char_data_for_display.get("relationship_suggestions", "*No relationship suggestions generated yet.*")
-                st.markdown(rel_sugg)
-
+        if tab2.open:
+            with tab2:
+                render_character_tab()
 
         # --- Tab 3: Screenwriting ---
-        with tab3:
-            st.header("Screenwriting")
-            st.markdown("Write your screenplay.")
-
-            current_script_state = get_state().get("script", {})
-
-            col1, col2 = st.columns(2)
-            with col1:
-                can_generate_outline = (
-                     get_state().get("concept", {}).get("final_synopsis")
-                     or get_state().get("concept", {}).get("chosen_logline")
-                )
-                if st.button("Generate Outline from Synopsis", key="btn_gen_outline_ui", disabled=(not can_generate_outline)): # Unique key
-                    st.info("Generating script outline via API...")
-                    response_data = call_api("POST", f"/projects/{get_state()['project_name']}/script/generate-outline")
-
-                    if "error" not in response_data:
-                        if "script" in st.session_state.project_state:
-                             st.session_state.project_state["script"]["outline_md"] = response_data.get("text", "")
-                             st.success("Outline generated.")
-                             st.rerun()
-                        else:
-                             st.error("API returned success but script state not found locally.")
-
-                st.markdown("**Generated Outline:**")
-                st.markdown(current_script_state.get("outline_md", "*No outline generated yet.*"))
-
-            with col2:
-                st.subheader("Draft Scene")
-                scene_heading = st.text_input("Scene Heading", placeholder="INT. LOCATION - DAY/NIGHT", key="scene_head_ui") # Unique key
-                scene_desc = st.text_area("Scene Description/Goal", key="scene_desc_ui") # Unique key
-                scene_context = st.text_input("Character Context (Optional)", key="scene_context_ui") # Unique key
-                scene_tone = st.text_input("Scene Tone (Optional)", key="scene_tone_ui") # Unique key
-
-
-                if st.button("Draft Scene", key="btn_draft_scene_ui"): # Unique key
-                     heading_val = st.session_state.scene_head_ui
-                     desc_val = st.session_state.scene_desc_ui
-                     context_val = st.session_state.scene_context_ui
-                     tone_val = st.session_state.scene_tone_ui
-
-                     if heading_val and desc_val:
-                          st.info(f"Drafting scene '{heading_val}' via API...")
-                          draft_request_data = {
-                              "scene_heading": heading_val,
-                              "scene_description": desc_val,
-                              "character_context": context_val,
-                              "tone": tone_val
-                          }
-                          response_data = call_api("POST", f"/projects/{get_state()['project_name']}/script/draft-scene", json_data=draft_request_data)
-
-                          if "error" not in response_data:
-                               st.session_state.temp_drafted_scene = response_data.get("text", "")
-                               st.success("Scene drafted.")
-                               st.rerun()
-                     else:
-                          st.warning("Scene Heading and Description are required.")
-
-                st.text_area(
-                    "Drafted Scene Output",
-                    value=st.session_state.temp_drafted_scene,
-                    height=200,
-                    key="drafted_scene_disp_ui", # Unique key
-                    help="Copy from here",
-                    disabled=True
-                )
-
-
-            st.markdown("---")
-            st.subheader("Full Script Draft")
-
-            full_script_content = st.text_area(
-                "Script Content (.fountain format recommended)",
-                value=current_script_state.get("full_script_content", ""),
-                height=600,
-                key="script_editor_main_ui"
-            )
-
-            if st.button("Save Full Script Content", key="btn_save_full_script_ui"): # Unique key
-                 st.info("Saving full script content via API...")
-                 script_to_save = st.session_state.script_editor_main_ui
-                 response_data = call_api("PUT", f"/projects/{get_state()['project_name']}/script/full-script", json_data={"full_script_content": script_to_save})
-                 if "error" not in response_data:
-                      st.session_state.project_state["script"]["full_script_content"] = script_to_save
-                      st.success("Full script content saved.")
-
-            col_refine, col_analyze = st.columns(2)
-            with col_refine:
-                st.markdown("**Refine Text:**")
-                text_to_refine = st.text_area("Paste Dialogue or Action Line to Refine", height=100, key="refine_input_text_ui") # Unique key
-                refine_instruction = st.text_input("Refinement Instruction", placeholder="e.g., 'Make dialogue tense' or 'Make action concise'", key="refine_instr_ui") # Unique key
-
-                if st.button("Refine Text", key="btn_refine_ui"): # Unique key
-                     refine_text_val = st.session_state.refine_input_text_ui
-                     instruction_val = st.session_state.refine_instr_ui
-
-                     if refine_text_val and instruction_val:
-                         st.info("Refining text via API...")
-                         refine_request_data = {
-                             "text_to_refine": refine_text_val,
-                             "instruction": instruction_val
-                         }
-                         response_data = call_api("POST", f"/projects/{get_state()['project_name']}/script/refine-text", json_data=refine_request_data)
-
-                         if "error" not in response_data:
-                              st.session_state.temp_refined_text = response_data.get("text", "")
-                              st.success("Text refined.")
-                              st.rerun()
-                     else:
-                         st.warning("Text and instruction required for refinement.")
-
-                st.text_area(
-                    "Refined Text Output",
-                    value=st.session_state.temp_refined_text,
-                    height=100,
-                    key="refined_text_disp_ui", # Unique key
-                    help="Copy from here",
-                    disabled=True
-                )
-
-            with col_analyze:
-                st.markdown("**Analyze Script Issues:**")
-                can_analyze = len(get_state().get("script", {}).get("full_script_content", "")) >= 50
-                if st.button("Analyze Script Issues (Last ~2000 Chars)", key="btn_analyze_ui", disabled=(not can_analyze)): # Unique key
-                    st.info("Analyzing script via API...")
-                    response_data = call_api("POST", f"/projects/{get_state()['project_name']}/script/analyze-issues")
-
-                    if "error" not in response_data:
-                        if "script" in st.session_state.project_state:
-                             st.session_state.project_state["script"]["analysis_md"] = response_data.get("text", "")
-                             st.success("Script analysis complete.")
-                             st.rerun()
-                        else:
-                             st.error("API returned success but script state not found locally.")
-
-                st.markdown(current_script_state.get("analysis_md", "*No analysis performed yet.*"))
+        if tab3.open:
+            with tab3:
+                render_script_tab()
 
         # --- Tab 4: Pre-Production Ideas ---
-        with tab4:
-            st.header("Pre-Production Ideas")
-            st.markdown("Generate visual ideas based on your script and concept.")
-
-            current_preprod_state = get_state().get("pre_production", {})
-
-            col1, col2 = st.columns(2)
-            with col1:
-                st.subheader("Moodboard Ideas")
-                can_generate_moodboard = (
-                     get_state().get("concept", {}).get("chosen_theme")
-                     or get_state().get("concept", {}).get("seed_idea")
-                     or get_state().get("concept", {}).get("final_synopsis")
-                )
-                if st.button("Generate Moodboard Ideas", key="btn_gen_mood_ui", disabled=(not can_generate_moodboard)): # Unique key
-                    st.info("Generating moodboard ideas and images via API...")
-                    response_data = call_api("POST", f"/projects/{get_state()['project_name']}/preproduction/generate-moodboard-ideas")
-
-                    if "error" not in response_data:
-                         if "pre_production" in st.session_state.project_state:
-                            # The API saves state (text ideas and images), but returns only the image parts.
-                            # We need to re-fetch the state to get the updated text ideas markdown and ensure images are fully synced.
-                            # Update images immediately for responsiveness
-                            st.session_state.project_state["pre_production"]["moodboard_images"] = response_data.get("parts", [])
-                            st.success("Moodboard ideas generated.")
-                            load_project_api(get_state()['project_name']) # Re-load state to get latest text ideas and trigger rerun
-                         else:
-                              st.error("API returned success but pre_production state not found locally.")
-
-
-                st.markdown("**Generated Moodboard Text Ideas:**")
-                st.markdown(current_preprod_state.get("moodboard_ideas_md", "*No moodboard text ideas generated yet.*"))
-
-                # Display generated images
-                moodboard_image_parts = current_preprod_state.get("moodboard_images", [])
-                if moodboard_image_parts:
-                    st.markdown("**Generated Moodboard Images:**")
-                    for i, part in enumerate(moodboard_image_parts):
-                        if part.get("type", "").startswith("image/"):
-                            try:
-                                img_bytes = base64.b64decode(part.get("content"))
-                                img = Image.open(io.BytesIO(img_bytes))
-                                st.image(img, caption=f"Image {i+1}", use_column_width=True) # Added caption
-                            except Exception as e:
-                                st.warning(f"Failed to display image part {i+1}: {e}")
-                        elif part.get("type") == "text":
-                            st.write(f"**Text Part {i+1}:**")
-                            st.markdown(part.get("content"))
-                        elif part.get("type") == "error":
-                            st.error(f"Image generation part {i+1} failed: {part.get('content')}")
-                        else:
-                            st.warning(f"Skipping unknown part type {i+1}: {part.get('type')}")
-
-
-            with col2:
-                st.subheader("Storyboard Shot Ideas")
-
-                # FIX: Clear input text area using flag
-                if st.session_state.clear_sb_input_flag:
-                    st.session_state.sb_scene_input_ui = "" # Clear the value tied to the key
-                    st.session_state.clear_sb_input_flag = False # Reset the flag
-
-                scene_text_for_sb = st.text_area(
-                    "Paste Scene Text Here",
-                    value=st.session_state.get("sb_scene_input_ui", ""), # Use .get for safe initial read
-                    height=200,
-                    key="sb_scene_input_ui" # Unique key
-                )
-                # END FIX
-
-                can_generate_storyboard = len(st.session_state.get("sb_scene_input_ui", "").strip()) >= 50 # Needs sufficient length
-                if st.button("Generate Storyboard Ideas", key="btn_gen_sb_ui", disabled=(not can_generate_storyboard)): # Unique key
-                    scene_text_val = st.session_state.sb_scene_input_ui # Read value via key
-
-                    if scene_text_val.strip():
-                        st.info("Generating storyboard ideas and images via API...")
-                        response_data = call_api("POST", f"/projects/{get_state()['project_name']}/preproduction/generate-storyboard-ideas", json_data={"scene_text": scene_text_val})
-
-                        if "error" not in response_data:
-                             if "pre_production" in st.session_state.project_state:
-                                 # API saves state (text ideas and images), but returns only the image parts.
-                                 # We need to re-fetch the state to get the updated text ideas markdown and ensure images are fully synced.
-                                 # Update images immediately for responsiveness
-                                 st.session_state.project_state["pre_production"]["storyboard_images"] = response_data.get("parts", [])
-                                 st.success("Storyboard ideas generated.")
-                                 # Set the clearing flag instead of writing directly
-                                 st.session_state.clear_sb_input_flag = True
-                                 load_project_api(get_state()['project_name']) # Re-load state to get latest text ideas and trigger rerun
-                             else:
-                                  st.error("API returned success but pre_production state not found locally.")
-
-                    else:
-                        st.warning("Please paste scene text.")
-
-                st.markdown("**Generated Storyboard Text Ideas:**")
-                st.markdown(current_preprod_state.get("storyboard_ideas_md", "*No storyboard text ideas generated yet.*"))
-
-                # Display generated images
-                storyboard_image_parts = current_preprod_state.get("storyboard_images", [])
-                if storyboard_image_parts:
-                    st.markdown("**Generated Storyboard Images:**")
-                    for i, part in enumerate(storyboard_image_parts):
-                        if part.get("type", "").startswith("image/"):
-                            try:
-                                img_bytes = base64.b64decode(part.get("content"))
-                                img = Image.open(io.BytesIO(img_bytes))
-                                st.image(img, caption=f"Image {i+1}", use_column_width=True) # Added caption
-                            except Exception as e:
-                                st.warning(f"Failed to display image part {i+1}: {e}")
-                        elif part.get("type") == "text":
-                            st.write(f"**Text Part {i+1}:**")
-                            st.markdown(part.get("content"))
-                        elif part.get("type") == "error":
-                            st.error(f"Image generation part {i+1} failed: {part.get('content')}")
-                        else:
-                            st.warning(f"Skipping unknown part type {i+1}: {part.get('type')}")
-
+        if tab4.open:
+            with tab4:
+                render_preprod_tab()
 
         # --- Tab 5: Log ---
-        with tab5:
-            st.header("Action Log")
-            log_content = "\n".join(get_state().get("log", ["Log is empty."]))
-            st.text_area("Log", value=log_content, height=600, disabled=True, key="log_display_area_ui") # Unique key
+        if tab5.open:
+            with tab5:
+                render_log_tab()
 
 # --- Final check or message if API URL seems off (Optional) ---
 # You could add a visual indicator if API calls consistently fail or latency is high
\ No newline at end of file
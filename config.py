@@ -3,24 +3,29 @@ from dotenv import load_dotenv
 
 load_dotenv() # Load environment variables from a .env file
 
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+# Comma-separated GROQ_API_KEYS spreads calls over several keys, each with its own rate limit; GROQ_API_KEY alone still works
+GROQ_API_KEYS = [key.strip() for key in os.getenv("GROQ_API_KEYS", os.getenv("GROQ_API_KEY") or "").split(",") if key.strip()]
+GROQ_API_KEY = GROQ_API_KEYS[0] if GROQ_API_KEYS else None
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 DEFAULT_MODEL = "llama-3.3-70b-versatile" #"mixtral-8x7b-32768"
+# Model routing: narrow edit/analysis tasks go to a small fast model, open-ended writing to the large one
+FAST_MODEL = "llama-3.1-8b-instant"
+CREATIVE_MODEL = DEFAULT_MODEL
 
-# Base directory for projects
-PROJECTS_BASE_DIR = "filmforge_projects"
-
-# Ensure base project directory exists
-os.makedirs(PROJECTS_BASE_DIR, exist_ok=True)
-
-DEFAULT_PROJECT_STATE = {
-    "project_name": "Untitled",
-    "cleaned_name": "untitled",
-    "current_phase": "Concept",
-    "concept": { "seed_idea": "", "generated_concepts_md": "", "chosen_logline": "", "chosen_framework": "Three-Act Structure", "chosen_theme": "", "chosen_conflict": "", "synopsis_md": "", "final_synopsis": "" },
-    "characters": {},
-    "script": { "outline_md": "", "full_script_content": "", "analysis_md": "" },
-    "pre_production": { "moodboard_ideas_md": "", "storyboard_ideas_md": "", "moodboard_images": [], "storyboard_images": [] }, # Add image storage
-    "last_saved": None,
-    "log": ["Project state initialized."]
-}
\ No newline at end of file
+# Requests per minute allowed per key by your Groq tier (free tier is 30 RPM for most models; raise it on paid tiers)
+GROQ_RPM = int(os.getenv("GROQ_RPM", "30"))
+
+# Most Groq requests a single fan-out (scene drafts, chunk summaries, relationship pairs) keeps open at once
+GROQ_MAX_CONCURRENCY = int(os.getenv("GROQ_MAX_CONCURRENCY", "8"))
+
+# Batch jobs still running after this many minutes are cancelled and finished on the real-time API
+BATCH_TIMEOUT_MIN = int(os.getenv("BATCH_TIMEOUT_MIN", "60"))
+
+# Groq responses cached on disk are reused for this many hours (0 keeps them forever)
+GROQ_CACHE_TTL_HOURS = float(os.getenv("GROQ_CACHE_TTL_HOURS", "24"))
+
+# Near-duplicate prompt cache (needs sentence-transformers and numpy; uses faiss-cpu if installed), off unless enabled
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+
+# Base directory for projects (created by ProjectManager when the backend starts)
+PROJECTS_BASE_DIR = "filmforge_projects"
\ No newline at end of file
@@ -1,30 +1,44 @@
 import os
-from fastapi import FastAPI, HTTPException, Body
+import re
+import time
+import asyncio
+import functools
+import hashlib
+import itertools
+import threading
+import json
+import orjson
+from types import SimpleNamespace
+from collections import OrderedDict
+from fastapi import FastAPI, HTTPException, Body, BackgroundTasks
+from fastapi.concurrency import run_in_threadpool, iterate_in_threadpool
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
 from typing import Dict, List, Optional
 import logging
-from image_generator import generate_image_from_prompt
 # Configure logging for FastAPI and its modules
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__) # Logger for this module
 import datetime
 # --- Project Imports ---
 import config # Ensure config.py is in the same directory or PYTHONPATH
-from project_manager import project_manager, ProjectManager # Import the instance and the class if needed
-from image_generator import generate_image_from_prompt
+import groq_client
+from project_manager import project_manager, ProjectManager, LOG_MAX_ENTRIES, IMAGE_SIDECAR_KEYS # Import the instance and the class if needed
+# image_generator (Google GenAI, Pillow) is slow to import, so the image endpoints import it on first use
 from agents.concept_agent import ConceptAgent
 from agents.character_agent import CharacterCrafterAgent
 from agents.script_agent import ScriptSmithAgent
 from models import (
-    ProjectState, CreateProjectRequest, SaveProjectRequest,
-    ProjectListResponse, SuccessResponse, GeneratedTextResponse,
+    ProjectState, CreateProjectRequest, SaveProjectRequest, PatchProjectRequest,
+    ProjectListResponse, ProjectMetaListResponse, ProjectSaveResponse, SuccessResponse, GeneratedTextResponse, BatchJobResponse,
     GenerateConceptsRequest, GenerateSynopsisRequest,
     CharacterProfileUpdate, SuggestProfileRequest,
     DraftSceneRequest, UpdateScriptContentRequest,
     RefineTextRequest, AnalyzeScriptRequest,
     GenerateStoryboardRequest, GeneratedImageResponse,
-    GenerateMoodboardRequest, CharacterData, CharacterProfile # Import CharacterData and Profile
+    GenerateMoodboardRequest, CharacterData, CharacterProfile, # Import CharacterData and Profile
+    CharacterBundleResponse, ComicPromptRequest
 )
-from models import (ComicPromptRequest,GeneratedImageResponse)
 # --- FastAPI App Setup ---
 app = FastAPI(
     title="FilmForge AI Assistant API",
@@ -33,10 +47,13 @@ app = FastAPI(
 )
 
 # --- Instantiate Agents ---
-# Agents are stateless and can be instantiated once globally
-concept_agent = ConceptAgent()
-character_agent = CharacterCrafterAgent()
-script_agent = ScriptSmithAgent()
+# Agents are stateless; the cached factory pins one shared instance of each per process,
+# so any expensive setup they gain later (clients, indexes) happens once
+@functools.lru_cache(maxsize=1)
+def get_agents() -> SimpleNamespace:
+    return SimpleNamespace(concept=ConceptAgent(), character=CharacterCrafterAgent(), script=ScriptSmithAgent())
+
+concept_agent, character_agent, script_agent = get_agents().concept, get_agents().character, get_agents().script
 
 # --- Dependency (Optional but good practice) ---
 # Could add dependency for ProjectManager if multiple instances were needed,
@@ -46,11 +63,45 @@ script_agent = ScriptSmithAgent()
 
 
 # --- Helper to load and save state within endpoints ---
-def load_project_state_safe(project_name: str) -> ProjectState:
-    """Loads state or raises HTTPException."""
+# Validated state as last loaded/saved, keyed by project name, with the state file's mtime it matches
+# (None while a background save of it is still pending). Spares the re-read and re-validation on the next load.
+_project_cache: "OrderedDict[str, tuple[int | None, ProjectState]]" = OrderedDict()
+PROJECT_CACHE_SIZE = 16
+# Saves are numbered so a background write never replaces a newer state already on disk.
+# _write_lock serializes the file writes and guards the two dicts below.
+_save_seq = itertools.count(1)
+_write_lock = threading.Lock()
+_written_seq: Dict[str, int] = {}
+_written_images: Dict[str, Dict[str, list]] = {} # image lists as they are in each project's sidecar files
+_written_scripts: Dict[str, str] = {} # full script as it is in each project's script file
+
+def _cache_project_state(state: ProjectState, mtime: Optional[int]):
+    _project_cache[state.project_name] = (mtime, state)
+    _project_cache.move_to_end(state.project_name)
+    while len(_project_cache) > PROJECT_CACHE_SIZE:
+        _project_cache.popitem(last=False)
+
+def _read_project_state(project_name: str, with_images: bool) -> ProjectState:
+    return project_manager.load_project_state(project_name, with_images=with_images)
+
+async def load_project_state_safe(project_name: str, with_images: bool = True, read_only: bool = False) -> ProjectState:
+    """Loads state or raises HTTPException. Read-only callers that never touch the pre-production
+    images pass with_images=False to skip reading them; such a state must not be saved.
+    read_only=True (implied by with_images=False) promises not to mutate the state in place."""
+    cached = _project_cache.get(project_name)
+    if cached is not None and (cached[0] is None or cached[0] == project_manager.state_file_mtime(project_name)):
+        _project_cache.move_to_end(project_name)
+        log = (cached[1].log + [f"Project '{project_name}' loaded."])[-LOG_MAX_ENTRIES:]
+        if read_only or not with_images:
+            return cached[1].model_copy(update={"log": log})
+        # Endpoints mutate what they get, so hand out a copy and keep the cached state as saved
+        state = cached[1].model_copy(deep=True)
+        state.log = log
+        return state
+    _project_cache.pop(project_name, None)
     try:
-        state_dict = project_manager.load_project(project_name)
-        return ProjectState(**state_dict) # Validate with Pydantic model
+        # Reading and validating a large state file would stall every other request, so do it in a worker thread
+        state = await run_in_threadpool(_read_project_state, project_name, with_images)
     except FileNotFoundError:
         raise HTTPException(status_code=404, detail=f"Project '{project_name}' not found.")
     except (IOError, json.JSONDecodeError) as e:
@@ -59,20 +110,100 @@ def load_project_state_safe(project_name: str) -> ProjectState:
     except Exception as e:
         logger.exception(f"Unexpected error loading project '{project_name}':")
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred loading project: {e}")
+    if not with_images:
+        return state
+    # Cache a copy without the load's log entry, as the file has it
+    cached_state = state.model_copy(deep=True)
+    cached_state.log = cached_state.log[:-1]
+    with _write_lock:
+        _written_images[project_name] = {
+            key: getattr(cached_state.pre_production, key) for key in IMAGE_SIDECAR_KEYS
+            if project_manager.has_image_file(project_name, key) # older files keep the images inline
+        }
+        if project_manager.has_script_file(project_name): # older files keep the script inline
+            _written_scripts[project_name] = cached_state.script.full_script_content
+        else:
+            _written_scripts.pop(project_name, None)
+    _cache_project_state(cached_state, project_manager.state_file_mtime(project_name))
+    return state
+
+
+def ensure_project_exists(project_name: str):
+    """Raises the same 404 as load_project_state_safe, for endpoints that don't need the state itself."""
+    if project_manager.state_file_mtime(project_name) is None:
+        raise HTTPException(status_code=404, detail=f"Project '{project_name}' not found.")
 
 
-def save_project_state_safe(state: ProjectState) -> ProjectState:
-    """Saves state or raises HTTPException."""
+def _write_project_state(state: ProjectState, seq: int) -> bool:
+    """Writes a stamped state to disk unless a later save already has; raises HTTPException on failure."""
+    project_name = state.project_name
+    with _write_lock:
+        if seq < _written_seq.get(project_name, 0):
+            return False
+        written_images = _written_images.setdefault(project_name, {})
+        # Rewrite an image sidecar only when its list changed since it was last written
+        images = {
+            key: getattr(state.pre_production, key) for key in IMAGE_SIDECAR_KEYS
+            if written_images.get(key) != getattr(state.pre_production, key)
+        }
+        # Same for the full script, which is often the largest text in the state and rarely changes between saves
+        script = state.script.full_script_content
+        if _written_scripts.get(project_name) == script:
+            script = None
+        try:
+            # Let Pydantic serialize straight to JSON, skipping the intermediate dict
+            project_manager.save_project_bytes(
+                project_name,
+                state.model_dump_json(indent=2, exclude={"pre_production": set(IMAGE_SIDECAR_KEYS), "script": {"full_script_content"}}).encode(),
+                images,
+                script,
+            )
+        except (ValueError, IOError) as e:
+            logger.exception(f"Failed to save project '{project_name}':")
+            raise HTTPException(status_code=500, detail=f"Failed to save project '{project_name}': {e}")
+        except Exception as e:
+            logger.exception(f"Unexpected error saving project '{project_name}':")
+            raise HTTPException(status_code=500, detail=f"An unexpected error occurred saving project: {e}")
+        _written_seq[project_name] = seq
+        written_images.update(images)
+        if script is not None:
+            _written_scripts[project_name] = script
+        return True
+
+async def _flush_project_state(state: ProjectState, seq: int):
+    """Writes the state off the event loop, then marks its cache entry as matching the file."""
+    written = await run_in_threadpool(_write_project_state, state, seq)
+    cached = _project_cache.get(state.project_name)
+    if written and cached is not None and cached[1] is state:
+        _project_cache[state.project_name] = (project_manager.state_file_mtime(state.project_name), state)
+
+async def _flush_in_background(state: ProjectState, seq: int):
     try:
-        state_dict = state.model_dump() # Convert Pydantic model to dict
-        saved_state_dict = project_manager.save_project(state_dict)
-        return ProjectState(**saved_state_dict) # Return the updated state (with save time/log)
-    except (ValueError, IOError) as e:
-        logger.exception(f"Failed to save project '{state.project_name}':")
-        raise HTTPException(status_code=500, detail=f"Failed to save project '{state.project_name}': {e}")
-    except Exception as e:
-        logger.exception(f"Unexpected error saving project '{state.project_name}':")
-        raise HTTPException(status_code=500, detail=f"An unexpected error occurred saving project: {e}")
+        await _flush_project_state(state, seq)
+    except HTTPException:
+        pass # Already logged; the cached state stays and goes out with the project's next save
+
+async def save_project_state_safe(state: ProjectState, background_tasks: Optional[BackgroundTasks] = None) -> ProjectState:
+    """Saves state or raises HTTPException. With background_tasks the file is written after the response
+    is sent. Either way loads see the new state straight away, served from the cache until it is on disk."""
+    last_saved = datetime.datetime.now()
+    saved_state = state.model_copy(update={
+        "last_saved": last_saved,
+        "log": (state.log + [f"State saved at {last_saved.isoformat()}"])[-LOG_MAX_ENTRIES:],
+    })
+    seq = next(_save_seq)
+    _cache_project_state(saved_state, None)
+    if background_tasks is not None:
+        background_tasks.add_task(_flush_in_background, saved_state, seq)
+        return saved_state
+    try:
+        await _flush_project_state(saved_state, seq)
+    except HTTPException:
+        cached = _project_cache.get(state.project_name)
+        if cached is not None and cached[1] is saved_state:
+            del _project_cache[state.project_name]
+        raise
+    return saved_state
 
 
 # --- Endpoints ---
@@ -88,12 +219,18 @@ async def list_projects():
     projects = project_manager.get_project_list()
     return {"projects": projects}
 
+# Declared before /projects/{project_name} so "meta" is not taken as a project name
+@app.get("/projects/meta", response_model=ProjectMetaListResponse, summary="List all projects with last-saved times", tags=["Project Management"])
+async def list_projects_with_meta():
+    """Lists all projects together with when each was last saved."""
+    return {"projects": project_manager.get_project_list_with_meta()}
+
 @app.post("/projects", response_model=ProjectState, status_code=201, summary="Create a new project", tags=["Project Management"])
 async def create_project(request: CreateProjectRequest):
     """Creates a new filmforge project."""
     try:
         new_state_dict = project_manager.create_project(request.project_name)
-        return ProjectState(**new_state_dict)
+        return ProjectState.model_validate(new_state_dict)
     except FileExistsError:
         raise HTTPException(status_code=409, detail=f"Project '{request.project_name}' already exists.")
     except ValueError as e:
@@ -105,7 +242,7 @@ async def create_project(request: CreateProjectRequest):
 @app.get("/projects/{project_name}", response_model=ProjectState, summary="Load a project", tags=["Project Management"])
 async def load_project(project_name: str):
     """Loads the state of a specific project."""
-    return load_project_state_safe(project_name)
+    return await load_project_state_safe(project_name, read_only=True)
 
 @app.put("/projects/{project_name}", response_model=ProjectState, summary="Save project state", tags=["Project Management"])
 async def save_project(project_name: str, state: SaveProjectRequest):
@@ -115,19 +252,56 @@ async def save_project(project_name: str, state: SaveProjectRequest):
 
     # Optional: Load existing state first if you need to merge instead of overwrite
     try:
-        existing_state = load_project_state_safe(project_name)
+        existing_state = await load_project_state_safe(project_name, read_only=True) # only read, no copy needed
+        # The pending batch job is owned by the server; a client save must not drop or resurrect it
+        state.script.batch_job = existing_state.script.batch_job
+        # Likewise the analysis memo, which only holds while the analysis it was computed for is unchanged
+        state.script.analyzed_excerpt_hash = existing_state.script.analyzed_excerpt_hash if state.script.analysis_md == existing_state.script.analysis_md else None
         # Merge logic if needed, e.g., preserving log entries not in the request state
-        state.log = existing_state.log + [f"State received for save at {datetime.now().isoformat()}"] # Example
+        state.log = existing_state.log + [f"State received for save at {datetime.datetime.now().isoformat()}"] # Example
     except HTTPException as e:
          if e.status_code != 404: raise e # Re-raise if not just not found
          # If 404, it's a new save, proceed with the provided state
 
-    return save_project_state_safe(state)
+    return await save_project_state_safe(state)
+
+@app.patch("/projects/{project_name}", response_model=ProjectSaveResponse, summary="Save changed parts of a project state", tags=["Project Management"])
+async def patch_project(project_name: str, request: PatchProjectRequest):
+    """Merges the changed sections/fields sent by the client into the saved state and saves it."""
+    existing = (await load_project_state_safe(project_name, read_only=True)).model_dump() # model_dump already copies
+
+    # The batch job and analysis memo are server-owned, as in the full save
+    script_changes = request.changes.get("script")
+    if isinstance(script_changes, dict):
+        script_changes.pop("batch_job", None)
+        script_changes.pop("analyzed_excerpt_hash", None)
+        if "analysis_md" in script_changes and script_changes["analysis_md"] != existing["script"]["analysis_md"]:
+            existing["script"]["analyzed_excerpt_hash"] = None
+
+    for section, value in request.changes.items():
+        if section in ("project_name", "cleaned_name", "last_saved", "log"):
+            continue
+        if isinstance(existing.get(section), dict) and isinstance(value, dict):
+            existing[section].update(value)
+        else:
+            existing[section] = value
+
+    try:
+        state = ProjectState.model_validate(existing)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=f"Invalid project changes: {e}")
+
+    return await save_project_state_safe(state)
 
 @app.delete("/projects/{project_name}", response_model=SuccessResponse, summary="Delete a project", tags=["Project Management"])
 async def delete_project(project_name: str):
     """Deletes a project."""
     try:
+        _project_cache.pop(project_name, None)
+        with _write_lock:
+            _written_seq[project_name] = next(_save_seq) # drops saves still pending for the deleted project
+            _written_images.pop(project_name, None)
+            _written_scripts.pop(project_name, None)
         deleted = project_manager.delete_project(project_name)
         if not deleted:
              raise HTTPException(status_code=404, detail=f"Project '{project_name}' not found.")
@@ -139,27 +313,35 @@ async def delete_project(project_name: str):
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred deleting project: {e}")
 
 
+# --- Maintenance Endpoints ---
+@app.post("/maintenance/clear-cache", response_model=SuccessResponse, summary="Clear the Groq response cache", tags=["Maintenance"])
+async def clear_response_cache():
+    """Drops every cached Groq response: in memory, on disk and near-duplicate (semantic)."""
+    dropped = groq_client.clear_cache()
+    return {"message": f"Cleared {dropped} cached responses."}
+
+
 # --- Concept Development Endpoints ---
+# Generate endpoints take ?regenerate=true to skip cached Groq responses, so regenerating gives new output
 @app.post("/projects/{project_name}/concept/generate-concepts", response_model=GeneratedTextResponse, summary="Generate initial concepts", tags=["Concept Development"])
-async def generate_initial_concepts(project_name: str, request: GenerateConceptsRequest):
+async def generate_initial_concepts(project_name: str, request: GenerateConceptsRequest, background_tasks: BackgroundTasks, regenerate: bool = False):
     """Generates initial loglines, frameworks, themes, and conflicts."""
-    state = load_project_state_safe(project_name)
-    result_md = concept_agent.generate_initial_concepts(request.seed_idea)
+    state = await load_project_state_safe(project_name)
+    # Sync agent calls go to the threadpool so a slow Groq call doesn't stall every other request on the event loop
+    result_md = await run_in_threadpool(concept_agent.generate_initial_concepts, request.seed_idea, bypass_cache=regenerate)
 
-    if "Error:" in result_md:
+    if result_md.startswith("Error:"):
         raise HTTPException(status_code=500, detail=result_md)
 
     # Update state and save
     state.concept.seed_idea = request.seed_idea
     state.concept.generated_concepts_md = result_md
-    save_project_state_safe(state)
+    await save_project_state_safe(state, background_tasks)
 
     return {"text": result_md}
 
-@app.post("/projects/{project_name}/concept/generate-synopsis", response_model=GeneratedTextResponse, summary="Generate synopsis", tags=["Concept Development"])
-async def generate_synopsis(project_name: str, request: GenerateSynopsisRequest):
-    """Generates a synopsis based on chosen concept elements."""
-    state = load_project_state_safe(project_name)
+def _synopsis_concept_details(state: ProjectState, request: GenerateSynopsisRequest) -> dict:
+    """Request fields, falling back to the saved choices; raises 400 if neither logline nor theme is known."""
     concept_details = request.model_dump(exclude_none=True) # Only include fields explicitly set
 
     # Use existing state values as defaults if not provided in the request body
@@ -175,12 +357,9 @@ async def generate_synopsis(project_name: str, request: GenerateSynopsisRequest)
 
     if not concept_details.get('logline') and not concept_details.get('theme'):
          raise HTTPException(status_code=400, detail="At least 'logline' or 'theme' must be provided or exist in the current state.")
+    return concept_details
 
-    result_md = concept_agent.generate_synopsis(concept_details)
-
-    if "Error:" in result_md:
-        raise HTTPException(status_code=500, detail=result_md)
-
+def _apply_synopsis(state: ProjectState, concept_details: dict, result_md: str):
     # Update state with chosen fields if provided, otherwise keep existing
     state.concept.chosen_logline = concept_details.get('logline') or state.concept.chosen_logline
     state.concept.chosen_framework = concept_details.get('framework') or state.concept.chosen_framework
@@ -189,40 +368,79 @@ async def generate_synopsis(project_name: str, request: GenerateSynopsisRequest)
     state.concept.synopsis_md = result_md
 
     # Extract final synopsis without twists for other agents
-    final_synopsis = result_md.split("### Potential Twists")[0].strip() if "### Potential Twists" in result_md else result_md
-    state.concept.final_synopsis = final_synopsis
+    twists_at = result_md.find("### Potential Twists") # one scan; the heading appears at most once
+    state.concept.final_synopsis = result_md[:twists_at].strip() if twists_at >= 0 else result_md
+
+@app.post("/projects/{project_name}/concept/generate-synopsis", response_model=GeneratedTextResponse, summary="Generate synopsis", tags=["Concept Development"])
+async def generate_synopsis(project_name: str, request: GenerateSynopsisRequest, background_tasks: BackgroundTasks, regenerate: bool = False):
+    """Generates a synopsis based on chosen concept elements."""
+    state = await load_project_state_safe(project_name)
+    concept_details = _synopsis_concept_details(state, request)
+
+    result_md = await concept_agent.a_generate_synopsis(concept_details, bypass_cache=regenerate)
+
+    if result_md.startswith("Error:"):
+        raise HTTPException(status_code=500, detail=result_md)
 
-    save_project_state_safe(state)
+    _apply_synopsis(state, concept_details, result_md)
+    await save_project_state_safe(state, background_tasks)
 
     return {"text": result_md}
 
+@app.post("/projects/{project_name}/concept/generate-synopsis/stream", summary="Generate synopsis, streamed as plain text", tags=["Concept Development"])
+async def generate_synopsis_stream(project_name: str, request: GenerateSynopsisRequest, regenerate: bool = False):
+    """Same as generate-synopsis, but streams the text as it is generated and saves it once complete."""
+    state = await load_project_state_safe(project_name)
+    concept_details = _synopsis_concept_details(state, request)
+    text_stream = concept_agent.stream_synopsis(concept_details, bypass_cache=regenerate)
+
+    async def stream_and_save():
+        parts = []
+        async for chunk in iterate_in_threadpool(text_stream):
+            parts.append(chunk)
+            yield chunk
+        result_md = "".join(parts)
+        if groq_client.stream_failed(result_md): # A stream can fail after some text was already sent
+            return # Already shown to the client inside the stream; nothing to save
+        _apply_synopsis(state, concept_details, result_md)
+        try:
+            await save_project_state_safe(state)
+        except HTTPException as e: # Headers are already sent, so the failure can only be logged
+            logger.error(f"Streamed synopsis for '{project_name}' could not be saved: {e.detail}")
+
+    return StreamingResponse(stream_and_save(), media_type="text/plain; charset=utf-8")
+
 
 # --- Character Development Endpoints ---
 @app.get("/projects/{project_name}/characters", response_model=Dict[str, CharacterData], summary="Get all characters", tags=["Character Development"])
 async def get_all_characters(project_name: str):
     """Retrieves all character data for a project."""
-    state = load_project_state_safe(project_name)
+    state = await load_project_state_safe(project_name, with_images=False)
     return state.characters
 
 @app.post("/projects/{project_name}/characters/suggest-profile", response_model=GeneratedTextResponse, summary="Suggest character profile elements", tags=["Character Development"])
-async def suggest_character_profile(project_name: str, request: SuggestProfileRequest):
+async def suggest_character_profile(project_name: str, request: SuggestProfileRequest, regenerate: bool = False):
     """Suggests backstory, motivation, and flaw ideas for a character role."""
-    state = load_project_state_safe(project_name) # Load state to get genre/theme context
+    state = await load_project_state_safe(project_name, with_images=False) # Load state to get genre/theme context
     genre = state.concept.seed_idea # Using seed_idea as a proxy for genre
     theme = state.concept.chosen_theme
 
-    result_md = character_agent.suggest_profile_elements(request.role, genre, theme)
+    result_md = await run_in_threadpool(character_agent.suggest_profile_elements, request.role, genre, theme, bypass_cache=regenerate)
 
-    if "Error:" in result_md:
+    if result_md.startswith("Error:"):
         raise HTTPException(status_code=500, detail=result_md)
 
     # Note: This endpoint does NOT save to state, it's just a suggestion tool.
     return {"text": result_md}
 
+def _other_character_roles(state: ProjectState, char_name: str) -> list:
+    """Roles of every other character that has one, in a single pass over the characters."""
+    return [data.role for name, data in state.characters.items() if data.role and name != char_name]
+
 @app.put("/projects/{project_name}/characters/{char_name}", response_model=CharacterData, summary="Save/Update character profile", tags=["Character Development"])
 async def save_character_profile(project_name: str, char_name: str, character_update: CharacterProfileUpdate):
     """Saves or updates a character's profile."""
-    state = load_project_state_safe(project_name)
+    state = await load_project_state_safe(project_name)
 
     # Ensure character exists or initialize if new
     if char_name not in state.characters:
@@ -234,14 +452,14 @@ async def save_character_profile(project_name: str, char_name: str, character_up
     # Update profile fields
     state.characters[char_name].profile = character_update.profile # Overwrite profile or use defaults from model
 
-    save_project_state_safe(state)
+    await save_project_state_safe(state)
 
     return state.characters[char_name] # Return the saved character data
 
 @app.post("/projects/{project_name}/characters/{char_name}/generate-arc", response_model=GeneratedTextResponse, summary="Generate character arc", tags=["Character Development"])
-async def generate_character_arc(project_name: str, char_name: str):
+async def generate_character_arc(project_name: str, char_name: str, background_tasks: BackgroundTasks, regenerate: bool = False):
     """Generates a character arc based on their profile and the project's framework."""
-    state = load_project_state_safe(project_name)
+    state = await load_project_state_safe(project_name)
 
     if char_name not in state.characters:
         raise HTTPException(status_code=404, detail=f"Character '{char_name}' not found.")
@@ -252,54 +470,111 @@ async def generate_character_arc(project_name: str, char_name: str):
 
     framework = state.concept.chosen_framework
 
-    result_md = character_agent.map_character_arc(char_data.profile.model_dump(), framework) # Pass profile dict
+    result_md = await character_agent.a_map_character_arc(char_data.profile.model_dump(), framework, state.project_name, bypass_cache=regenerate)
 
-    if "Error:" in result_md:
+    if result_md.startswith("Error:"):
         raise HTTPException(status_code=500, detail=result_md)
 
     # Update state and save
     state.characters[char_name].arc_description = result_md
-    save_project_state_safe(state)
+    await save_project_state_safe(state, background_tasks)
 
     return {"text": result_md}
 
+@app.post("/projects/{project_name}/characters/regenerate-arcs", response_model=Dict[str, CharacterData], summary="Regenerate every character's arc", tags=["Character Development"])
+async def regenerate_all_character_arcs(project_name: str, background_tasks: BackgroundTasks):
+    """Regenerates arcs for all characters with a motivation and flaw, concurrently; never returns cached arcs."""
+    state = await load_project_state_safe(project_name)
+    framework = state.concept.chosen_framework
+
+    eligible = [name for name, char_data in state.characters.items() if char_data.profile.motivation and char_data.profile.flaw]
+    if not eligible:
+        raise HTTPException(status_code=400, detail="No characters have both motivation and flaw defined.")
+
+    results = await asyncio.gather(*[
+        character_agent.a_map_character_arc(state.characters[name].profile.model_dump(), framework, state.project_name, bypass_cache=True)
+        for name in eligible
+    ])
+
+    errors = [result for result in results if result.startswith("Error:")]
+    for name, result in zip(eligible, results):
+        if not result.startswith("Error:"):
+            state.characters[name].arc_description = result
+    if len(errors) == len(results):
+        raise HTTPException(status_code=500, detail=errors[0])
+    await save_project_state_safe(state, background_tasks)
+
+    return state.characters
+
 @app.post("/projects/{project_name}/characters/{char_name}/suggest-relationships", response_model=GeneratedTextResponse, summary="Suggest relationships", tags=["Character Development"])
-async def suggest_relationships(project_name: str, char_name: str):
+async def suggest_relationships(project_name: str, char_name: str, background_tasks: BackgroundTasks, regenerate: bool = False):
     """Suggests relationships between a character and other characters in the project."""
-    state = load_project_state_safe(project_name)
+    state = await load_project_state_safe(project_name)
 
     if char_name not in state.characters:
         raise HTTPException(status_code=404, detail=f"Character '{char_name}' not found.")
 
     primary_char_data = state.characters[char_name]
     # Get roles of other characters
-    other_char_roles = [
-        char_data.role for name, char_data in state.characters.items()
-        if name != char_name and char_data.role
-    ]
+    other_char_roles = _other_character_roles(state, char_name)
 
     if not other_char_roles:
          return {"text": "No other characters defined to suggest relationships with."}
 
 
-    result_md = character_agent.suggest_relationships(primary_char_data.model_dump(), other_char_roles) # Pass primary char dict
+    # One concurrent Groq call per (character, other role) pair
+    # Only the fields the relationship prompt reads; motivation/flaw sit under profile on the model
+    primary_char_profile = {"role": primary_char_data.role, "motivation": primary_char_data.profile.motivation, "flaw": primary_char_data.profile.flaw}
+    result_md = await character_agent.a_suggest_relationships(primary_char_profile, other_char_roles, bypass_cache=regenerate)
 
-    if "Error:" in result_md:
+    if result_md.startswith("Error:"):
         raise HTTPException(status_code=500, detail=result_md)
 
     # Update state and save
     state.characters[char_name].relationship_suggestions = result_md
-    save_project_state_safe(state)
+    await save_project_state_safe(state, background_tasks)
 
     return {"text": result_md}
 
 
-# --- Screenwriting Endpoints ---
-@app.post("/projects/{project_name}/script/generate-outline", response_model=GeneratedTextResponse, summary="Generate script outline", tags=["Screenwriting"])
-async def generate_script_outline(project_name: str):
-    """Generates a script outline from the project's synopsis."""
-    state = load_project_state_safe(project_name)
+@app.post("/projects/{project_name}/characters/{char_name}/generate-bundle", response_model=CharacterBundleResponse, summary="Generate profile ideas, arc and relationships in one call", tags=["Character Development"])
+async def generate_character_bundle(project_name: str, char_name: str, background_tasks: BackgroundTasks, regenerate: bool = False):
+    """Generates profile suggestions, arc, and relationship ideas for a character with a single LLM call."""
+    state = await load_project_state_safe(project_name)
+
+    if char_name not in state.characters:
+        raise HTTPException(status_code=404, detail=f"Character '{char_name}' not found.")
+
+    char_data = state.characters[char_name]
+    other_char_roles = _other_character_roles(state, char_name)
+
+    bundle = await run_in_threadpool(
+        character_agent.build_character_bundle,
+        char_data.role,
+        state.concept.seed_idea, # Using seed_idea as a proxy for genre
+        state.concept.chosen_theme,
+        char_data.profile.model_dump(),
+        other_char_roles,
+        state.concept.chosen_framework,
+        bypass_cache=regenerate
+    )
+
+    if "error" in bundle:
+        raise HTTPException(status_code=500, detail=bundle["error"])
 
+    # Persist the sections that belong to the character; profile ideas are suggestions only
+    if bundle.get("arc_description"):
+        state.characters[char_name].arc_description = bundle["arc_description"]
+    if bundle.get("relationship_suggestions"):
+        state.characters[char_name].relationship_suggestions = bundle["relationship_suggestions"]
+    await save_project_state_safe(state, background_tasks)
+
+    return CharacterBundleResponse(**bundle)
+
+
+# --- Screenwriting Endpoints ---
+def _outline_synopsis(state: ProjectState) -> str:
+    """Picks the text an outline is built from; raises HTTPException if there is none."""
     synopsis = state.concept.final_synopsis # Use the potentially trimmed synopsis
     if not synopsis:
         # Fallback to logline if no synopsis generated yet
@@ -307,113 +582,265 @@ async def generate_script_outline(project_name: str):
 
     if not synopsis:
         raise HTTPException(status_code=400, detail="Cannot generate outline without a synopsis or logline.")
+    return synopsis
 
+@app.post("/projects/{project_name}/script/generate-outline", response_model=GeneratedTextResponse, summary="Generate script outline", tags=["Screenwriting"])
+async def generate_script_outline(project_name: str, background_tasks: BackgroundTasks, regenerate: bool = False):
+    """Generates a script outline from the project's synopsis."""
+    state = await load_project_state_safe(project_name)
+    synopsis = _outline_synopsis(state)
     framework = state.concept.chosen_framework
 
-    result_md = script_agent.generate_outline(synopsis, framework)
+    result_md = await run_in_threadpool(script_agent.generate_outline, synopsis, framework, bypass_cache=regenerate)
 
-    if "Error:" in result_md:
+    if result_md.startswith("Error:"):
         raise HTTPException(status_code=500, detail=result_md)
 
     # Update state and save
     state.script.outline_md = result_md
-    save_project_state_safe(state)
+    await save_project_state_safe(state, background_tasks)
 
     return {"text": result_md}
 
+@app.post("/projects/{project_name}/script/generate-outline/stream", summary="Generate script outline, streamed as plain text", tags=["Screenwriting"])
+async def generate_script_outline_stream(project_name: str, regenerate: bool = False):
+    """Same as generate-outline, but streams the text as it is generated and saves it once complete."""
+    state = await load_project_state_safe(project_name)
+    text_stream = script_agent.stream_outline(_outline_synopsis(state), state.concept.chosen_framework, bypass_cache=regenerate)
+
+    async def stream_and_save():
+        parts = []
+        async for chunk in iterate_in_threadpool(text_stream):
+            parts.append(chunk)
+            yield chunk
+        result_md = "".join(parts)
+        if groq_client.stream_failed(result_md): # A stream can fail after some text was already sent
+            return # Already shown to the client inside the stream; nothing to save
+        state.script.outline_md = result_md
+        try:
+            await save_project_state_safe(state)
+        except HTTPException as e: # Headers are already sent, so the failure can only be logged
+            logger.error(f"Streamed outline for '{project_name}' could not be saved: {e.detail}")
+
+    return StreamingResponse(stream_and_save(), media_type="text/plain; charset=utf-8")
+
 @app.post("/projects/{project_name}/script/draft-scene", response_model=GeneratedTextResponse, summary="Draft a scene", tags=["Screenwriting"])
-async def draft_scene(project_name: str, request: DraftSceneRequest):
+async def draft_scene(project_name: str, request: DraftSceneRequest, regenerate: bool = False):
     """Drafts a single scene based on heading, description, and context."""
-    # No need to load/save full state for drafting a single scene, it's output for user to copy
-    # However, agents might need context from state later (e.g., character list for dialogue cues),
-    # so maybe loading state for context is good practice, just don't save the result here.
-    # Let's load state to potentially pass character list or other context if agent evolves
-    state = load_project_state_safe(project_name)
-    # Currently agents don't use full state context for drafting, so just call agent
-
-    result_text = script_agent.draft_scene(
+    # No need to load/save state for drafting a single scene, it's output for user to copy.
+    # If the agent ever needs project context (e.g., character list for dialogue cues), load it here.
+    ensure_project_exists(project_name)
+
+    result_text = await run_in_threadpool(
+        script_agent.draft_scene,
         request.scene_heading,
         request.scene_description,
         request.character_context,
-        request.tone
+        request.tone,
+        bypass_cache=regenerate
     )
 
-    if "Error:" in result_text:
+    if result_text.startswith("Error:"):
         raise HTTPException(status_code=500, detail=result_text)
 
     # Do NOT save this result to project state as it's temporary output
     return {"text": result_text}
 
+@app.post("/projects/{project_name}/script/draft-scene/stream", summary="Draft a scene, streamed as plain text", tags=["Screenwriting"])
+async def draft_scene_stream(project_name: str, request: DraftSceneRequest, regenerate: bool = False):
+    """Same as draft-scene, but streams the scene text chunk by chunk as it is generated."""
+    ensure_project_exists(project_name) # 404 before we start streaming
+
+    # Errors arrive inside the stream as an "Error: ..." chunk, since the 200 status is already sent
+    text_stream = script_agent.stream_draft_scene(
+        request.scene_heading,
+        request.scene_description,
+        request.character_context,
+        request.tone,
+        bypass_cache=regenerate
+    )
+    return StreamingResponse(text_stream, media_type="text/plain; charset=utf-8")
+
+def _append_drafted_scenes(state: ProjectState, scenes: list, drafts: list) -> str:
+    """Appends batch/fan-out scene drafts to the full script; failed scenes become Fountain notes."""
+    parts = []
+    for (heading, _), draft in zip(scenes, drafts):
+        parts.append(f"[[Draft failed for {heading}: {draft}]]" if draft.startswith("Error:") else draft.strip())
+    drafted = "\n\n".join(parts)
+    existing = state.script.full_script_content.rstrip()
+    state.script.full_script_content = f"{existing}\n\n{drafted}" if existing else drafted
+    state.script.batch_job = None
+    return drafted
+
+@app.post("/projects/{project_name}/script/draft-all-scenes/batch", response_model=BatchJobResponse, summary="Draft every outline scene as a Groq batch job", tags=["Screenwriting"])
+async def submit_draft_all_scenes(project_name: str):
+    """Submits a draft for each scene in the saved outline via the Groq Batch API; poll with GET."""
+    state = await load_project_state_safe(project_name)
+    if state.script.batch_job:
+        raise HTTPException(status_code=409, detail="A batch job for this project is already running.")
+
+    scenes = script_agent.parse_outline_scenes(state.script.outline_md)
+    if not scenes:
+        raise HTTPException(status_code=400, detail="No numbered scene headings found in the outline. Generate an outline first.")
+
+    character_context = f"Characters: {', '.join(state.characters)}" if state.characters else ""
+    job_id = await run_in_threadpool(script_agent.submit_scene_drafts_batch, scenes, character_context)
+    if job_id.startswith("Error:"):
+        raise HTTPException(status_code=500, detail=job_id)
+
+    state.script.batch_job = {
+        "job_id": job_id,
+        "submitted_at": time.time(),
+        "scenes": [list(scene) for scene in scenes],
+        "character_context": character_context,
+    }
+    await save_project_state_safe(state)
+    return {"status": "submitted", "job_id": job_id, "scene_count": len(scenes)}
+
+@app.get("/projects/{project_name}/script/draft-all-scenes/batch", response_model=BatchJobResponse, summary="Poll the draft-all-scenes batch job", tags=["Screenwriting"])
+async def poll_draft_all_scenes(project_name: str):
+    """Checks the batch job; when finished (or timed out, then redone in real time) appends the drafts to the script."""
+    state = await load_project_state_safe(project_name)
+    job = state.script.batch_job
+    if not job:
+        raise HTTPException(status_code=404, detail="No batch job is running for this project.")
+
+    scenes = [tuple(scene) for scene in job["scenes"]]
+    result = await run_in_threadpool(groq_client.get_batch_results, job["job_id"], len(scenes))
+    if result["status"] == "completed":
+        drafted = _append_drafted_scenes(state, scenes, result["results"])
+        await save_project_state_safe(state)
+        return {"status": "completed", "job_id": job["job_id"], "scene_count": len(scenes), "text": drafted}
+
+    timed_out = time.time() - job["submitted_at"] > config.BATCH_TIMEOUT_MIN * 60
+    if result["status"] in ("failed", "expired", "cancelled") or timed_out:
+        # Batch is too slow or gone: cancel it and fall back to concurrent real-time calls
+        logger.warning(f"Batch {job['job_id']} for '{project_name}' ended as '{result['status']}' (timed out: {timed_out}), drafting in real time.")
+        if timed_out:
+            await run_in_threadpool(groq_client.cancel_batch, job["job_id"])
+        drafts = await script_agent.a_draft_scenes(scenes, job.get("character_context", ""))
+        drafted = _append_drafted_scenes(state, scenes, drafts)
+        await save_project_state_safe(state)
+        return {"status": "completed_realtime", "job_id": job["job_id"], "scene_count": len(scenes), "text": drafted}
+
+    # Still running (or a transient polling error): the client keeps polling
+    return {"status": result["status"], "job_id": job["job_id"], "scene_count": len(scenes)}
+
 @app.put("/projects/{project_name}/script/full-script", response_model=SuccessResponse, summary="Update full script content", tags=["Screenwriting"])
 async def update_full_script(project_name: str, request: UpdateScriptContentRequest):
     """Updates the full script content for the project."""
-    state = load_project_state_safe(project_name)
+    state = await load_project_state_safe(project_name)
 
     state.script.full_script_content = request.full_script_content
-    save_project_state_safe(state)
+    await save_project_state_safe(state)
 
     return {"message": "Full script content updated successfully."}
 
+# Instruction keywords that pick the refine agent, matched case-insensitively anywhere in the instruction
+_DIALOGUE_INSTRUCTION_RE = re.compile(r"dialogue|tense|emotional|funny|serious", re.IGNORECASE) # Add more tones
+_ACTION_INSTRUCTION_RE = re.compile(r"concise|action", re.IGNORECASE)
+
 @app.post("/projects/{project_name}/script/refine-text", response_model=GeneratedTextResponse, summary="Refine text snippet", tags=["Screenwriting"])
 async def refine_text_snippet(project_name: str, request: RefineTextRequest):
     """Refines a text snippet (dialogue or action) based on instruction."""
     # No need to load/save state for refinement, it's output for user to copy
-    # Load state potentially for context (e.g., character names for dialogue check)
-    state = load_project_state_safe(project_name)
+    ensure_project_exists(project_name)
 
     result_text = "Error: Could not determine refinement type."
     # Basic logic to guess dialogue vs action or rely solely on instruction
     # Let's refine the logic slightly: if instruction mentions 'dialogue' or looks like a tone, use dialogue agent.
     # If instruction mentions 'concise' or 'action', use action agent. Otherwise, use generic.
-    instruction_lower = request.instruction.lower()
     # Simple heuristic: check if input contains potential character cue lines? Or just rely on instruction?
     # Relying on instruction is clearer for the API contract.
-    if 'dialogue' in instruction_lower or any(tone in instruction_lower for tone in ['tense', 'emotional', 'funny', 'serious']): # Add more tones
-         result_text = script_agent.refine_dialogue_tone(request.text_to_refine, request.instruction)
-    elif 'concise' in instruction_lower or 'action' in instruction_lower:
-         result_text = script_agent.refine_action_conciseness(request.text_to_refine)
+    if _DIALOGUE_INSTRUCTION_RE.search(request.instruction):
+         result_text = await run_in_threadpool(script_agent.refine_dialogue_tone, request.text_to_refine, request.instruction)
+    elif _ACTION_INSTRUCTION_RE.search(request.instruction):
+         result_text = await run_in_threadpool(script_agent.refine_action_conciseness, request.text_to_refine)
     else:
          # Generic fallback - requires a generic call_groq wrapper or agent method
          # For now, let's just use dialogue refine as a generic text refine if unsure
          # TODO: Add a proper generic refine method to ScriptSmithAgent if needed
-         result_text = script_agent.refine_dialogue_tone(request.text_to_refine, request.instruction) # Misleading method name for generic refine
+         result_text = await run_in_threadpool(script_agent.refine_dialogue_tone, request.text_to_refine, request.instruction) # Misleading method name for generic refine
 
 
-    if "Error:" in result_text:
+    if result_text.startswith("Error:"):
         raise HTTPException(status_code=500, detail=result_text)
 
     # Do NOT save this result to project state
     return {"text": result_text}
 
 @app.post("/projects/{project_name}/script/analyze-issues", response_model=GeneratedTextResponse, summary="Analyze script issues", tags=["Screenwriting"])
-async def analyze_script_issues(project_name: str):
-    """Analyzes the last part of the full script content for potential issues."""
-    state = load_project_state_safe(project_name)
+async def analyze_script_issues(project_name: str, background_tasks: BackgroundTasks, regenerate: bool = False):
+    """Analyzes the full script content for potential issues; long scripts are summarized in chunks first."""
+    state = await load_project_state_safe(project_name)
 
     script_content = state.script.full_script_content
     if len(script_content) < 50:
         raise HTTPException(status_code=400, detail="Not enough script content to analyze meaningfully (requires at least 50 characters).")
 
-    # Analyze the last 2000 characters, matching Streamlit logic
-    excerpt = script_content[-2000:]
+    excerpt_hash = hashlib.sha256(script_content.encode("utf-8")).hexdigest()
 
-    result_md = script_agent.analyze_script_issues(excerpt)
+    # Nothing changed since the last analysis: return it without another LLM call
+    if not regenerate and state.script.analysis_md and state.script.analyzed_excerpt_hash == excerpt_hash:
+        return {"text": state.script.analysis_md}
 
-    if "Error:" in result_md:
+    result_md = await script_agent.a_analyze_script_issues(script_content, bypass_cache=regenerate)
+
+    if result_md.startswith("Error:"):
         raise HTTPException(status_code=500, detail=result_md)
 
     # Update state and save
     state.script.analysis_md = result_md
-    save_project_state_safe(state)
+    state.script.analyzed_excerpt_hash = excerpt_hash
+    await save_project_state_safe(state, background_tasks)
 
     return {"text": result_md}
 
 
 # --- Pre-Production Ideas Endpoints ---
+def _moodboard_image_prompt(theme: str, genre: str, synopsis: str) -> str:
+    concept_lines = "\n".join(f"{label}: {value}" for label, value in (("Theme", theme), ("Genre/Seed Idea", genre), ("Synopsis", synopsis)) if value)
+    return f"Visualize a moodboard for a film concept:\n---\n{concept_lines}\n---\nGenerate diverse visual elements for a mood board capturing this concept's look, palette and atmosphere."
+
+def _storyboard_image_prompt(shot_ideas_md: str) -> str:
+    # The Google GenAI model is good at interpreting descriptions like "Extreme Close-Up: Character's trembling hand",
+    # so the generated shot ideas are the image prompt
+    return f"Visualize storyboard shots for a film scene based on these descriptions:\n---\n{shot_ideas_md}\n---\nGenerate distinct storyboard-style images for each described shot."
+
+def _ndjson_line(part: dict) -> bytes:
+    return orjson.dumps(part) + b"\n"
+
+async def _stream_preproduction(state: ProjectState, kind: str, image_prompt: str, ideas):
+    """Yields NDJSON lines: the image parts as Google GenAI generates them and one {"type": "ideas"} line
+    with the text ideas (first if ideas is already a string, else once its task finishes). Saves both
+    to state.pre_production.<kind>_* if everything succeeded; failures arrive as {"type": "error"} parts."""
+    if isinstance(ideas, str):
+        yield _ndjson_line({"type": "ideas", "content": ideas})
+    from image_generator import stream_image_parts
+    parts = []
+    async for part in iterate_in_threadpool(stream_image_parts(image_prompt)):
+        parts.append(part)
+        yield _ndjson_line(part)
+    if not isinstance(ideas, str):
+        ideas = await ideas
+        if ideas.startswith("Error:"):
+            yield _ndjson_line({"type": "error", "content": ideas})
+            return
+        yield _ndjson_line({"type": "ideas", "content": ideas})
+
+    if not parts or any(part.get("type") == "error" for part in parts):
+        return # Save only if BOTH text and image generation succeeded, as the non-streamed endpoints do
+    setattr(state.pre_production, f"{kind}_ideas_md", ideas)
+    setattr(state.pre_production, f"{kind}_images", parts)
+    try:
+        await save_project_state_safe(state)
+    except HTTPException as e: # Headers are already sent, so report it as a part
+        yield _ndjson_line({"type": "error", "content": f"Error: Generated {kind} could not be saved: {e.detail}"})
+
 @app.post("/projects/{project_name}/preproduction/generate-moodboard-ideas", response_model=GeneratedImageResponse, summary="Generate moodboard ideas and images", tags=["Pre-Production Ideas"])
-async def generate_moodboard_ideas_and_images(project_name: str):
+async def generate_moodboard_ideas_and_images(project_name: str, background_tasks: BackgroundTasks, regenerate: bool = False):
     """Generates textual moodboard ideas and corresponding images."""
-    state = load_project_state_safe(project_name)
+    state = await load_project_state_safe(project_name)
 
     theme = state.concept.chosen_theme
     genre = state.concept.seed_idea
@@ -422,60 +849,78 @@ async def generate_moodboard_ideas_and_images(project_name: str):
     if not theme and not genre and not synopsis:
          raise HTTPException(status_code=400, detail="Provide Theme, Genre (Seed Idea), or Synopsis in the concept phase.")
 
-    # 1. Generate text ideas
-    text_result = script_agent.generate_moodboard_ideas(theme, genre, synopsis)
+    # The moodboard images are drawn from the concept itself rather than from the text ideas,
+    # so the text and image generations don't depend on each other and run concurrently
+    image_generation_prompt = _moodboard_image_prompt(theme, genre, synopsis)
 
-    if "Error:" in text_result:
-        # If text generation fails, stop here and raise the error
+    # *** REMOVE num_images=3 *** unless you modified image_generator.py
+    from image_generator import generate_image_from_prompt
+    text_result, image_parts = await asyncio.gather(
+        script_agent.a_generate_moodboard_ideas(theme, genre, synopsis, bypass_cache=regenerate),
+        run_in_threadpool(generate_image_from_prompt, image_generation_prompt),
+    )
+
+    if text_result.startswith("Error:"):
+        # If text generation fails, report that first
         raise HTTPException(status_code=500, detail=text_result)
-    else:
-        # Only proceed to image generation if text ideas were successfully generated
-        # 2. Generate images based on the text ideas
-        # The Google model often produces multiple images from a single complex prompt.
-        # Craft a prompt that asks for a set of images visualizing the moodboard ideas.
-        image_generation_prompt = f"Visualize a moodboard for a film concept based on the following ideas:\n---\n{text_result}\n---\nGenerate diverse visual elements for a mood board based on these descriptions."
 
-        # Call the image generation function
-        # *** REMOVE num_images=3 *** unless you modified image_generator.py
-        image_parts = generate_image_from_prompt(image_generation_prompt)
+    if "error" in image_parts: # Image generation failed
+         # If image generation fails, raise a different error.
+         raise HTTPException(status_code=500, detail=f"Failed to generate images: {image_parts['error']}")
 
-        if "error" in image_parts: # Image generation failed
-             # If image generation fails, raise a different error.
-             raise HTTPException(status_code=500, detail=f"Failed to generate images: {image_parts['error']}")
+    # Update state and save (only if BOTH text and image generation succeeded)
+    state.pre_production.moodboard_ideas_md = text_result # Save the generated text ideas
+    state.pre_production.moodboard_images = image_parts # Store the list of parts
+    await save_project_state_safe(state, background_tasks)
 
-        # Update state and save (only if BOTH text and image generation succeeded)
-        state.pre_production.moodboard_ideas_md = text_result # Save the generated text ideas
-        state.pre_production.moodboard_images = image_parts # Store the list of parts
-        save_project_state_safe(state)
+    # Return the generated image parts (which might include text parts from the API)
+    return GeneratedImageResponse(parts=image_parts)
 
-        # Return the generated image parts (which might include text parts from the API)
-        return GeneratedImageResponse(parts=image_parts)
+
+@app.post("/projects/{project_name}/preproduction/generate-moodboard-ideas/stream", summary="Generate moodboard ideas and images, streamed as NDJSON parts", tags=["Pre-Production Ideas"])
+async def generate_moodboard_ideas_stream(project_name: str, regenerate: bool = False):
+    """Same as generate-moodboard-ideas, but sends each image part as soon as it is generated, then the text ideas."""
+    state = await load_project_state_safe(project_name)
+
+    theme = state.concept.chosen_theme
+    genre = state.concept.seed_idea
+    synopsis = state.concept.final_synopsis
+
+    if not theme and not genre and not synopsis:
+         raise HTTPException(status_code=400, detail="Provide Theme, Genre (Seed Idea), or Synopsis in the concept phase.")
+    if not config.GOOGLE_API_KEY:
+         logger.error("Google GenAI API key not configured. Cannot generate images.")
+         raise HTTPException(status_code=500, detail="Image generation API key not configured.")
+
+    # The text ideas are generated while the images stream
+    ideas_task = asyncio.ensure_future(script_agent.a_generate_moodboard_ideas(theme, genre, synopsis, bypass_cache=regenerate))
+    lines = _stream_preproduction(state, "moodboard", _moodboard_image_prompt(theme, genre, synopsis), ideas_task)
+    return StreamingResponse(lines, media_type="application/x-ndjson")
 
 
 @app.post("/projects/{project_name}/preproduction/generate-storyboard-ideas", response_model=GeneratedImageResponse, summary="Generate storyboard shot ideas and images", tags=["Pre-Production Ideas"])
-async def generate_storyboard_ideas_and_images(project_name: str, request: GenerateStoryboardRequest):
+async def generate_storyboard_ideas_and_images(project_name: str, request: GenerateStoryboardRequest, background_tasks: BackgroundTasks, regenerate: bool = False):
     """Generates textual storyboard shot ideas and corresponding images for a scene."""
-    state = load_project_state_safe(project_name) # Load state maybe for context, but not strictly needed by agent now
+    state = await load_project_state_safe(project_name) # Load state maybe for context, but not strictly needed by agent now
 
     if not request.scene_text.strip():
          raise HTTPException(status_code=400, detail="Please paste scene text.")
 
     # 1. Generate textual shot ideas
-    text_result = script_agent.generate_storyboard_shot_ideas(request.scene_text)
+    text_result = await script_agent.a_generate_storyboard_shot_ideas(request.scene_text, bypass_cache=regenerate)
 
-    if "Error:" in text_result:
+    if text_result.startswith("Error:"):
         # If text generation fails, stop here and raise the error
         raise HTTPException(status_code=500, detail=text_result)
     else:
         # Only proceed to image generation if text ideas were successfully generated
         # 2. Generate images based on the *textual ideas*.
-        # The Google GenAI model is good at interpreting descriptions like "Extreme Close-Up: Character's trembling hand".
-        # So, feed the generated markdown text for images.
-        image_generation_prompt = f"Visualize storyboard shots for a film scene based on these descriptions:\n---\n{text_result}\n---\nGenerate distinct storyboard-style images for each described shot."
+        image_generation_prompt = _storyboard_image_prompt(text_result)
 
         # Call the image generation function
         # *** REMOVE num_images=3 *** unless you modified image_generator.py
-        image_parts = generate_image_from_prompt(image_generation_prompt)
+        from image_generator import generate_image_from_prompt
+        image_parts = await run_in_threadpool(generate_image_from_prompt, image_generation_prompt)
 
         if "error" in image_parts: # Image generation failed
              # If image generation fails, raise a different error.
@@ -484,28 +929,52 @@ async def generate_storyboard_ideas_and_images(project_name: str, request: Gener
         # Update state and save (only if BOTH text and image generation succeeded)
         state.pre_production.storyboard_ideas_md = text_result # Save the generated text ideas
         state.pre_production.storyboard_images = image_parts # Store list of parts
-        save_project_state_safe(state)
+        await save_project_state_safe(state, background_tasks)
 
         # Return image data (including potential text parts from Google GenAI)
         return GeneratedImageResponse(parts=image_parts)
-@app.post("/generate/comic-image", response_model=GeneratedImageResponse, summary="Generate a comic-style image from a prompt", tags=["Image Generation"])
-async def generate_comic_image(request: ComicPromptRequest):
-    """Generates a comic-style image based on a text prompt."""
+
+@app.post("/projects/{project_name}/preproduction/generate-storyboard-ideas/stream", summary="Generate storyboard shot ideas and images, streamed as NDJSON parts", tags=["Pre-Production Ideas"])
+async def generate_storyboard_ideas_stream(project_name: str, request: GenerateStoryboardRequest, regenerate: bool = False):
+    """Same as generate-storyboard-ideas, but sends the shot ideas first, then each image part as soon as it is generated."""
+    state = await load_project_state_safe(project_name)
+
+    if not request.scene_text.strip():
+         raise HTTPException(status_code=400, detail="Please paste scene text.")
     if not config.GOOGLE_API_KEY:
          logger.error("Google GenAI API key not configured. Cannot generate images.")
          raise HTTPException(status_code=500, detail="Image generation API key not configured.")
 
+    # The images are drawn from the shot ideas, so those come first (and can still fail with a proper status)
+    text_result = await script_agent.a_generate_storyboard_shot_ideas(request.scene_text, bypass_cache=regenerate)
+    if text_result.startswith("Error:"):
+        raise HTTPException(status_code=500, detail=text_result)
+
+    lines = _stream_preproduction(state, "storyboard", _storyboard_image_prompt(text_result), text_result)
+    return StreamingResponse(lines, media_type="application/x-ndjson")
+
+def _comic_prompt(prompt: str) -> str:
     # Craft the prompt, adding style hints
-    image_generation_prompt = f"{request.prompt}" + """
+    return f"{prompt}" + """
 Explain the concept using a fun, kid-friendly story filled with lots of characters.  
 Make each sentence short, simple, and playful — like you're telling a bedtime story.  
 Keep the tone cheerful, curious, and easy for kids to understand.  
 For every sentence, create a cute, colorful ink illustration that matches the story.  
 No extra explanations — just start the story and keep going until the concept is clear through the animal adventure."""
 
+@app.post("/generate/comic-image", response_model=GeneratedImageResponse, summary="Generate a comic-style image from a prompt", tags=["Image Generation"])
+async def generate_comic_image(request: ComicPromptRequest):
+    """Generates a comic-style image based on a text prompt."""
+    if not config.GOOGLE_API_KEY:
+         logger.error("Google GenAI API key not configured. Cannot generate images.")
+         raise HTTPException(status_code=500, detail="Image generation API key not configured.")
+
+    image_generation_prompt = _comic_prompt(request.prompt)
+
     logger.info(f"Generating comic image for prompt: '{image_generation_prompt[:100]}...'")
 
-    image_parts = generate_image_from_prompt(image_generation_prompt)
+    from image_generator import generate_image_from_prompt
+    image_parts = await run_in_threadpool(generate_image_from_prompt, image_generation_prompt)
 
     if "error" in image_parts:
          logger.error(f"Image generation failed: {image_parts['error']}")
@@ -515,6 +984,17 @@ No extra explanations — just start the story and keep going until the concept
     # Note: This endpoint does NOT interact with project state.
     return GeneratedImageResponse(parts=image_parts)
 
+@app.post("/generate/comic-image/stream", summary="Generate a comic-style image, streamed as NDJSON parts", tags=["Image Generation"])
+async def generate_comic_image_stream(request: ComicPromptRequest):
+    """Same as /generate/comic-image, but sends each part as one JSON line as soon as it is generated."""
+    if not config.GOOGLE_API_KEY:
+         logger.error("Google GenAI API key not configured. Cannot generate images.")
+         raise HTTPException(status_code=500, detail="Image generation API key not configured.")
+
+    from image_generator import stream_image_parts
+    parts = stream_image_parts(_comic_prompt(request.prompt))
+    return StreamingResponse((_ndjson_line(part) for part in parts), media_type="application/x-ndjson")
+
 # --- API Key Check (Startup) ---
 @app.on_event("startup")
 async def startup_event():
@@ -1,23 +1,131 @@
+import os
+import re
 import time
-from groq import Groq, RateLimitError, APIError # Import APIError
+import random
+import asyncio
+import json
+import hashlib
+import functools
+import unicodedata
+import threading
+from concurrent.futures import Future
+from cachetools import TTLCache
+from groq import Groq, AsyncGroq, RateLimitError, APIError # Import APIError
 import config
+from semantic_cache import semantic_cache
 
-# Initialize client only if key exists
-groq_client = None
-if config.GROQ_API_KEY:
-    groq_client = Groq(api_key=config.GROQ_API_KEY)
-else:
+# Clients are created once on first use and shared, so the HTTP connection pool and TLS sessions are reused
+if not config.GROQ_API_KEY:
     print("Groq client not initialized due to missing API key.")
 
+@functools.lru_cache(maxsize=1)
+def get_groq_clients() -> tuple:
+    """Returns one shared Groq client per configured API key (empty if none is configured)."""
+    return tuple(Groq(api_key=key) for key in config.GROQ_API_KEYS)
+
+@functools.lru_cache(maxsize=1)
+def get_async_groq_clients() -> tuple:
+    """Returns one shared AsyncGroq client per configured API key (empty if none is configured)."""
+    return tuple(AsyncGroq(api_key=key) for key in config.GROQ_API_KEYS)
+
+def get_groq_client():
+    """Returns the client of the first API key, or None. Batch jobs and their files belong to the key
+    that created them, so the Batch API always goes through this one."""
+    clients = get_groq_clients()
+    return clients[0] if clients else None
+
+class _KeyPool:
+    """Round-robin over the API keys, skipping keys that are cooling down after a rate-limit error."""
+    def __init__(self, size: int):
+        self._cooldown_until = [0.0] * max(1, size)
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def pick(self) -> tuple[int, float]:
+        """Returns (key index, seconds to wait before using it): the next key not cooling down,
+        or the one that frees up soonest when all of them are."""
+        with self._lock:
+            now = time.monotonic()
+            order = [(self._next + i) % len(self._cooldown_until) for i in range(len(self._cooldown_until))]
+            index = next((i for i in order if self._cooldown_until[i] <= now), None)
+            if index is None:
+                index = min(order, key=self._cooldown_until.__getitem__)
+            self._next = (index + 1) % len(self._cooldown_until)
+            return index, max(0.0, self._cooldown_until[index] - now)
+
+    def cool_down(self, index: int, seconds: float):
+        with self._lock:
+            self._cooldown_until[index] = max(self._cooldown_until[index], time.monotonic() + seconds)
+
+_key_pool = _KeyPool(len(config.GROQ_API_KEYS))
+
+def _jittered(delay: float) -> float:
+    """Backoff delay with equal jitter, so callers rate-limited together don't all retry at the same instant."""
+    return delay / 2 + random.uniform(0, delay / 2)
+
+class _TokenBucket:
+    """Per-process token bucket shared by the sync and async paths (refills `rate` tokens per `per` seconds)."""
+    def __init__(self, rate: int, per: float):
+        self.capacity = max(1, rate)
+        self.tokens = float(self.capacity)
+        self.refill_per_sec = self.capacity / per
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """Takes a token and returns how long the caller must wait before using it."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.refill_per_sec)
+            self.updated_at = now
+            self.tokens -= 1 # May go negative: later callers queue up behind earlier reservations
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.refill_per_sec
+
+    def acquire(self):
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+# Spaces out bursts (e.g. fan-out calls) under the tier limit instead of tripping 429s and backing off;
+# every key has its own limit, so the budget grows with the key pool
+_rate_limiter = _TokenBucket(config.GROQ_RPM * max(1, len(config.GROQ_API_KEYS)), 60)
+
+# Task kinds agents route on; anything unknown falls back to the creative model
+_TASK_MODELS = {
+    "edit": config.FAST_MODEL,
+    "analysis": config.FAST_MODEL,
+    "creative": config.CREATIVE_MODEL,
+}
+
+def route_model(task_kind: str) -> str:
+    """Picks the Groq model for a kind of task ("edit", "analysis", "creative")."""
+    return _TASK_MODELS.get(task_kind, config.CREATIVE_MODEL)
+
+# Exact-match response cache: bounded in-memory TTL layer backed by one text file per key on disk
+# (expired after config.GROQ_CACHE_TTL_HOURS, checked when read)
+CACHE_DIR = os.path.join(config.PROJECTS_BASE_DIR, ".cache")
+_mem_cache = TTLCache(maxsize=512, ttl=3600)
+_mem_cache_lock = threading.Lock() # TTLCache is not thread-safe; streamed responses are cached from worker threads
+
 def call_groq(prompt: str, system_prompt: str = "You are a helpful AI assistant.", model: str = config.DEFAULT_MODEL, max_retries: int = 3, initial_delay: int = 5) -> str:
-    if not groq_client:
+    clients = get_groq_clients()
+    if not clients:
         return "Error: Groq API key not configured."
 
     delay = initial_delay
     last_error = None
     for attempt in range(max_retries):
+        index, wait = _key_pool.pick()
+        if wait > 0:
+            time.sleep(wait)
         try:
-            chat_completion = groq_client.chat.completions.create(
+            _rate_limiter.acquire()
+            chat_completion = clients[index].chat.completions.create(
                 messages=[
                     {
                         "role": "system",
@@ -41,8 +149,11 @@ def call_groq(prompt: str, system_prompt: str = "You are a helpful AI assistant.
 
         except RateLimitError as e:
             last_error = e
-            print(f"Rate limit hit. Retrying in {delay} seconds... (Attempt {attempt + 1}/{max_retries})")
-            time.sleep(delay)
+            # Rest this key and retry on the next one; with a single key (or all keys resting) the retry waits out the delay.
+            # Connection errors and 5xx never reach here: the SDK client already retries those (max_retries=2, jittered).
+            rest = _jittered(delay)
+            _key_pool.cool_down(index, rest)
+            print(f"Rate limit hit on key {index + 1}/{len(clients)}. Resting it for {rest:.1f} seconds... (Attempt {attempt + 1}/{max_retries})")
             delay *= 2 # Exponential backoff
         except APIError as e: # Catch other API errors
             last_error = e
@@ -58,4 +169,327 @@ def call_groq(prompt: str, system_prompt: str = "You are a helpful AI assistant.
     if attempt == max_retries - 1 and isinstance(last_error, RateLimitError):
         error_message = f"Error: Exceeded maximum retries ({max_retries}) due to rate limiting. Last error: {last_error}"
 
-    return error_message
\ No newline at end of file
+    return error_message
+
+def clean_field(text: str) -> str:
+    """Normalizes a short user-entered field (NFC, trimmed, single spaces, no trailing punctuation)."""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFC", text or "").strip()).rstrip(".?!,;:")
+
+def _cache_key(prompt: str, system_prompt: str, model: str) -> str:
+    # The prompt is hashed exactly as sent: line breaks and case matter in screenplay text.
+    # Variants of short user fields are folded earlier, by clean_field at the agent entry points.
+    return hashlib.sha256(f"{model}|{system_prompt}|{prompt}".encode("utf-8")).hexdigest()
+
+def _cache_scope(system_prompt: str, model: str) -> str:
+    # Near-duplicate prompts only match within the same model + system prompt
+    return hashlib.sha256(f"{model}|{system_prompt}".encode("utf-8")).hexdigest()
+
+def _cache_get(key: str, prompt: str, scope: str):
+    """Looks a response up in memory, then on disk, then in the semantic cache."""
+    with _mem_cache_lock:
+        cached = _mem_cache.get(key)
+    if cached is not None:
+        return cached
+    cache_file = os.path.join(CACHE_DIR, f"{key}.txt")
+    try:
+        with open(cache_file, 'r', encoding='utf-8') as f:
+            age = time.time() - os.fstat(f.fileno()).st_mtime
+            expired = config.GROQ_CACHE_TTL_HOURS > 0 and age > config.GROQ_CACHE_TTL_HOURS * 3600
+            cached = None if expired else f.read()
+        if expired:
+            os.remove(cache_file)
+        else:
+            with _mem_cache_lock:
+                _mem_cache[key] = cached
+            return cached
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        print(f"Could not read Groq cache entry {key}: {e}")
+    similar = semantic_cache.lookup(prompt, scope)
+    if similar is not None:
+        with _mem_cache_lock:
+            _mem_cache[key] = similar
+    return similar
+
+def _cache_put(key: str, prompt: str, scope: str, result: str):
+    with _mem_cache_lock:
+        _mem_cache[key] = result
+    semantic_cache.add(prompt, scope, result)
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        # Write aside and swap in, so another worker never reads a half-written entry
+        tmp_file = os.path.join(CACHE_DIR, f"{key}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            f.write(result)
+        os.replace(tmp_file, os.path.join(CACHE_DIR, f"{key}.txt"))
+    except OSError as e:
+        print(f"Could not write Groq cache entry {key}: {e}")
+
+# Cached calls currently waiting on Groq, by cache key; an identical call arriving meanwhile waits for that
+# result instead of sending the same prompt again. concurrent Futures so both threads and coroutines can wait.
+_inflight: dict[str, Future] = {}
+
+def _join_inflight(key: str) -> tuple[Future, bool]:
+    """Returns (future, True) if this caller should send the request, or (the leader's future, False)."""
+    with _mem_cache_lock:
+        future = _inflight.get(key)
+        if future is not None:
+            return future, False
+        future = _inflight[key] = Future()
+        return future, True
+
+def _settle_inflight(key: str, future: Future, result: str):
+    with _mem_cache_lock:
+        _inflight.pop(key, None)
+    future.set_result(result)
+
+def clear_cache() -> int:
+    """Empties every response cache layer: memory, the on-disk entries and the semantic cache.
+    Returns how many entries were dropped."""
+    with _mem_cache_lock:
+        dropped = len(_mem_cache)
+        _mem_cache.clear()
+    try:
+        file_names = os.listdir(CACHE_DIR)
+    except FileNotFoundError:
+        file_names = []
+    for file_name in file_names:
+        if file_name.endswith(".txt"):
+            try:
+                os.remove(os.path.join(CACHE_DIR, file_name))
+                dropped += 1
+            except FileNotFoundError:
+                pass
+    return dropped + semantic_cache.invalidate()
+
+def cached_call_groq(prompt: str, system_prompt: str = "You are a helpful AI assistant.", model: str = None, bypass_cache: bool = False) -> str:
+    """Same as call_groq, but returns a stored response for an identical (model, system_prompt, prompt).
+    bypass_cache skips the lookup (the new response still replaces the stored one), for regenerate actions."""
+    model = model or config.DEFAULT_MODEL
+    key = _cache_key(prompt, system_prompt, model)
+    scope = _cache_scope(system_prompt, model)
+
+    future = None
+    if not bypass_cache:
+        cached = _cache_get(key, prompt, scope)
+        if cached is not None:
+            return cached
+        future, leader = _join_inflight(key)
+        if not leader:
+            return future.result()
+
+    result = "Error: Groq call did not complete."
+    try:
+        result = call_groq(prompt, system_prompt, model=model)
+        if not result.startswith("Error:"): # Never cache failures
+            _cache_put(key, prompt, scope, result)
+        return result
+    finally:
+        if future is not None:
+            _settle_inflight(key, future, result)
+
+async def async_call_groq(prompt: str, system_prompt: str = "You are a helpful AI assistant.", model: str = config.DEFAULT_MODEL, max_retries: int = 3, initial_delay: int = 5) -> str:
+    """Non-blocking counterpart of call_groq, so independent prompts can be awaited together."""
+    clients = get_async_groq_clients()
+    if not clients:
+        return "Error: Groq API key not configured."
+
+    delay = initial_delay
+    last_error = None
+    for attempt in range(max_retries):
+        index, wait = _key_pool.pick()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        try:
+            await _rate_limiter.acquire_async()
+            chat_completion = await clients[index].chat.completions.create(
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": prompt},
+                ],
+                model=model,
+            )
+            if chat_completion.choices and chat_completion.choices[0].message:
+                return chat_completion.choices[0].message.content or "Error: Received empty response from Groq."
+            last_error = "Error: Invalid response structure from Groq."
+            print(f"Invalid response received: {chat_completion}")
+            break
+        except RateLimitError as e:
+            last_error = e
+            rest = _jittered(delay)
+            _key_pool.cool_down(index, rest)
+            print(f"Rate limit hit on key {index + 1}/{len(clients)}. Resting it for {rest:.1f} seconds... (Attempt {attempt + 1}/{max_retries})")
+            delay *= 2
+        except APIError as e:
+            last_error = e
+            print(f"An API error occurred calling Groq: {e}")
+            break
+        except Exception as e:
+            last_error = e
+            print(f"An unexpected error occurred calling Groq: {e}")
+            break
+
+    if attempt == max_retries - 1 and isinstance(last_error, RateLimitError):
+        return f"Error: Exceeded maximum retries ({max_retries}) due to rate limiting. Last error: {last_error}"
+    return f"Error: Could not get response from Groq. Last error: {last_error}"
+
+async def async_cached_call_groq(prompt: str, system_prompt: str = "You are a helpful AI assistant.", model: str = None, bypass_cache: bool = False) -> str:
+    """Async counterpart of cached_call_groq; shares the same cache layers."""
+    model = model or config.DEFAULT_MODEL
+    key = _cache_key(prompt, system_prompt, model)
+    scope = _cache_scope(system_prompt, model)
+
+    future = None
+    if not bypass_cache:
+        cached = _cache_get(key, prompt, scope)
+        if cached is not None:
+            return cached
+        future, leader = _join_inflight(key)
+        if not leader:
+            return await asyncio.wrap_future(future)
+
+    result = "Error: Groq call did not complete."
+    try:
+        result = await async_call_groq(prompt, system_prompt, model=model)
+        if not result.startswith("Error:"):
+            _cache_put(key, prompt, scope, result)
+        return result
+    finally:
+        if future is not None:
+            _settle_inflight(key, future, result)
+
+async def async_cached_call_groq_many(prompts: list[str], system_prompt: str = "You are a helpful AI assistant.", model: str = None, max_concurrency: int = None, bypass_cache: bool = False) -> list[str]:
+    """Runs async_cached_call_groq for every prompt concurrently, at most max_concurrency in flight; results keep prompt order."""
+    semaphore = asyncio.Semaphore(max_concurrency or config.GROQ_MAX_CONCURRENCY)
+
+    async def call(prompt: str) -> str:
+        async with semaphore:
+            return await async_cached_call_groq(prompt, system_prompt, model=model, bypass_cache=bypass_cache)
+
+    return await asyncio.gather(*[call(prompt) for prompt in prompts])
+
+# Appended by stream_groq when a stream breaks after some text was sent; callers look for this, not any "Error:"
+STREAM_INTERRUPTED = "\n\nError: Stream from Groq interrupted."
+
+def stream_failed(text: str) -> bool:
+    """Whether a streamed response failed: an error before any text, or an interruption midway."""
+    return text.startswith("Error:") or STREAM_INTERRUPTED in text
+
+def stream_groq(prompt: str, system_prompt: str = "You are a helpful AI assistant.", model: str = None, bypass_cache: bool = False):
+    """Yields the response text chunk by chunk as Groq generates it.
+
+    A cached response is yielded in one piece unless bypass_cache; a completed stream is cached like cached_call_groq.
+    Failures are yielded as a single "Error: ..." chunk, since the caller may already be rendering.
+    """
+    model = model or config.DEFAULT_MODEL
+    key = _cache_key(prompt, system_prompt, model)
+    scope = _cache_scope(system_prompt, model)
+
+    cached = None if bypass_cache else _cache_get(key, prompt, scope)
+    if cached is not None:
+        yield cached
+        return
+    clients = get_groq_clients()
+    if not clients:
+        yield "Error: Groq API key not configured."
+        return
+
+    parts = []
+    index, wait = _key_pool.pick()
+    if wait > 0:
+        time.sleep(wait)
+    try:
+        _rate_limiter.acquire()
+        stream = clients[index].chat.completions.create(
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": prompt},
+            ],
+            model=model,
+            stream=True,
+        )
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            text = chunk.choices[0].delta.content or ""
+            if text:
+                parts.append(text)
+                yield text
+    except Exception as e: # No retries mid-stream; part of the answer may already be shown
+        print(f"An error occurred while streaming from Groq: {e}")
+        yield f"{STREAM_INTERRUPTED} Last error: {e}"
+        return
+
+    result = "".join(parts)
+    if result:
+        _cache_put(key, prompt, scope, result)
+
+# --- Batch API: bulk, non-urgent generations at lower cost, results arrive asynchronously ---
+
+def submit_batch(prompts: list[tuple[str, str]], model: str = None) -> str:
+    """Submits (prompt, system_prompt) pairs as one Groq batch job. Returns the job id or an "Error: ..." string."""
+    groq_client = get_groq_client()
+    if not groq_client:
+        return "Error: Groq API key not configured."
+    if not prompts:
+        return "Error: No prompts to submit."
+
+    model = model or config.DEFAULT_MODEL
+    lines = [
+        json.dumps({
+            "custom_id": f"request-{i}",
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": {
+                "model": model,
+                "messages": [
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": prompt},
+                ],
+            },
+        })
+        for i, (prompt, system_prompt) in enumerate(prompts)
+    ]
+    try:
+        batch_file = groq_client.files.create(file=("batch.jsonl", "\n".join(lines).encode("utf-8")), purpose="batch")
+        job = groq_client.batches.create(completion_window="24h", endpoint="/v1/chat/completions", input_file_id=batch_file.id)
+        return job.id
+    except Exception as e:
+        print(f"An error occurred submitting a Groq batch: {e}")
+        return f"Error: Could not submit batch to Groq. Last error: {e}"
+
+def get_batch_results(job_id: str, count: int) -> dict:
+    """Polls a batch job. Returns {"status": ..., "results": [text per prompt, in order] once completed}."""
+    groq_client = get_groq_client()
+    if not groq_client:
+        return {"status": "error", "error": "Error: Groq API key not configured."}
+    try:
+        job = groq_client.batches.retrieve(job_id)
+        if job.status != "completed" or not job.output_file_id:
+            return {"status": job.status}
+
+        results = [f"Error: No result returned for request {i}." for i in range(count)]
+        for line in groq_client.files.content(job.output_file_id).text().splitlines():
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            index = int(item["custom_id"].rsplit("-", 1)[1])
+            body = (item.get("response") or {}).get("body") or {}
+            choices = body.get("choices") or []
+            if 0 <= index < count and choices:
+                results[index] = choices[0]["message"]["content"]
+        return {"status": "completed", "results": results}
+    except Exception as e:
+        print(f"An error occurred polling Groq batch {job_id}: {e}")
+        return {"status": "error", "error": f"Error: Could not poll Groq batch. Last error: {e}"}
+
+def cancel_batch(job_id: str):
+    """Best-effort cancellation of a batch job."""
+    groq_client = get_groq_client()
+    if not groq_client:
+        return
+    try:
+        groq_client.batches.cancel(job_id)
+    except Exception as e:
+        print(f"Could not cancel Groq batch {job_id}: {e}")
\ No newline at end of file
@@ -1,5 +1,9 @@
 import os
-import base64
+import functools
+try:
+    import pybase64 as base64 # SIMD base64, same API; optional
+except ImportError:
+    import base64
 from io import BytesIO
 from PIL import Image
 import config
@@ -13,15 +17,19 @@ import logging
 
 IMAGE_MODEL = "gemini-2.0-flash-preview-image-generation" # Or "gemini-2.0-flash-exp-image-generation"
 
-# ... (generate_image_from_prompt function definition) ...
+# One client per process, so its HTTP connection pool and TLS sessions are reused across image requests
+@functools.lru_cache(maxsize=1)
+def get_genai_client():
+    """Returns the shared Google GenAI client."""
+    return genai.Client()
 
-def generate_image_from_prompt(prompt: str, num_images: int = 3):
+# ... (generate_image_from_prompt function definition) ...
 
-    client = genai.Client()
+def _build_prompt(prompt: str, num_images: int) -> str:
     # Refined prompt to encourage distinct visuals based on the input text.
     # Explicitly ask for "visual concepts" or "distinct images".
     # Keep the original ideas for context.
-    modified_prompt = f"""
+    return f"""
 Generate {num_images} distinct visual concepts or images based on the following ideas and descriptions for a film:
 
 ---
@@ -31,6 +39,48 @@ Generate {num_images} distinct visual concepts or images based on the following
 Focus on creating varied visual styles or content for each image, inspired by the text above.
 """
 
+def _sniff_image_format(data: bytes):
+    """Returns "PNG", "JPEG" or "WEBP" from the file signature, or None for anything else."""
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "PNG"
+    if data.startswith(b"\xff\xd8\xff"):
+        return "JPEG"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "WEBP"
+    return None
+
+def _convert_part(part):
+    """Converts a Google GenAI response part to {"type", "content"}; None for unexpected parts."""
+    if part.text is not None:
+        logging.info(f"Received text part: {part.text[:50]}...")
+        return {"type": "text", "content": part.text}
+    if part.inline_data is not None:
+         # Convert image bytes to base64
+         try:
+             image_bytes = part.inline_data.data
+             img_format = _sniff_image_format(image_bytes) # Supported formats are passed through without PIL
+             if img_format is None:
+                 # Convert unsupported formats (like animated GIFs) to PNG
+                 buffered = BytesIO()
+                 Image.open(BytesIO(image_bytes)).save(buffered, format="PNG")
+                 image_bytes = buffered.getvalue()
+                 img_format = "PNG" # Update format
+
+             base64_img = base64.b64encode(image_bytes).decode('utf-8')
+             logging.info(f"Processed image part ({img_format}).")
+             return {"type": f"image/{img_format.lower()}", "content": base64_img}
+
+         except Exception as img_e:
+             logging.error(f"Error processing image data from Google GenAI: {img_e}")
+             return {"type": "error", "content": f"Failed to process image: {img_e}"}
+    logging.warning(f"Unexpected part type in Google GenAI response: {part}")
+    return None
+
+def generate_image_from_prompt(prompt: str, num_images: int = 3):
+
+    client = get_genai_client()
+    modified_prompt = _build_prompt(prompt, num_images)
+
     try:
         logging.info(f"Calling Google GenAI for image generation with prompt: '{modified_prompt[:200]}...'") # Log more prompt
         response = client.models.generate_content(
@@ -50,32 +100,9 @@ Focus on creating varied visual styles or content for each image, inspired by th
         if response.candidates and response.candidates[0].content:
             result_parts = []
             for part in response.candidates[0].content.parts:
-                if part.text is not None:
-                    logging.info(f"Received text part: {part.text[:50]}...")
-                    result_parts.append({"type": "text", "content": part.text})
-                elif part.inline_data is not None:
-                     # Convert image bytes to base64
-                     try:
-                         image_bytes = part.inline_data.data
-                         img = Image.open(BytesIO(image_bytes))
-                         img_format = img.format
-                         buffered = BytesIO()
-                         if img_format in ['JPEG', 'PNG', 'WEBP']: # Supported formats for saving
-                             img.save(buffered, format=img_format) # Save in original format
-                         else:
-                             # Convert unsupported formats (like animated GIFs) to PNG
-                             img.save(buffered, format="PNG")
-                             img_format = "PNG" # Update format
-
-                         base64_img = base64.b64encode(buffered.getvalue()).decode('utf-8')
-                         result_parts.append({"type": f"image/{img_format.lower()}", "content": base64_img})
-                         logging.info(f"Processed image part ({img_format}).")
-
-                     except Exception as img_e:
-                         logging.error(f"Error processing image data from Google GenAI: {img_e}")
-                         result_parts.append({"type": "error", "content": f"Failed to process image: {img_e}"})
-                else:
-                     logging.warning(f"Unexpected part type in Google GenAI response: {part}")
+                converted = _convert_part(part)
+                if converted is not None:
+                    result_parts.append(converted)
 
 
             # Check if we got at least one image or text part
@@ -101,4 +128,49 @@ Focus on creating varied visual styles or content for each image, inspired by th
 
     except Exception as e:
         logging.exception(f"An error occurred during Google GenAI image generation:")
-        return {"error": f"An error occurred generating image: {e}"}
\ No newline at end of file
+        return {"error": f"An error occurred generating image: {e}"}
+
+
+def stream_image_parts(prompt: str, num_images: int = 3):
+    """Like generate_image_from_prompt, but yields each part as soon as Google GenAI returns it.
+
+    Streamed text arrives in small pieces, so consecutive text is merged into one part; failures are
+    yielded as {"type": "error"} parts since the response has already started.
+    """
+    client = get_genai_client()
+    text_buffer = []
+    yielded = 0
+    try:
+        logging.info("Streaming Google GenAI image generation...")
+        stream = client.models.generate_content_stream(
+            model=IMAGE_MODEL,
+            contents=_build_prompt(prompt, num_images),
+            config=types.GenerateContentConfig(
+                response_modalities=['TEXT', 'IMAGE']
+            )
+        )
+        for chunk in stream:
+            if not chunk.candidates or not chunk.candidates[0].content:
+                continue
+            for part in chunk.candidates[0].content.parts or []:
+                converted = _convert_part(part)
+                if converted is None:
+                    continue
+                if converted["type"] == "text":
+                    text_buffer.append(converted["content"])
+                    continue
+                if text_buffer:
+                    yield {"type": "text", "content": "".join(text_buffer)}
+                    text_buffer = []
+                    yielded += 1
+                yield converted
+                yielded += 1
+        if text_buffer:
+            yield {"type": "text", "content": "".join(text_buffer)}
+            yielded += 1
+        if not yielded:
+            logging.error("Google GenAI stream finished without any parts.")
+            yield {"type": "error", "content": "Image generation returned no content parts."}
+    except Exception as e:
+        logging.exception("An error occurred during streamed Google GenAI image generation:")
+        yield {"type": "error", "content": f"An error occurred generating image: {e}"}
\ No newline at end of file
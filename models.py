@@ -28,6 +28,10 @@ class ScriptState(BaseModel):
     outline_md: str = ""
     full_script_content: str = ""
     analysis_md: str = ""
+    # Pending "draft all scenes" batch: { "job_id", "submitted_at", "scenes": [[heading, description], ...] }
+    batch_job: Optional[Dict[str, Any]] = None
+    # sha256 of the script excerpt analysis_md was generated from
+    analyzed_excerpt_hash: Optional[str] = None
 
 class PreProductionState(BaseModel):
     moodboard_ideas_md: str = ""
@@ -69,6 +73,11 @@ class SaveProjectRequest(ProjectState):
     # Request to save is the full state, already defined by ProjectState
     pass
 
+class PatchProjectRequest(BaseModel):
+    # Only what changed since the client's last save: {section: {key: new value}}, or {field: new value}
+    # for top-level scalars. Nested values (e.g. a whole character) replace the stored ones.
+    changes: Dict[str, Any] = {}
+
 class GenerateConceptsRequest(BaseModel):
     seed_idea: str = Field(..., min_length=1, description="Seed idea for concept generation")
 
@@ -135,9 +144,34 @@ class SuccessResponse(BaseModel):
 class ProjectListResponse(BaseModel):
     projects: List[str]
 
+class ProjectMeta(BaseModel):
+    project_name: str
+    last_saved: Optional[str] = None
+
+class ProjectMetaListResponse(BaseModel):
+    projects: List[ProjectMeta]
+
+class ProjectSaveResponse(BaseModel):
+    # What a save adds to the state, without echoing the (possibly image-heavy) rest of it
+    project_name: str
+    last_saved: Optional[datetime] = None
+    log: List[str] = []
+
 class GeneratedTextResponse(BaseModel):
     text: str
 
+class BatchJobResponse(BaseModel):
+    status: str
+    job_id: Optional[str] = None
+    scene_count: int = 0
+    text: str = "" # Drafted scenes, once the job has finished
+
+class CharacterBundleResponse(BaseModel):
+    # Sections that could not be generated (e.g. no other characters) stay empty
+    profile_suggestions: str = ""
+    arc_description: str = ""
+    relationship_suggestions: str = ""
+
 class GeneratedImageResponse(BaseModel):
      # Matches the structure returned by image_generator.py
     parts: List[Dict[str, str]]
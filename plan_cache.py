@@ -0,0 +1,54 @@
+import os
+import json
+import threading
+import logging
+import config
+
+# Plan-template cache: arcs generated for one character are structurally near-identical for the
+# next one in the same project and framework, so a stored arc can be adapted instead of re-planned.
+# Templates never cross projects; another story's arc is not a useful starting point.
+
+PLAN_CACHE_FILE = os.path.join(config.PROJECTS_BASE_DIR, ".cache", "plans.json")
+
+_lock = threading.Lock()
+_plans = None # {"project|framework": plan_markdown}, loaded lazily from PLAN_CACHE_FILE
+
+def plan_key(project_name: str, framework: str):
+    """Builds the lookup key from the project and its framework, or None when the project is unknown."""
+    if not project_name:
+        return None
+    return (project_name, (framework or "Three-Act Structure").strip().lower())
+
+def _load():
+    global _plans
+    if _plans is not None:
+        return _plans
+    _plans = {}
+    if os.path.exists(PLAN_CACHE_FILE):
+        try:
+            with open(PLAN_CACHE_FILE, 'r', encoding='utf-8') as f:
+                _plans = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logging.warning(f"Could not read plan cache, starting empty: {e}")
+    return _plans
+
+def lookup_plan(key: tuple):
+    """Returns the stored plan template for key, or None."""
+    if key is None:
+        return None
+    with _lock:
+        return _load().get("|".join(key))
+
+def store_plan(key: tuple, plan_markdown: str):
+    """Stores plan_markdown as the template for key (latest successful plan wins)."""
+    if key is None:
+        return
+    with _lock:
+        plans = _load()
+        plans["|".join(key)] = plan_markdown
+        try:
+            os.makedirs(os.path.dirname(PLAN_CACHE_FILE), exist_ok=True)
+            with open(PLAN_CACHE_FILE, 'w', encoding='utf-8') as f:
+                json.dump(plans, f)
+        except OSError as e:
+            logging.warning(f"Could not write plan cache: {e}")
\ No newline at end of file
@@ -1,16 +1,57 @@
 import os
-import json
-import copy
+import hashlib
+import functools
+try:
+    import pybase64 as base64 # SIMD base64, same API; optional
+except ImportError:
+    import base64
+import orjson
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from pydantic import ValidationError
 import config
 import logging
+from models import ProjectState
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+LOG_MAX_ENTRIES = 50
+# Image part lists under pre_production live in their own files, so the main state file stays small;
+# each image is stored as a binary file under preproduction/images/ and the sidecar lists its path
+IMAGE_SIDECAR_KEYS = ("moodboard_images", "storyboard_images")
+
+def _append_log(state: dict, message: str):
+    """Appends to the state's log and trims it in place to the last LOG_MAX_ENTRIES entries."""
+    log = state.get("log")
+    if not isinstance(log, list):
+        log = state["log"] = []
+    log.append(message)
+    del log[:-LOG_MAX_ENTRIES]
+
+@functools.lru_cache(maxsize=512)
+def _state_file_path(base_dir: str, project_name_display: str) -> str:
+    # Pure string work on (base_dir, name), so memoizing needs no invalidation when projects come and go
+    project_dir = os.path.join(base_dir, project_name_display)
+    # Use a cleaned name for the *file* itself
+    clean_name = project_name_display.strip().replace(" ", "_").lower()
+    return os.path.join(project_dir, f"{clean_name}_state.json")
+
 class ProjectManager:
     def __init__(self, base_dir=config.PROJECTS_BASE_DIR):
         self.base_dir = base_dir
         os.makedirs(self.base_dir, exist_ok=True) # Ensure base dir exists on init
+        # Memoized project list; every UI rerun asks for it, so avoid re-walking the directory each time
+        self._project_list_cache = None
+        self._project_list_cached_at = 0.0
+        self._project_meta_cache = None
+        self._project_meta_cached_at = 0.0
+        self.project_list_ttl = 30 # seconds
+
+    def _invalidate_project_list(self):
+        self._project_list_cache = None
+        self._project_meta_cache = None
 
     def _get_project_dir(self, project_name_display: str) -> str:
         """Gets the path to the project's directory using display name."""
@@ -23,75 +64,174 @@ class ProjectManager:
         """Gets the path to the project's state file using display name."""
         if not project_name_display:
              raise ValueError("Project display name cannot be empty.")
-        project_dir = self._get_project_dir(project_name_display)
-        # Use a cleaned name for the *file* itself
-        clean_name = project_name_display.strip().replace(" ", "_").lower()
-        return os.path.join(project_dir, f"{clean_name}_state.json")
+        return _state_file_path(self.base_dir, project_name_display)
+
+    def _get_script_file_path(self, project_name_display: str) -> str:
+        """Gets the path to the project's full script file (the state file leaves full_script_content out)."""
+        return os.path.join(self._get_project_dir(project_name_display), "script.md")
+
+    def has_script_file(self, project_name_display: str) -> bool:
+        return os.path.isfile(self._get_script_file_path(project_name_display))
+
+    def _get_image_file_path(self, project_name_display: str, key: str) -> str:
+        """Gets the path to one of the project's image sidecar files."""
+        return os.path.join(self._get_project_dir(project_name_display), "preproduction", f"{key}.json")
+
+    def _get_image_dir(self, project_name_display: str) -> str:
+        return os.path.join(self._get_project_dir(project_name_display), "preproduction", "images")
+
+    def _read_image_parts(self, project_name_display: str, key: str) -> list:
+        """Reads an image sidecar, base64-encoding the image files it lists back into "content".
+        Raises FileNotFoundError if the sidecar doesn't exist."""
+        sidecar = self._get_image_file_path(project_name_display, key)
+        with open(sidecar, 'rb') as f:
+            listed = orjson.loads(f.read())
+        parts = []
+        for part in listed:
+            if "path" not in part: # Older sidecars keep the base64 inline
+                parts.append(part)
+                continue
+            try:
+                with open(os.path.join(os.path.dirname(sidecar), part["path"]), 'rb') as f:
+                    parts.append({"type": part["type"], "content": base64.b64encode(f.read()).decode('ascii')})
+            except FileNotFoundError:
+                logging.warning(f"Image file '{part['path']}' of project '{project_name_display}' is missing, skipping it.")
+        return parts
+
+    def _write_image_parts(self, project_name_display: str, key: str, parts: list):
+        """Writes each image part as a binary file named after its content, then the sidecar listing them,
+        then removes this key's image files that are no longer listed."""
+        image_dir = self._get_image_dir(project_name_display)
+        os.makedirs(image_dir, exist_ok=True)
+        listed, kept = [], set()
+        for part in parts:
+            if not (part.get("type", "").startswith("image/") and "content" in part):
+                listed.append(part) # Text parts stay inline
+                continue
+            try:
+                data = base64.b64decode(part["content"], validate=True)
+            except ValueError:
+                listed.append(part) # Not valid base64; keep it inline rather than fail the save
+                continue
+            file_name = f"{key}-{hashlib.sha256(data).hexdigest()[:16]}.{part['type'].split('/', 1)[1]}"
+            if not os.path.exists(os.path.join(image_dir, file_name)):
+                self._write_atomic(os.path.join(image_dir, file_name), data)
+            listed.append({"type": part["type"], "path": f"images/{file_name}"})
+            kept.add(file_name)
+        self._write_atomic(self._get_image_file_path(project_name_display, key), orjson.dumps(listed))
+        for file_name in os.listdir(image_dir):
+            if file_name.startswith(f"{key}-") and file_name not in kept and not file_name.endswith(".tmp"):
+                os.remove(os.path.join(image_dir, file_name))
+
+    def has_image_file(self, project_name_display: str, key: str) -> bool:
+        return os.path.isfile(self._get_image_file_path(project_name_display, key))
+
+    def state_file_mtime(self, project_name_display: str) -> int | None:
+        """Returns the state file's modification time in ns, or None if the project has no state file."""
+        try:
+            return os.stat(self._get_state_file_path(project_name_display)).st_mtime_ns
+        except FileNotFoundError:
+            return None
 
     def get_project_list(self) -> list[str]:
         """Returns a list of existing project names (directory names)."""
+        if self._project_list_cache is not None and time.monotonic() - self._project_list_cached_at < self.project_list_ttl:
+            return list(self._project_list_cache)
+
         projects = []
         if not os.path.exists(self.base_dir):
             return []
 
-        for item in os.listdir(self.base_dir):
-            project_dir = os.path.join(self.base_dir, item)
-            if os.path.isdir(project_dir):
-                # Check if a state file exists within this directory
-                clean_name = item.strip().replace(" ", "_").lower()
-                state_file = os.path.join(project_dir, f"{clean_name}_state.json")
-                if os.path.exists(state_file):
-                     projects.append(item) # Return original directory name
-        return sorted(projects)
-
-    def load_project(self, project_name_display: str) -> dict:
-        """Loads project state from file."""
+        # scandir gives is_dir() from the directory entry itself, without a stat per project
+        with os.scandir(self.base_dir) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    # Check if a state file exists within this directory
+                    clean_name = entry.name.strip().replace(" ", "_").lower()
+                    state_file = os.path.join(entry.path, f"{clean_name}_state.json")
+                    if os.path.isfile(state_file):
+                         projects.append(entry.name) # Return original directory name
+
+        self._project_list_cache = sorted(projects)
+        self._project_list_cached_at = time.monotonic()
+        return list(self._project_list_cache)
+
+    def _read_meta(self, project_name_display: str) -> dict:
+        """Reads the display metadata (last save time) from one project's state file."""
+        try:
+            with open(self._get_state_file_path(project_name_display), 'rb') as f:
+                last_saved = orjson.loads(f.read()).get("last_saved")
+        except (OSError, orjson.JSONDecodeError) as e:
+            logging.warning(f"Could not read metadata for project '{project_name_display}': {e}")
+            last_saved = None
+        return {"project_name": project_name_display, "last_saved": last_saved}
+
+    def get_project_list_with_meta(self) -> list[dict]:
+        """Returns [{"project_name", "last_saved"}] for every project, reading state files in parallel."""
+        if self._project_meta_cache is not None and time.monotonic() - self._project_meta_cached_at < self.project_list_ttl:
+            return list(self._project_meta_cache)
+
+        projects = self.get_project_list()
+        # The reads are I/O bound, so threads overlap them despite the GIL
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            metas = list(executor.map(self._read_meta, projects))
+
+        self._project_meta_cache = metas
+        self._project_meta_cached_at = time.monotonic()
+        return list(metas)
+
+    def load_project(self, project_name_display: str, with_images: bool = True) -> dict:
+        """Loads project state from file as a dict; see load_project_state."""
+        return self.load_project_state(project_name_display, with_images).model_dump(mode="json")
+
+    def load_project_state(self, project_name_display: str, with_images: bool = True) -> ProjectState:
+        """Loads and validates project state from file; with_images=False skips reading the image sidecar files."""
         state_file = self._get_state_file_path(project_name_display)
         if not os.path.exists(state_file):
             logging.warning(f"Project state file not found: {state_file}")
             raise FileNotFoundError(f"Project '{project_name_display}' not found.")
 
         try:
-            with open(state_file, 'r') as f:
-                loaded_state = json.load(f)
+            with open(state_file, 'rb') as f:
+                loaded_state = orjson.loads(f.read())
 
-            # --- State Merging Logic (Robust load) ---
-            default_copy = copy.deepcopy(config.DEFAULT_PROJECT_STATE)
             # Ensure loaded state has the correct project display name and cleaned name
             loaded_state["project_name"] = project_name_display
             loaded_state["cleaned_name"] = project_name_display.strip().replace(" ", "_").lower()
 
-            # Merge missing keys from default (recursive for nested dicts)
-            def merge_dict(source, destination):
-                for key, value in source.items():
-                    if isinstance(value, dict):
-                        # Get the value from destination if it exists and is a dict, otherwise use default empty dict
-                        node = destination.setdefault(key, {})
-                        if not isinstance(node, dict):
-                             logging.warning(f"Key '{key}' in state is not a dict, overwriting with default.")
-                             destination[key] = {}
-                             node = destination[key] # Update node reference
-                        merge_dict(value, node)
-                    else:
-                         # Only set if key doesn't exist in destination
-                         if key not in destination:
-                            destination[key] = value
-                         # Special handling for lists - ensure they exist, but don't merge contents recursively by default
-                         elif isinstance(value, list) and not isinstance(destination[key], list):
-                              logging.warning(f"Key '{key}' in state is not a list, overwriting with default empty list.")
-                              destination[key] = []
-
-            merge_dict(default_copy, loaded_state)
-
-            # Ensure log exists and trim
-            loaded_state["log"] = loaded_state.get("log", [])[-50:]
-            loaded_state["log"].append(f"Project '{project_name_display}' loaded.")
-
+            # Older state files keep the images inline; a sidecar, once written, takes precedence
+            # (a mistyped section is left as is, so validation rejects it instead of it being overwritten)
+            pre_production = loaded_state.setdefault("pre_production", {})
+            if with_images and isinstance(pre_production, dict):
+                for key in IMAGE_SIDECAR_KEYS:
+                    try:
+                        pre_production[key] = self._read_image_parts(project_name_display, key)
+                    except FileNotFoundError:
+                        pass
+
+            # Older state files keep the script inline; the script file, once written, takes precedence
+            script_state = loaded_state.setdefault("script", {})
+            if isinstance(script_state, dict):
+                try:
+                    with open(self._get_script_file_path(project_name_display), 'rb') as f:
+                        script_state["full_script_content"] = f.read().decode('utf-8')
+                except FileNotFoundError:
+                    pass
+
+            # Ensure log exists, record the load and trim
+            _append_log(loaded_state, f"Project '{project_name_display}' loaded.")
+
+            # The model fills keys missing from older/partial files with defaults; invalid values fail the load
+            # (and leave the file untouched) rather than being replaced with defaults
+            state = ProjectState.model_validate(loaded_state)
             logging.info(f"Project '{project_name_display}' loaded successfully.")
-            return loaded_state
-        except json.JSONDecodeError as e:
+            return state
+        except orjson.JSONDecodeError as e:
             logging.error(f"Error decoding JSON for project '{project_name_display}': {e}")
             raise IOError(f"Invalid project state file format for '{project_name_display}'.") from e
+        except ValidationError as e:
+            logging.error(f"Invalid project state for '{project_name_display}': {e}")
+            raise IOError(f"Invalid project state for '{project_name_display}': {e}") from e
         except Exception as e:
             logging.exception(f"Unexpected error loading project '{project_name_display}':")
             raise IOError(f"Error loading project '{project_name_display}': {e}") from e
@@ -103,23 +243,44 @@ class ProjectManager:
             logging.error("Cannot save state: project_name is missing.")
             raise ValueError("Invalid state: project_name is missing.")
 
-        project_name_display = state["project_name"]
+        state["last_saved"] = datetime.now().isoformat()
+        _append_log(state, f"State saved at {state['last_saved']}")
+
+        main_state, images, script = state, {}, None
+        pre_production = state.get("pre_production")
+        if isinstance(pre_production, dict):
+            images = {key: pre_production.get(key, []) for key in IMAGE_SIDECAR_KEYS}
+            main_state = main_state | {"pre_production": {k: v for k, v in pre_production.items() if k not in IMAGE_SIDECAR_KEYS}}
+        script_state = state.get("script")
+        if isinstance(script_state, dict):
+            script = script_state.get("full_script_content", "")
+            main_state = main_state | {"script": {k: v for k, v in script_state.items() if k != "full_script_content"}}
+        self.save_project_bytes(state["project_name"], orjson.dumps(main_state, option=orjson.OPT_INDENT_2), images, script)
+        return state # Return the state including save time/log entry
+
+    def _write_atomic(self, path: str, payload: bytes):
+        # Write to a temp file and swap it in, so a crash mid-write never leaves a torn file;
+        # the temp name is per thread so concurrent saves of the same file don't share it
+        tmp_file = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_file, 'wb') as f:
+            f.write(payload)
+        os.replace(tmp_file, path)
+
+    def save_project_bytes(self, project_name_display: str, payload: bytes, images: dict[str, list] | None = None, script: str | None = None):
+        """Writes an already serialized project state (without image lists or full script) to its file, plus any
+        changed image lists given as {key: parts} and the full script if given; the caller stamps last_saved/log."""
         state_file = self._get_state_file_path(project_name_display)
 
         try:
-            project_dir = self._get_project_dir(project_name_display)
-            os.makedirs(project_dir, exist_ok=True)
-
-            state["last_saved"] = datetime.now().isoformat()
-            state["log"] = state.get("log", [])[-50:] # Keep log trimmed
-            state["log"].append(f"State saved at {state['last_saved']}")
-
-            with open(state_file, 'w') as f:
-                json.dump(state, f, indent=4)
+            os.makedirs(self._get_project_dir(project_name_display), exist_ok=True)
+            for key, parts in (images or {}).items():
+                self._write_image_parts(project_name_display, key, parts)
+            if script is not None:
+                self._write_atomic(self._get_script_file_path(project_name_display), script.encode('utf-8'))
+            self._write_atomic(state_file, payload)
+            self._invalidate_project_list()
 
             logging.info(f"Project '{project_name_display}' saved successfully.")
-            return state # Return the state including save time/log entry
-
         except Exception as e:
             logging.exception(f"Error saving project '{project_name_display}':")
             raise IOError(f"Error saving project '{project_name_display}': {e}") from e
@@ -136,11 +297,12 @@ class ProjectManager:
             raise FileExistsError(f"Project '{project_name_orig}' already exists.")
 
         # Create new state
-        new_state = copy.deepcopy(config.DEFAULT_PROJECT_STATE)
-        new_state["project_name"] = project_name_orig
-        new_state["cleaned_name"] = project_name_orig.replace(" ", "_").lower()
-        new_state["log"] = [f"Created new project '{project_name_orig}'."]
-        new_state["last_saved"] = None # Set on first save
+        # Defaults come from the model; last_saved stays None until the first save
+        new_state = ProjectState(
+            project_name=project_name_orig,
+            cleaned_name=project_name_orig.replace(" ", "_").lower(),
+            log=[f"Created new project '{project_name_orig}'."],
+        ).model_dump(mode="json")
 
         # Save the initial state
         saved_state = self.save_project(new_state)
@@ -159,6 +321,7 @@ class ProjectManager:
         try:
             import shutil
             shutil.rmtree(project_dir)
+            self._invalidate_project_list()
             logging.info(f"Project directory deleted: {project_dir}")
             return True
         except OSError as e:
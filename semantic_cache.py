@@ -0,0 +1,195 @@
+import os
+import json
+import threading
+import logging
+import config
+
+# Optional near-duplicate prompt cache. Needs `sentence-transformers`, and uses `faiss-cpu` for the
+# index when available (plain numpy cosine similarity otherwise); without sentence-transformers
+# (or with SEMANTIC_CACHE_ENABLED off) every lookup is simply a miss.
+
+
+class _NumpyIndex:
+    """Brute-force inner-product index with the subset of the faiss.IndexFlatIP API used here."""
+    def __init__(self, dimension: int):
+        import numpy as np
+        self._vectors = np.empty((0, dimension), dtype="float32")
+
+    @property
+    def ntotal(self) -> int:
+        return len(self._vectors)
+
+    def add(self, vectors):
+        import numpy as np
+        self._vectors = np.vstack([self._vectors, vectors.astype("float32")])
+
+    def search(self, vectors, k: int):
+        import numpy as np
+        scores = vectors @ self._vectors.T
+        ids = np.argsort(-scores, axis=1)[:, :k]
+        return np.take_along_axis(scores, ids, axis=1), ids
+
+    def reconstruct_n(self, start: int, n: int):
+        return self._vectors[start:start + n]
+
+    def reset(self):
+        self._vectors = self._vectors[:0]
+
+class CacheConfig:
+    def __init__(self, similarity_threshold: float = 0.92, model_name: str = "all-MiniLM-L6-v2", dimension: int = 384, cache_dir: str = None):
+        self.similarity_threshold = similarity_threshold
+        self.model_name = model_name
+        self.dimension = dimension
+        self.cache_dir = cache_dir or os.path.join(config.PROJECTS_BASE_DIR, ".cache", "semantic")
+
+
+class SemanticCache:
+    def __init__(self, cache_config: CacheConfig = None):
+        self.config = cache_config or CacheConfig()
+        self._lock = threading.Lock()
+        self._persist_lock = threading.Lock() # Keeps the two files' appends paired without holding up lookups
+        self._ready = False
+        self._disabled = not config.SEMANTIC_CACHE_ENABLED
+        self._model = None
+        self._index = None
+        self._entries = [] # Parallel to the index rows: {"scope": ..., "response": ...}
+
+    def _vectors_path(self) -> str:
+        # Raw float32 rows, so each add appends one row instead of re-saving the whole matrix
+        return os.path.join(self.config.cache_dir, "vectors.f32")
+
+    def _responses_path(self) -> str:
+        return os.path.join(self.config.cache_dir, "responses.jsonl")
+
+    def _ensure_ready(self) -> bool:
+        """Lazily loads the embedding model and FAISS index on first use."""
+        if self._ready or self._disabled:
+            return self._ready
+        try:
+            import numpy as np
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            logging.warning(f"Semantic cache disabled, missing dependency: {e}")
+            self._disabled = True
+            return False
+
+        self._model = SentenceTransformer(self.config.model_name)
+        try:
+            import faiss
+            self._index = faiss.IndexFlatIP(self.config.dimension)
+        except ImportError:
+            self._index = _NumpyIndex(self.config.dimension)
+
+        vectors, entries = self._read_persisted()
+        if entries:
+            self._index.add(vectors)
+            self._entries = entries
+        else:
+            self._remove_persisted() # Appends must start from two empty files to stay row-aligned
+
+        self._ready = True
+        return True
+
+    def _read_persisted(self):
+        """Returns the persisted (vectors, entries) if both files exist and agree on length, else (None, [])."""
+        import numpy as np
+        if os.path.exists(self._vectors_path()) and os.path.exists(self._responses_path()):
+            try:
+                vectors = np.fromfile(self._vectors_path(), dtype="float32").reshape(-1, self.config.dimension)
+                with open(self._responses_path(), 'r', encoding='utf-8') as f:
+                    entries = [json.loads(line) for line in f if line.strip()]
+                if len(entries) == len(vectors):
+                    return vectors.astype("float32"), entries
+                logging.warning("Semantic cache files out of sync, starting empty.")
+            except (OSError, ValueError) as e:
+                logging.warning(f"Could not restore semantic cache: {e}")
+        return None, []
+
+    def _remove_persisted(self):
+        with self._persist_lock:
+            for path in (self._vectors_path(), self._responses_path()):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def _embed(self, text: str):
+        # Unit-length vectors, so inner product is cosine similarity
+        return self._model.encode([text], convert_to_numpy=True, normalize_embeddings=True).astype("float32")
+
+    def lookup(self, prompt: str, scope: str):
+        """Returns the cached response of the most similar prompt in the same scope, or None."""
+        with self._lock:
+            if not self._ensure_ready() or self._index.ntotal == 0:
+                return None
+        vec = self._embed(prompt) # The slow part; done outside the lock so lookups and adds overlap
+        with self._lock:
+            scores, ids = self._index.search(vec, min(5, self._index.ntotal))
+            for score, idx in zip(scores[0], ids[0]):
+                if idx < 0 or score < self.config.similarity_threshold:
+                    break
+                entry = self._entries[idx]
+                if entry["scope"] == scope:
+                    return entry["response"]
+            return None
+
+    def add(self, prompt: str, scope: str, response: str):
+        """Stores a response and appends it, with its vector, to the persisted files."""
+        with self._lock:
+            if not self._ensure_ready():
+                return
+        vec = self._embed(prompt)
+        entry = {"scope": scope, "response": response}
+        with self._lock:
+            self._index.add(vec)
+            self._entries.append(entry)
+        try:
+            with self._persist_lock:
+                os.makedirs(self.config.cache_dir, exist_ok=True)
+                with open(self._vectors_path(), 'ab') as f:
+                    f.write(vec.tobytes())
+                with open(self._responses_path(), 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(entry) + "\n")
+        except OSError as e:
+            logging.warning(f"Could not persist semantic cache: {e}")
+
+    def invalidate(self, scope: str = None) -> int:
+        """Forgets the entries of one scope (all entries if None), on disk too. Returns how many were dropped."""
+        with self._lock:
+            if self._ready:
+                vectors, entries = self._index.reconstruct_n(0, self._index.ntotal), self._entries
+            elif scope is None:
+                # Nothing loaded yet and everything goes, so the persisted files can simply be removed
+                dropped = 0
+                if os.path.exists(self._responses_path()):
+                    with open(self._responses_path(), 'r', encoding='utf-8') as f:
+                        dropped = sum(1 for line in f if line.strip())
+                self._remove_persisted()
+                return dropped
+            else:
+                # Nothing loaded yet: filter the persisted files, or they would be served after the next lazy load
+                try:
+                    vectors, entries = self._read_persisted()
+                except ImportError: # Without numpy the cache can never have been filled
+                    return 0
+            keep = [i for i, entry in enumerate(entries) if scope is not None and entry["scope"] != scope]
+            dropped = len(entries) - len(keep)
+            if not dropped:
+                return 0
+            vectors = vectors[keep]
+            entries = [entries[i] for i in keep]
+            if self._ready:
+                self._index.reset()
+                if entries:
+                    self._index.add(vectors)
+                self._entries = entries
+            try:
+                with self._persist_lock:
+                    os.makedirs(self.config.cache_dir, exist_ok=True)
+                    vectors.astype("float32").tofile(self._vectors_path())
+                    with open(self._responses_path(), 'w', encoding='utf-8') as f:
+                        f.writelines(json.dumps(entry) + "\n" for entry in entries)
+            except OSError as e:
+                logging.warning(f"Could not persist semantic cache: {e}")
+            return dropped
+
+
+semantic_cache = SemanticCache()
\ No newline at end of file